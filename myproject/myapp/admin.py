@@ -1,7 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from . import deletion, search
 from .models import CustomUser, ChatGroup, GroupMessage, Message
 
+
+class IndexedContentSearchMixin:
+    """Match ``content`` through the full-text index (myapp.search) instead of ``LIKE '%term%'`` scans."""
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        try:
+            matched = search.matching_ids(self.model, search_term)
+        except search.SearchError:
+            return results, may_have_duplicates
+        return results | queryset.filter(id__in=matched), may_have_duplicates
+
 # Custom User Admin
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -25,6 +38,14 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+    # Deactivate now, purge in the background (myapp/deletion.py)
+    def delete_model(self, request, obj):
+        deletion.delete_account(obj, request.user)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            deletion.delete_account(user, request.user)
+
 # ChatGroup Admin
 class ChatGroupAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "admin", "created_at")
@@ -39,11 +60,22 @@ class ChatGroupAdmin(admin.ModelAdmin):
         ("Details", {"fields": ("members", "created_at")}),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).alive()
+
+    # Revoke access now, purge in the background (myapp/deletion.py)
+    def delete_model(self, request, obj):
+        deletion.delete_group(obj, request.user)
+
+    def delete_queryset(self, request, queryset):
+        for group in queryset:
+            deletion.delete_group(group, request.user)
+
 # GroupMessage Admin
-class GroupMessageAdmin(admin.ModelAdmin):
+class GroupMessageAdmin(IndexedContentSearchMixin, admin.ModelAdmin):
     list_display = ("id", "group", "sender", "short_content", "timestamp")
     list_filter = ("group", "sender", "timestamp")
-    search_fields = ("content", "sender__username", "group__name")
+    search_fields = ("sender__username", "group__name")  # content: see IndexedContentSearchMixin
     empty_value_display = "—"
     readonly_fields = ("id", "timestamp")
 
@@ -53,10 +85,10 @@ class GroupMessageAdmin(admin.ModelAdmin):
         return content[:20] + "..." if len(content) > 20 else content
 
 # Private Message Admin
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(IndexedContentSearchMixin, admin.ModelAdmin):
     list_display = ("id", "sender", "receiver", "short_content", "timestamp")
     list_filter = ("sender", "receiver", "timestamp")
-    search_fields = ("content", "sender__username", "receiver__username")
+    search_fields = ("sender__username", "receiver__username")  # content: see IndexedContentSearchMixin
     empty_value_display = "—"
     readonly_fields = ("id", "timestamp")
 
@@ -0,0 +1,271 @@
+"""
+Compressed, append-only archive of old messages.
+
+``Message`` and ``GroupMessage`` only need to hold recent history.
+``manage.py archive_messages`` runs ``archive()``. It writes every
+conversation's messages older than ``MESSAGE_ARCHIVE["AGE"]``, oldest
+first, to JSON-lines segment files under ``MESSAGE_ARCHIVE["DIR"]``::
+
+    group/3/2025-04/118-5731.jsonl.gz
+
+A segment holds at most ``BATCH_SIZE`` messages of one conversation and one
+month; a busy month gets several. Files are never rewritten. Each one has an
+``ArchiveSegment`` row, which is the index: conversation, month, time range
+and id range. Writing the file and its row and removing the archived rows
+from the hot table happen in one transaction per segment.
+
+Files are gzip, or zstd with ``COMPRESSION = "zstd"``, which needs the
+optional ``zstandard`` package.
+
+Segments store ids, not names. ``History`` reads them for
+``paginate_messages()``, so history cursors walk past the hot table into the
+archive without clients noticing. It fills in usernames with one query per
+segment and skips messages whose sender's (or receiver's) account was
+purged, the same messages myapp.deletion removes from the hot table.
+
+Archived messages keep their attachments. The hot rows are removed without
+``post_delete``, so the blob reference counts stay, and deleting a segment
+releases them (``segment_deleted()``). Archived messages drop out of the
+search index and cannot be deleted one by one.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from . import conversations, storage
+from .lru import LocalLRU
+from .models import ArchiveSegment, CustomUser, GroupMessage, Message
+from .raw_delete import delete_ids
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+DEFAULTS = {
+    "DIR": os.path.join(settings.BASE_DIR, "archive"),  # Segment files; outside MEDIA_ROOT
+    "AGE": 365 * 24 * 60 * 60,  # Seconds before a message is archived
+    "COMPRESSION": "gzip",      # "gzip" or "zstd"
+    "BATCH_SIZE": 5000,         # Messages per segment at most
+}
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+MODELS = {"dm": Message, "group": GroupMessage}
+# Stored per message: the fast serializers' columns without the joined user fields
+COLUMNS = {
+    "dm": ("id", "sender_id", "receiver_id", "content", "file", "original_name", "timestamp"),
+    "group": ("id", "group_id", "sender_id", "content", "file", "original_name", "timestamp"),
+}
+USER_FIELDS = ("username", "first_name", "last_name")
+
+_rows = LocalLRU(64, 5 * 60)  # Decoded rows of recently read segments (files never change)
+
+
+def get_setting(name):
+    return getattr(settings, "MESSAGE_ARCHIVE", {}).get(name, DEFAULTS[name])
+
+
+def _zstd():
+    if zstandard is None:
+        raise ImproperlyConfigured("zstd archive segments need the zstandard package.")
+    return zstandard
+
+
+def _compress(data, compression):
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data, compression):
+    if compression == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _path(relative):
+    return os.path.join(get_setting("DIR"), relative)
+
+
+def _position(row):
+    return row["timestamp"], row["id"]
+
+
+def _month(timestamp):
+    return timestamp.date().replace(day=1)
+
+
+def archive(batch_size=None, progress=None):
+    """
+    Move messages older than ``AGE`` into segments; returns
+    ``(segments, messages)`` written. ``progress(segment)`` is called after
+    each one.
+    """
+    batch_size = batch_size or get_setting("BATCH_SIZE")
+    cutoff = timezone.now() - timedelta(seconds=get_setting("AGE"))
+    segments = messages = 0
+    for kind, model in MODELS.items():
+        key = "group_id" if kind == "group" else "conversation"
+        old = model.objects.filter(timestamp__lt=cutoff)
+        if kind == "group":
+            old = old.visible()  # Soft-deleted rows are left to compaction
+        for value in old.order_by().values_list(key, flat=True).distinct():
+            conversation = conversations.group_id(value) if kind == "group" else conversations.dm_id(value)
+            while (segment := _archive_batch(kind, conversation, old.filter(**{key: value}), batch_size)) is not None:
+                segments += 1
+                messages += segment.message_count
+                if progress:
+                    progress(segment)
+    return segments, messages
+
+
+def _archive_batch(kind, conversation, queryset, batch_size):
+    """Archive the oldest messages of ``queryset`` from one month as a segment; None when there are none."""
+    path = None
+    try:
+        with transaction.atomic():
+            rows = list(queryset.select_for_update().order_by("timestamp", "id").values(*COLUMNS[kind])[:batch_size])
+            if not rows:
+                return None
+            month = _month(rows[0]["timestamp"])
+            rows = [row for row in rows if _month(row["timestamp"]) == month]
+            ids = [row["id"] for row in rows]
+
+            compression = get_setting("COMPRESSION")
+            path = f"{kind}/{conversation.partition(':')[2]}/{month:%Y-%m}/{rows[0]['id']}-{rows[-1]['id']}{EXTENSIONS[compression]}"
+            size = _write(path, rows, compression)
+            segment = ArchiveSegment.objects.create(
+                conversation=conversation, month=month, path=path, compression=compression,
+                first_timestamp=rows[0]["timestamp"], last_timestamp=rows[-1]["timestamp"],
+                min_id=min(ids), max_id=max(ids), message_count=len(rows), size=size,
+            )
+            # No post_delete: the messages still exist (no tombstones) and keep their blob references
+            if delete_ids(queryset.model, ids) != len(ids):
+                raise RuntimeError(f"Messages of {conversation} changed while they were archived; run again.")
+        return segment
+    except BaseException:
+        if path:
+            _remove(path)
+        raise
+
+
+def _write(relative, rows, compression):
+    """Write a segment file atomically; returns its size."""
+    lines = [
+        json.dumps({**row, "timestamp": row["timestamp"].isoformat()}, ensure_ascii=False, separators=(",", ":"))
+        for row in rows
+    ]
+    data = _compress("\n".join(lines).encode(), compression)
+    path = _path(relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    return len(data)
+
+
+def _remove(relative):
+    for path in (_path(relative), f"{_path(relative)}.tmp"):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def read(segment):
+    """The segment's messages as ``.values()``-style rows, oldest first."""
+    rows = _rows.get(segment.id)
+    if rows is None:
+        with open(_path(segment.path), "rb") as f:
+            data = _decompress(f.read(), segment.compression)
+        rows = [json.loads(line) for line in data.split(b"\n")]  # Not splitlines(): content may hold U+2028
+        for row in rows:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        _rows.set(segment.id, rows)
+    return rows
+
+
+def find(kind, message_id):
+    """An unsaved model instance for an archived message (for attachment downloads), or None."""
+    candidates = ArchiveSegment.objects.filter(
+        conversation__startswith=f"{kind}:", min_id__lte=message_id, max_id__gte=message_id
+    )
+    for segment in candidates:
+        for row in read(segment):
+            if row["id"] == message_id:
+                return MODELS[kind](**row)
+    return None
+
+
+def attachment_names():
+    """Attachment names of every archived message (``dedup_media`` counts them as references)."""
+    for segment in ArchiveSegment.objects.iterator():
+        for row in read(segment):
+            if row["file"]:
+                yield row["file"]
+
+
+def segment_deleted(segment):
+    """Release the segment's attachments now and remove its file once the deletion commits."""
+    try:
+        rows = read(segment)
+    except FileNotFoundError:
+        rows = []
+    _rows.delete(segment.id)
+    for row in rows:
+        storage.release(row["file"])
+    transaction.on_commit(lambda: _remove(segment.path))
+
+
+class History:
+    """
+    Archived messages of one conversation, as rows for the fast serializers.
+    Passed to ``paginate_messages(archived=...)``.
+    """
+
+    def __init__(self, kind, conversation):
+        self.kind = kind
+        self.conversation = conversation
+        self.roles = ("sender", "receiver") if kind == "dm" else ("sender",)
+
+    def older(self, position, limit):
+        """Up to ``limit`` messages before ``position`` (``(timestamp, id)``, or None for the newest), newest first."""
+        segments = ArchiveSegment.objects.filter(conversation=self.conversation)
+        if position is not None:
+            segments = segments.filter(first_timestamp__lte=position[0])
+        rows = []
+        for segment in segments.order_by("-last_timestamp", "-max_id").iterator(chunk_size=8):
+            matching = [row for row in reversed(read(segment)) if position is None or _position(row) < position]
+            rows += self._with_users(matching)
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+
+    def newer(self, position, limit):
+        """Up to ``limit`` messages after ``position``, oldest first."""
+        segments = ArchiveSegment.objects.filter(conversation=self.conversation, last_timestamp__gte=position[0])
+        rows = []
+        for segment in segments.order_by("first_timestamp", "min_id").iterator(chunk_size=8):
+            rows += self._with_users([row for row in read(segment) if _position(row) > position])
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+
+    def _with_users(self, rows):
+        """Copies of ``rows`` with ``sender__username`` etc., minus messages of purged accounts."""
+        ids = {row[f"{role}_id"] for row in rows for role in self.roles}
+        users = {user["id"]: user for user in CustomUser.objects.filter(id__in=ids).values("id", *USER_FIELDS)} if ids else {}
+        result = []
+        for row in rows:
+            people = {role: users.get(row[f"{role}_id"]) for role in self.roles}
+            if None in people.values():
+                continue
+            result.append({**row, **{f"{role}__{field}": user[field] for role, user in people.items() for field in USER_FIELDS}})
+        return result
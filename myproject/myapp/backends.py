@@ -4,6 +4,8 @@ import logging
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
 
+from . import user_cache
+
 logger = logging.getLogger(__name__)
 
 class EmailBackend(BaseBackend):
@@ -26,8 +28,4 @@ class EmailBackend(BaseBackend):
         return None
 
     def get_user(self, user_id):
-        UserModel = get_user_model()
-        try:
-            return UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
+        return user_cache.get_user(user_id)
@@ -0,0 +1,96 @@
+"""
+Soft deletion of group messages and compaction of what it leaves behind.
+
+``soft_delete()`` backs ``DELETE group_messages/<id>/``. A single
+conditional UPDATE sets ``is_deleted``/``deleted_at``, so a delete costs the
+same however large the group is. The same transaction:
+
+* writes the ``Tombstone`` that delta sync (myapp.sync) hands to
+  reconnecting clients;
+* takes the message out of the inbox entries;
+* queues a ``message.deleted`` outbox event for live sockets.
+
+Readers go through ``GroupMessage.objects.visible()``, which the partial
+indexes on ``is_deleted=False`` serve. The search triggers drop the row
+from the full-text index when the flag flips.
+
+``manage.py compact_messages`` runs ``compact()`` periodically. It removes
+rows soft-deleted more than ``RETENTION`` ago in batches of ``BATCH_SIZE``,
+one short transaction each. Their attachments are released through the
+usual reference counting, so unreferenced blobs are removed after each
+commit. It then removes tombstones older than ``TOMBSTONE_RETENTION``. A
+client that has not synced for longer than that may still show messages
+deleted before then and should reload its history.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import conversations, inbox, outbox
+from .models import GroupMessage, Tombstone
+
+DEFAULTS = {
+    "RETENTION": 7 * 24 * 60 * 60,             # Seconds a soft-deleted message is kept
+    "TOMBSTONE_RETENTION": 30 * 24 * 60 * 60,  # Seconds a tombstone is kept for syncing clients
+    "BATCH_SIZE": 500,                         # Rows per transaction
+}
+
+
+def get_setting(name):
+    return getattr(settings, "MESSAGE_COMPACTION", {}).get(name, DEFAULTS[name])
+
+
+def soft_delete(message):
+    """Hide a group message from everyone; False if it was already deleted."""
+    with transaction.atomic():
+        now = timezone.now()
+        # Conditional, so two racing deletes write one tombstone and one event
+        if not GroupMessage.objects.filter(pk=message.pk, is_deleted=False).update(is_deleted=True, deleted_at=now):
+            return False
+        message.is_deleted, message.deleted_at = True, now
+        Tombstone.objects.create(conversation=conversations.group_id(message.group_id), message_id=message.id)
+        inbox.group_message_removed(message)
+        outbox.message_deleted(message)
+    return True
+
+
+def _delete_in_batches(queryset, batch_size, pause):
+    """Delete ``queryset`` ``batch_size`` rows per transaction; yields each batch's row count."""
+    while True:
+        # Oldest first, along the deleted_at indexes (ordering by id would scan the table)
+        ids = list(queryset.order_by("deleted_at").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            queryset.model.objects.filter(id__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)  # Give other writers a turn at the database lock
+
+
+def compact(batch_size=None, pause=0, progress=None):
+    """
+    Physically delete old soft-deleted messages, then old tombstones;
+    returns ``(messages, tombstones)`` removed. ``progress(stage, count)``
+    is called after every batch.
+    """
+    batch_size = batch_size or get_setting("BATCH_SIZE")
+    now = timezone.now()
+    removed = {}
+    for stage, queryset in (
+        ("messages", GroupMessage.objects.filter(
+            is_deleted=True, deleted_at__lt=now - timedelta(seconds=get_setting("RETENTION"))
+        )),
+        ("tombstones", Tombstone.objects.filter(
+            deleted_at__lt=now - timedelta(seconds=get_setting("TOMBSTONE_RETENTION"))
+        )),
+    ):
+        removed[stage] = 0
+        for count in _delete_in_batches(queryset, batch_size, pause):
+            removed[stage] += count
+            if progress:
+                progress(stage, removed[stage])
+    return removed["messages"], removed["tombstones"]
@@ -1,9 +1,316 @@
+import asyncio
 import json
+import logging
+from collections import OrderedDict
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.layers import get_channel_layer
 
+from . import conversations, inbox, membership, presence, sync, user_cache, write_behind
+from .models import ChatGroup, GroupMessage, InboxEntry, Message
+from .realtime import user_group_name
+
+logger = logging.getLogger(__name__)
+
+ACK_FLUSH_DELAY = 1.0  # Seconds; all read acks inside this window cost a single write
+HEARTBEAT_INTERVAL = presence.PRESENCE_TTL / 3  # Open sockets keep their user online
+PRESENCE_CONTACTS = 50  # Recent DM partners a stream socket watches and notifies
+
+
+class AckCoalescer:
+    """Collects read acks of one connection and persists only the highest id per conversation."""
+
+    def __init__(self, user_id, on_flushed, delay=ACK_FLUSH_DELAY):
+        self.user_id = user_id
+        self.on_flushed = on_flushed
+        self.delay = delay
+        self.pending = {}
+        self._task = None
+
+    def add(self, target, message_id):
+        if message_id > self.pending.get(target, 0):
+            self.pending[target] = message_id
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        if pending:
+            results = await database_sync_to_async(mark_read_many)(self.user_id, pending)
+            await self.on_flushed(results)
+
+    async def close(self):
+        """Write whatever is still pending (used on disconnect)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def mark_read_many(user_id, acks):
+    """Apply coalesced acks: ``{(kind, target_id): message_id}`` -> ``{(kind, target_id): (last_read_id, unread_count)}``."""
+    results = {}
+    for (kind, target_id), message_id in acks.items():
+        state = inbox.mark_read(user_id, kind, target_id, message_id)
+        if state is not None:
+            results[(kind, target_id)] = state
+    return results
+
+
+def parse_ack(data):
+    """Highest message id acknowledged by an ``{"type": "ack", "message_id"/"message_ids": ...}`` frame."""
+    ids = data.get("message_ids") or [data.get("message_id")]
+    try:
+        return max(int(message_id) for message_id in ids)
+    except (TypeError, ValueError):
+        return None
+
+
+async def publish(channel_layer, stored, event):
+    """
+    Fan a stored message out to every socket that shows it: the legacy per-room
+    sockets and, for DMs, both users' stream sockets through their user group.
+    """
+    event = {**event, 'id': stored.id, 'sender_id': stored.sender_id, 'timestamp': stored.timestamp.isoformat()}
+    if isinstance(stored, GroupMessage):
+        await channel_layer.group_send(f'group_chat_{stored.group_id}', event)
+        return
+
+    event['conversation'] = conversations.dm_id(stored.conversation)
+    await channel_layer.group_send(f'chat_{stored.conversation}', event)
+    for user_id in {stored.sender_id, stored.receiver_id}:
+        await channel_layer.group_send(user_group_name(user_id), {**event, 'type': 'stream_message'})
+
+
+async def publish_typing(channel_layer, user_id, target, typers):
+    """One typing broadcast for a conversation; ``typers`` maps user ids to ``{"username", "typing"}``."""
+    kind, target_id = target
+    event = {
+        'type': 'typing_event',
+        'conversation': conversations.from_target(user_id, target),
+        'users': [{'user_id': typer_id, **state} for typer_id, state in typers.items()],
+    }
+    if kind == 'group':
+        await channel_layer.group_send(f'group_chat_{target_id}', event)
+        return
+
+    await channel_layer.group_send(f'chat_{Message.conversation_key(user_id, target_id)}', event)
+    for participant_id in (user_id, target_id):
+        await channel_layer.group_send(user_group_name(participant_id), {**event, 'type': 'stream_typing'})
+
+
+async def publish_presence(channel_layer, room, event_type, changes):
+    """One presence broadcast for a room; ``changes`` maps user ids to their online flag."""
+    await channel_layer.group_send(room, {
+        'type': event_type,
+        'users': [{'user_id': user_id, 'online': online} for user_id, online in changes.items()],
+    })
+
+
+def event_payload(event, *fields):
+    """Fields of a channel-layer event forwarded to the client (stored messages carry id/timestamp)."""
+    payload = {field: event[field] for field in fields}
+    payload.update({field: event[field] for field in ('id', 'sender_id', 'timestamp', 'event_id', 'file_url', 'file_name') if field in event})
+    return payload
+
+
+class ConversationMixin:
+    """
+    Persistence and read acknowledgements shared by the chat consumers.
+
+    Access is decided once in ``connect``: a socket that gets accepted is bound
+    to ``target`` for its whole lifetime, so messages need no per-frame checks.
+    Removals arrive as ``members.changed`` on the group's room; clears and
+    group deletions as ``membership.revoked`` on the user's own group.
+
+    Presence and typing live in myapp.presence (cache only) and every
+    broadcast goes through its debouncer, so a burst of keystrokes or
+    reconnects costs one ``group_send`` per conversation and interval.
+    """
+    target = None  # ('dm', other_user_id) or ('group', group_id), set by connect
+    acks = None
+    pending_deliveries = ()
+    presence_rooms = None  # [(channel-layer group, event type)] told when the user comes online or leaves
+    heartbeat_task = None
+    seen_events = None  # Outbox event ids already forwarded, oldest first
+    SEEN_EVENTS = 256
+    CLOSE_UNAUTHENTICATED = 4401
+    CLOSE_FORBIDDEN = 4403
+
+    def first_delivery(self, event):
+        """False for an outbox event this socket already forwarded (the relay delivers at least once)."""
+        event_id = event.get('event_id')
+        if event_id is None:
+            return True
+        if self.seen_events is None:
+            self.seen_events = OrderedDict()
+        if event_id in self.seen_events:
+            return False
+        self.seen_events[event_id] = None
+        if len(self.seen_events) > self.SEEN_EVENTS:
+            self.seen_events.popitem(last=False)
+        return True
+
+    async def accept(self, subprotocol=None, headers=None):
+        # Browsers drop sockets whose handshake does not echo a requested subprotocol
+        subprotocol = subprotocol or self.scope.get("jwt_subprotocol")
+        await super().accept(subprotocol=subprotocol, headers=headers)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+    async def start_conversation(self, target):
+        self.target = target
+        self.pending_deliveries = set()
+        self.acks = AckCoalescer(self.scope["user"].id, self.send_read_state)
+        self.user_group_name = user_group_name(self.scope["user"].id)
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept()
+
+    async def stop_conversation(self):
+        if self.target is None:
+            return  # Rejected at connect
+        # Let queued messages of this connection reach the DB and the room before leaving
+        if self.pending_deliveries:
+            await asyncio.gather(*self.pending_deliveries, return_exceptions=True)
+        await self.acks.close()
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def start_presence(self, rooms, watched_ids):
+        """Mark the user online (telling ``rooms`` if that is news) and send a snapshot of ``watched_ids``."""
+        user_id = self.scope["user"].id
+        self.presence_rooms = rooms
+        if await sync_to_async(presence.connected)(user_id):
+            await self.broadcast_presence(True)
+        self.heartbeat_task = asyncio.create_task(self.keep_alive())
+
+        online = await sync_to_async(presence.online)(watched_ids)
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'snapshot': True,
+            'users': [{'user_id': user_id, 'online': user_id in online} for user_id in sorted(watched_ids)],
+        }))
+
+    async def stop_presence(self):
+        if self.presence_rooms is None:
+            return
+        self.heartbeat_task.cancel()
+        if await sync_to_async(presence.disconnected)(self.scope["user"].id):
+            await self.broadcast_presence(False)
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await sync_to_async(presence.heartbeat)(self.scope["user"].id)
+
+    async def broadcast_presence(self, online):
+        for room, event_type in self.presence_rooms:
+            await presence.debouncer.signal(
+                ('presence', room), self.scope["user"].id, online,
+                partial(publish_presence, self.channel_layer, room, event_type),
+            )
+
+    async def signal_typing(self, target, typing=True):
+        user = self.scope["user"]
+        await presence.debouncer.signal(
+            ('typing', conversations.from_target(user.id, target)),
+            user.id, {'username': user.username, 'typing': bool(typing)},
+            partial(publish_typing, self.channel_layer, user.id, target),
+        )
+
+    async def typing_event(self, event):
+        await self.send(text_data=json.dumps(
+            {'type': 'typing', 'conversation': event['conversation'], 'users': event['users']}
+        ))
+
+    async def presence_event(self, event):
+        await self.send(text_data=json.dumps({'type': 'presence', 'users': event['users']}))
+
+    async def stream_typing(self, event):
+        """Typing copies for the user's stream sockets; room sockets get theirs via the room."""
+
+    async def stream_presence(self, event):
+        """Presence of DM partners for the user's stream sockets."""
+
+    async def membership_revoked(self, event):
+        """The user left (or was removed from) a group; drop the socket if it is this one."""
+        if self.target == ('group', event['group_id']):
+            await self.close(code=self.CLOSE_FORBIDDEN)
+
+    async def members_changed(self, event):
+        if self.target != ('group', event['group_id']):
+            return  # An added user's copy, sent to all of their sockets
+        if self.scope["user"].id in event['removed']:
+            await self.close(code=self.CLOSE_FORBIDDEN)
+            return
+        await self.send(text_data=json.dumps(
+            {'type': 'members', 'group_id': event['group_id'], 'added': event['added'], 'removed': event['removed']}
+        ))
+
+    async def stream_message(self, event):
+        """DM copies for the user's stream sockets; room sockets get theirs via the room."""
+
+    async def message_deleted(self, event):
+        """A group message was soft-deleted (see myapp.compaction); clients drop it."""
+        if not self.first_delivery(event):
+            return
+        await self.send(text_data=json.dumps({'type': 'deleted', **event_payload(event, 'group_id', 'message_type')}))
+
+    def handle_ack(self, data):
+        message_id = parse_ack(data)
+        if self.acks is not None and message_id is not None:
+            self.acks.add(self.target, message_id)
+
+    async def handle_sync(self, data):
+        """Answer a ``sync`` frame with what changed since the client's last seen ids (see myapp.sync)."""
+        try:
+            last_seen, tombstones_after, limit = sync.parse_request(data)
+        except sync.SyncError as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'error': str(e)}))
+            return
+        result = await database_sync_to_async(sync.sync)(self.scope["user"].id, last_seen, tombstones_after, limit)
+        await self.send(text_data=json.dumps({'type': 'sync', **result}))
+
+    async def send_read_state(self, results):
+        for (kind, target_id), (last_read_id, unread_count) in results.items():
+            await self.send(text_data=json.dumps({
+                'type': 'read_state',
+                'conversation': conversations.from_target(self.scope["user"].id, (kind, target_id)),
+                'message_type': 'private' if kind == 'dm' else 'group',
+                'last_read_id': last_read_id,
+                'unread_count': unread_count,
+            }))
+
+    async def persist(self, buffer, instance, event, client_id=None):
+        """Queue ``instance`` for the write-behind buffer; broadcast and ack once it is stored."""
+        pending = await buffer.submit(instance)
+        task = asyncio.create_task(self.deliver(pending, event, client_id))
+        self.pending_deliveries.add(task)
+        task.add_done_callback(self.pending_deliveries.discard)
+
+    async def deliver(self, pending, event, client_id):
+        try:
+            stored = await pending
+        except Exception:
+            await self.send(text_data=json.dumps({
+                'type': 'error', 'client_id': client_id, 'error': 'Message could not be saved.',
+            }))
+            return
+
+        await publish(self.channel_layer, stored, event)
+        await self.send(text_data=json.dumps({
+            'type': 'stored', 'client_id': client_id, 'id': stored.id, 'timestamp': stored.timestamp.isoformat(),
+        }))
+
+
+class ChatConsumer(ConversationMixin, AsyncWebsocketConsumer):
     async def connect(self):
         """Handles WebSocket connection for private chat"""
         self.username = self.scope["user"].username  # Get the authenticated user
@@ -11,42 +318,70 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.room_name}'
         self.channel_layer = get_channel_layer()
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=self.CLOSE_UNAUTHENTICATED)
+            return
+
+        # DM rooms are named after the conversation key ("<low id>_<high id>") and only its two users may join
+        participants = Message.parse_conversation_key(self.room_name)
+        if not participants or user.id not in participants:
+            await self.close(code=self.CLOSE_FORBIDDEN)
+            return
+
+        other_id = participants[1] if participants[0] == user.id else participants[0]
+        if not await is_live_user(other_id):  # Unknown or deleted accounts cannot be written to
+            await self.close(code=self.CLOSE_FORBIDDEN)
+            return
+        await self.start_conversation(('dm', other_id))
+        await self.start_presence(
+            [(self.room_group_name, 'presence_event'), (user_group_name(other_id), 'stream_presence')],
+            participants,
+        )
 
     async def disconnect(self, close_code):
         """Handles WebSocket disconnection"""
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.stop_presence()
+        await self.stop_conversation()
 
     async def receive(self, text_data):
         """Handles incoming messages from WebSocket"""
         try:
             data = json.loads(text_data)
+            if data.get('type') == 'ack':
+                self.handle_ack(data)
+                return
+            if data.get('type') == 'typing':
+                await self.signal_typing(self.target, data.get('typing', True))
+                return
+            if data.get('type') == 'sync':
+                await self.handle_sync(data)
+                return
+
             message = data.get('message', '')
 
             if message:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': message,
-                        'username': self.username,  # Get from session
-                        'message_type': 'private',  # Identify private message
-                    }
-                )
-        except Exception as e:
-            print(f"WebSocket error: {e}")  # Logs errors
+                event = {
+                    'type': 'chat_message',
+                    'message': message,
+                    'username': self.username,  # Get from session
+                    'message_type': 'private',  # Identify private message
+                }
+                instance = Message(sender_id=self.scope["user"].id, receiver_id=self.target[1], content=message)
+                await self.persist(write_behind.direct_messages, instance, event, data.get('client_id'))
+        except Exception:
+            logger.exception("WebSocket error")
 
     async def chat_message(self, event):
         """Sends private chat messages to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'username': event['username'],
-            'message_type': event['message_type'],  # Ensure type is sent
-        }))
+        if not self.first_delivery(event):
+            return
+        await self.send(text_data=json.dumps(
+            event_payload(event, 'message', 'username', 'message_type')  # Ensure type is sent
+        ))
 
 
-class GroupChatConsumer(AsyncWebsocketConsumer):
+class GroupChatConsumer(ConversationMixin, AsyncWebsocketConsumer):
     async def connect(self):
         """Handles WebSocket connection for group chat"""
         self.username = self.scope["user"].username
@@ -54,38 +389,278 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'group_chat_{self.group_id}'
         self.channel_layer = get_channel_layer()
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=self.CLOSE_UNAUTHENTICATED)
+            return
+
+        # Checked once here; the accepted socket stays bound to this group until revoked
+        if not await is_group_member(self.group_id, user.id):
+            await self.close(code=self.CLOSE_FORBIDDEN)
+            return
+
+        await self.start_conversation(('group', int(self.group_id)))
+        await self.start_presence(
+            [(self.room_group_name, 'presence_event')], await group_member_ids(self.group_id)
+        )
 
     async def disconnect(self, close_code):
         """Handles WebSocket disconnection"""
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.stop_presence()
+        await self.stop_conversation()
 
     async def receive(self, text_data):
         """Handles incoming messages from WebSocket"""
         try:
             data = json.loads(text_data)
+            if data.get('type') == 'ack':
+                self.handle_ack(data)
+                return
+            if data.get('type') == 'typing':
+                await self.signal_typing(self.target, data.get('typing', True))
+                return
+            if data.get('type') == 'sync':
+                await self.handle_sync(data)
+                return
+
             message = data.get('message', '')
 
             if message:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'group_chat_message',
-                        'message': message,
-                        'username': self.username,
-                        'group_id': self.group_id,  # Ensure group ID is sent
-                        'message_type': 'group',  # Identify group message
-                    }
-                )
-        except Exception as e:
-            print(f"WebSocket error: {e}")  # Logs errors
+                event = {
+                    'type': 'group_chat_message',
+                    'message': message,
+                    'username': self.username,
+                    'group_id': self.group_id,  # Ensure group ID is sent
+                    'message_type': 'group',  # Identify group message
+                }
+                # Membership was checked at connect, which is what GroupMessage.save would verify
+                instance = GroupMessage(group_id=self.target[1], sender_id=self.scope["user"].id, content=message)
+                await self.persist(write_behind.group_messages, instance, event, data.get('client_id'))
+        except Exception:
+            logger.exception("WebSocket error")
 
     async def group_chat_message(self, event):
         """Sends group chat messages to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'username': event['username'],
-            'group_id': event['group_id'],
-            'message_type': event['message_type'],  # Ensure type is sent
-        }))
+        if not self.first_delivery(event):
+            return
+        await self.send(text_data=json.dumps(
+            event_payload(event, 'message', 'username', 'group_id', 'message_type')  # Ensure type is sent
+        ))
+
+
+class StreamConsumer(ConversationMixin, AsyncWebsocketConsumer):
+    """
+    One socket per user for all of their conversations (``ws/stream/``).
+
+    Frames carry a conversation id (``"dm:<key>"`` / ``"group:<id>"``, see
+    myapp.conversations). Clients send ``{"action": "send" | "ack" | "typing" |
+    "presence" | "subscribe" | "unsubscribe", "conversation": ...}`` and
+    ``{"action": "sync", "conversations": {...}}`` after a reconnect. The
+    server sends ``message``, ``stored``, ``read_state``, ``typing``,
+    ``presence``, ``deleted``, ``sync``, ``subscribed`` and ``unsubscribed`` frames. Group traffic comes through one channel-layer
+    group per ChatGroup. All DMs share the user's own group, so a user with
+    many conversations holds one socket and 1 + <groups> subscriptions.
+    """
+
+    async def connect(self):
+        self.channel_layer = get_channel_layer()
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=self.CLOSE_UNAUTHENTICATED)
+            return
+
+        self.username = user.username
+        self.user_group_name = user_group_name(user.id)
+        self.pending_deliveries = set()
+        self.acks = AckCoalescer(user.id, self.send_read_state)
+        self.member_groups = set(await user_group_ids(user.id))
+        self.subscribed_groups = set()
+        self.muted_dms = set()
+
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        for group_id in self.member_groups:
+            await self.channel_layer.group_add(f'group_chat_{group_id}', self.channel_name)
+        self.subscribed_groups = set(self.member_groups)
+        await self.accept()
+        await self.send_frame('subscribed', conversations=[conversations.group_id(g) for g in sorted(self.member_groups)], direct=True)
+
+        contacts = await recent_contact_ids(user.id, PRESENCE_CONTACTS)
+        await self.start_presence(
+            [(user_group_name(contact_id), 'stream_presence') for contact_id in contacts]
+            + [(f'group_chat_{group_id}', 'presence_event') for group_id in sorted(self.member_groups)],
+            contacts,
+        )
+
+    async def disconnect(self, close_code):
+        if self.acks is None:
+            return  # Rejected at connect
+        await self.stop_presence()
+        if self.pending_deliveries:
+            await asyncio.gather(*self.pending_deliveries, return_exceptions=True)
+        await self.acks.close()
+        for group_id in self.subscribed_groups:
+            await self.channel_layer.group_discard(f'group_chat_{group_id}', self.channel_name)
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def send_frame(self, frame_type, **fields):
+        await self.send(text_data=json.dumps({'type': frame_type, **fields}))
+
+    async def resolve(self, conversation_id):
+        """
+        Target for a conversation id: groups use the membership known to this
+        socket (no DB access), DMs check the counterpart through the user cache.
+        """
+        kind, _, value = str(conversation_id).partition(':')
+        if kind == 'group':
+            return ('group', int(value)) if value.isdigit() and int(value) in self.member_groups else None
+        return await database_sync_to_async(conversations.to_target)(self.scope["user"].id, conversation_id)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            action = data.get('action')
+            if action == 'sync':
+                await self.handle_sync(data)  # Spans conversations; access is checked per entry
+                return
+
+            conversation = data.get('conversation')
+            target = await self.resolve(conversation)
+            if target is None:
+                await self.send_frame('error', conversation=conversation, client_id=data.get('client_id'), error='Unknown conversation.')
+                return
+
+            if action == 'send':
+                await self.send_message(target, data)
+            elif action == 'ack':
+                message_id = parse_ack(data)
+                if message_id is not None:
+                    self.acks.add(target, message_id)
+            elif action == 'typing':
+                await self.signal_typing(target, data.get('typing', True))
+            elif action == 'presence':
+                await self.send_presence(target, conversation)
+            elif action == 'subscribe':
+                await self.subscribe(target, conversation)
+            elif action == 'unsubscribe':
+                await self.unsubscribe(target, conversation)
+            else:
+                await self.send_frame('error', conversation=conversation, error=f'Unknown action {action!r}.')
+        except Exception:
+            logger.exception("WebSocket error")
+
+    async def send_message(self, target, data):
+        message = data.get('message', '')
+        if not message:
+            return
+        user_id = self.scope["user"].id
+        kind, target_id = target
+        if kind == 'dm':
+            event = {'type': 'chat_message', 'message': message, 'username': self.username, 'message_type': 'private'}
+            instance = Message(sender_id=user_id, receiver_id=target_id, content=message)
+            await self.persist(write_behind.direct_messages, instance, event, data.get('client_id'))
+        else:
+            event = {'type': 'group_chat_message', 'message': message, 'username': self.username,
+                     'group_id': target_id, 'message_type': 'group'}
+            instance = GroupMessage(group_id=target_id, sender_id=user_id, content=message)
+            await self.persist(write_behind.group_messages, instance, event, data.get('client_id'))
+
+    async def send_presence(self, target, conversation):
+        kind, target_id = target
+        user_ids = [self.scope["user"].id, target_id] if kind == 'dm' else await group_member_ids(target_id)
+        online = await sync_to_async(presence.online)(user_ids)
+        await self.send_frame('presence', conversation=conversation, snapshot=True,
+                              users=[{'user_id': user_id, 'online': user_id in online} for user_id in sorted(user_ids)])
+
+    async def subscribe(self, target, conversation):
+        kind, target_id = target
+        if kind == 'group' and target_id not in self.subscribed_groups:
+            # Removals reach only subscribed sockets (members.changed goes to the room), so check again
+            if not await is_group_member(target_id, self.scope["user"].id):
+                self.member_groups.discard(target_id)
+                await self.send_frame('error', conversation=conversation, error='Unknown conversation.')
+                return
+            await self.channel_layer.group_add(f'group_chat_{target_id}', self.channel_name)
+            self.subscribed_groups.add(target_id)
+        self.muted_dms.discard(conversation)
+        await self.send_frame('subscribed', conversations=[conversation])
+
+    async def unsubscribe(self, target, conversation, reason=None):
+        kind, target_id = target
+        if kind == 'group':
+            if target_id in self.subscribed_groups:
+                await self.channel_layer.group_discard(f'group_chat_{target_id}', self.channel_name)
+                self.subscribed_groups.discard(target_id)
+        else:
+            self.muted_dms.add(conversation)
+        await self.send_frame('unsubscribed', conversations=[conversation], reason=reason)
+
+    async def group_chat_message(self, event):
+        group_id = int(event['group_id'])
+        if group_id in self.subscribed_groups and self.first_delivery(event):
+            await self.send_frame('message', conversation=conversations.group_id(group_id),
+                                  **event_payload(event, 'message', 'username', 'group_id', 'message_type'))
+
+    async def stream_message(self, event):
+        if event['conversation'] not in self.muted_dms and self.first_delivery(event):
+            await self.send_frame('message', conversation=event['conversation'],
+                                  **event_payload(event, 'message', 'username', 'message_type'))
+
+    async def typing_event(self, event):
+        await self.send_frame('typing', conversation=event['conversation'], users=event['users'])
+
+    async def stream_typing(self, event):
+        if event['conversation'] not in self.muted_dms:
+            await self.typing_event(event)
+
+    async def presence_event(self, event):
+        await self.send_frame('presence', users=event['users'])
+
+    async def stream_presence(self, event):
+        await self.presence_event(event)
+
+    async def membership_revoked(self, event):
+        group_id = event['group_id']
+        self.member_groups.discard(group_id)
+        await self.unsubscribe(('group', group_id), conversations.group_id(group_id), reason='revoked')
+
+    async def membership_granted(self, event):
+        """Called for ``members.changed`` naming this user as added."""
+        group_id = event['group_id']
+        self.member_groups.add(group_id)
+        await self.subscribe(('group', group_id), conversations.group_id(group_id))
+
+    async def message_deleted(self, event):
+        group_id = int(event['group_id'])
+        if group_id in self.subscribed_groups and self.first_delivery(event):
+            await self.send_frame('deleted', conversation=conversations.group_id(group_id), message_ids=[event['id']])
+
+    async def members_changed(self, event):
+        user_id = self.scope["user"].id
+        if user_id in event['removed']:
+            await self.membership_revoked(event)
+            return
+        if user_id in event['added'] and event['group_id'] not in self.member_groups:
+            await self.membership_granted(event)
+        if event['group_id'] in self.subscribed_groups:
+            await self.send_frame('members', conversation=conversations.group_id(event['group_id']),
+                                  added=event['added'], removed=event['removed'])
+
+
+@database_sync_to_async
+def user_group_ids(user_id):
+    return list(ChatGroup.members.through.objects.filter(customuser_id=user_id).values_list('chatgroup_id', flat=True))
+
+
+@database_sync_to_async
+def recent_contact_ids(user_id, limit):
+    """The users of the ``limit`` most recently active DMs (inbox order)."""
+    return list(
+        InboxEntry.objects.filter(owner_id=user_id, group__isnull=True, last_message_at__isnull=False)
+        .order_by('-last_message_at').values_list('counterpart_id', flat=True)[:limit]
+    )
+
+
+# Cached lookups; only touch the DB (hence the thread hop) after an invalidation
+is_group_member = database_sync_to_async(membership.is_member)
+group_member_ids = database_sync_to_async(membership.member_ids)
+is_live_user = database_sync_to_async(user_cache.is_live)
@@ -0,0 +1,45 @@
+"""
+String ids naming a conversation in multi-conversation APIs (stream socket, sync).
+
+``"dm:<low id>_<high id>"`` is a private conversation (the suffix is
+``Message.conversation``) and ``"group:<id>"`` a ``ChatGroup``. Internally the
+consumers and the inbox work with per-user targets: ``("dm", other_user_id)``
+or ``("group", group_id)``.
+"""
+from .membership import is_member
+from .models import Message
+from .user_cache import is_live
+
+
+def dm_id(conversation_key):
+    return f"dm:{conversation_key}"
+
+
+def group_id(chat_group_id):
+    return f"group:{chat_group_id}"
+
+
+def to_target(user_id, conversation_id):
+    """
+    Resolve a conversation id to the user's target, or ``None`` if it is
+    malformed, the user has no access to it, or the DM counterpart does not
+    exist or was deleted (hits the DB only on a membership or user cache
+    miss).
+    """
+    kind, _, value = str(conversation_id).partition(":")
+    if kind == "dm":
+        participants = Message.parse_conversation_key(value)
+        if not participants or user_id not in participants:
+            return None
+        other_id = participants[1] if participants[0] == user_id else participants[0]
+        return ("dm", other_id) if is_live(other_id) else None
+    if kind == "group" and value.isdigit():
+        return ("group", int(value)) if is_member(value, user_id) else None
+    return None
+
+
+def from_target(user_id, target):
+    kind, target_id = target
+    if kind == "dm":
+        return dm_id(Message.conversation_key(user_id, target_id))
+    return group_id(target_id)
@@ -0,0 +1,214 @@
+"""
+Deleting groups and accounts without one giant transaction.
+
+``delete_group()`` and ``delete_account()`` only do what has to happen at
+once, in one short transaction:
+
+* the target is marked ``deleted_at``, and its unique name (or email and
+  username) is freed;
+* members lose access through the usual ``members.clear()`` signals
+  (inbox entries, membership cache, live sockets);
+* a ``DeletionJob`` is queued.
+
+``manage.py purge_deleted`` then runs ``purge()``. It deletes the
+messages and other rows in batches of ``BATCH_SIZE``, one short
+transaction each, so SQLite is never locked for long. Message batches are
+deleted with one DELETE and no per-row signals: their blob references are
+released per distinct file, unreferenced files are removed after each
+commit, and tombstones and inbox fixes are written in bulk, and only where
+someone can still see the conversation. The group or user row itself is
+deleted last. The job records its stage and row counts as it
+goes, and a purge that fails or is interrupted resumes where it stopped
+when run again.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import conversations, inbox, storage, thumbnails
+from .models import ArchiveSegment, ChatGroup, CustomUser, DeletionJob, GroupMessage, InboxEntry, Message, Tombstone
+from .raw_delete import delete_ids
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+DEFAULT_IMAGES = {"default.jpg", "default_group.jpg"}
+
+
+def delete_group(group, requested_by=None):
+    """Mark ``group`` deleted and queue its purge; returns the ``DeletionJob``."""
+    if group.deleted_at is not None:
+        return _existing_job(DeletionJob.KIND_GROUP, group.id)
+    with transaction.atomic():
+        group.name = f"deleted-{group.id}-{group.name}"[:255]  # Free the name for a new group
+        group.deleted_at = timezone.now()
+        group.save(update_fields=["name", "deleted_at", "updated_at"])
+        group.members.clear()
+        return DeletionJob.objects.create(
+            kind=DeletionJob.KIND_GROUP, target_id=group.id, requested_by=requested_by,
+            total_rows=GroupMessage.objects.filter(group_id=group.id).count(),
+        )
+
+
+def delete_account(user, requested_by=None):
+    """
+    Deactivate ``user`` and queue the purge of their messages; returns the
+    ``DeletionJob``. Groups they administer pass to their longest-standing
+    member, and groups without one are deleted too.
+    """
+    if user.deleted_at is not None:
+        return _existing_job(DeletionJob.KIND_USER, user.id)
+    with transaction.atomic():
+        for group in ChatGroup.objects.alive().filter(admin=user):
+            successor_id = (
+                ChatGroup.members.through.objects.filter(chatgroup_id=group.id).exclude(customuser_id=user.id)
+                .order_by("id").values_list("customuser_id", flat=True).first()
+            )
+            if successor_id is None:
+                delete_group(group, requested_by)
+            else:
+                group.admin_id = successor_id
+                group.save(update_fields=["admin", "updated_at"])
+        user.chat_groups.clear()
+        InboxEntry.objects.filter(counterpart=user).delete()  # Drop the DM from everyone's inbox right away
+
+        user.is_active = False
+        user.deleted_at = timezone.now()
+        # Free the email and username for new signups
+        user.email = f"deleted-{user.id}@deleted.invalid"
+        user.username = f"deleted-{user.id}"
+        user.set_unusable_password()
+        user.save(update_fields=["is_active", "deleted_at", "email", "username", "password"])
+        return DeletionJob.objects.create(
+            kind=DeletionJob.KIND_USER, target_id=user.id, requested_by=requested_by,
+            total_rows=Message.objects.filter(Q(sender=user) | Q(receiver=user)).count()
+            + GroupMessage.objects.filter(sender=user).count(),
+        )
+
+
+def _existing_job(kind, target_id):
+    job = DeletionJob.objects.filter(kind=kind, target_id=target_id).order_by("-id").first()
+    return job or DeletionJob.objects.create(kind=kind, target_id=target_id)
+
+
+def steps(job):
+    """``[(stage, queryset)]`` to empty in order before the target row is deleted."""
+    if job.kind == DeletionJob.KIND_GROUP:
+        return [
+            ("group messages", GroupMessage.objects.filter(group_id=job.target_id)),
+            ("archive segments", ArchiveSegment.objects.filter(conversation=conversations.group_id(job.target_id))),
+            ("inbox entries", InboxEntry.objects.filter(group_id=job.target_id)),
+            # Left by earlier deletions and compaction; nobody can sync this group any more
+            ("tombstones", Tombstone.objects.filter(conversation=conversations.group_id(job.target_id))),
+        ]
+    return [
+        ("direct messages", Message.objects.filter(Q(sender_id=job.target_id) | Q(receiver_id=job.target_id))),
+        ("group messages", GroupMessage.objects.filter(sender_id=job.target_id)),
+        # DMs with the user; their group messages in archived segments are skipped by myapp.archive.History
+        ("archive segments", ArchiveSegment.objects.filter(
+            Q(conversation__startswith=f"dm:{job.target_id}_") | Q(conversation__startswith="dm:", conversation__endswith=f"_{job.target_id}")
+        )),
+        ("inbox entries", InboxEntry.objects.filter(Q(owner_id=job.target_id) | Q(counterpart_id=job.target_id))),
+    ]
+
+
+def purge(job, batch_size=BATCH_SIZE, pause=0, progress=None):
+    """Run ``job`` to completion; ``progress(job)`` is called after every batch."""
+    job.status = DeletionJob.STATUS_RUNNING
+    job.error = ""
+    job.save(update_fields=["status", "error", "updated_at"])
+    try:
+        for stage, queryset in steps(job):
+            job.stage = stage
+            while True:
+                ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    batch = queryset.model.objects.filter(id__in=ids)
+                    # Only message rows count towards progress; the other steps are small
+                    if stage.endswith("messages"):
+                        _delete_messages(job, batch)
+                        job.deleted_rows += len(ids)
+                    else:
+                        batch.delete()
+                    job.save(update_fields=["stage", "deleted_rows", "updated_at"])
+                if progress:
+                    progress(job)
+                if pause:
+                    time.sleep(pause)  # Give other writers a turn at the database lock
+
+        job.stage = "finishing"
+        with transaction.atomic():
+            image = _delete_target(job)
+            job.status = DeletionJob.STATUS_DONE
+            job.finished_at = timezone.now()
+            job.save(update_fields=["stage", "status", "finished_at", "updated_at"])
+            if image:
+                transaction.on_commit(lambda: _delete_image(image))
+        if progress:
+            progress(job)
+    except Exception as e:
+        logger.exception(f"Deletion job {job.id} failed")
+        job.status = DeletionJob.STATUS_FAILED
+        job.error = str(e)
+        job.save(update_fields=["status", "error", "updated_at"])
+        raise
+    return job
+
+
+def _delete_messages(job, batch):
+    """
+    Delete a batch of ``Message`` or ``GroupMessage`` rows with one DELETE
+    instead of ``post_delete`` receivers per row (see the module docstring).
+    """
+    group_messages = batch.model is GroupMessage
+    rows = list(batch.values("id", "file", *(("group_id", "is_deleted") if group_messages else ("conversation",))))
+    delete_ids(batch.model, [row["id"] for row in rows])
+    for name, count in Counter(row["file"] for row in rows if row["file"]).items():
+        storage.release(name, count)
+
+    if job.kind == DeletionJob.KIND_GROUP:
+        return  # Its inbox entries are gone with its members and its tombstones go in a later stage
+    if not group_messages:
+        # The counterparts' DM entries went in delete_account(), the user's own go in a later stage
+        Tombstone.objects.bulk_create(
+            Tombstone(conversation=conversations.dm_id(row["conversation"]), message_id=row["id"]) for row in rows
+        )
+        return
+    # Soft-deleted rows already have their tombstone and were taken out of the inbox
+    rows = [row for row in rows if not row["is_deleted"]]
+    Tombstone.objects.bulk_create(
+        Tombstone(conversation=conversations.group_id(row["group_id"]), message_id=row["id"]) for row in rows
+    )
+    by_group = {}
+    for row in rows:
+        by_group.setdefault(row["group_id"], []).append(row["id"])
+    for group_id, message_ids in by_group.items():
+        inbox.group_messages_removed(group_id, message_ids)
+
+
+def _delete_target(job):
+    """Delete the group or user row; returns its image name if that should go too."""
+    model, field = (ChatGroup, "icon") if job.kind == DeletionJob.KIND_GROUP else (CustomUser, "profile_picture")
+    target = model.objects.filter(pk=job.target_id).first()
+    if target is None:
+        return None
+    if job.kind == DeletionJob.KIND_USER and ChatGroup.objects.filter(admin_id=job.target_id).exists():
+        # The user row would cascade into them in one transaction; their own jobs run first
+        raise RuntimeError("Groups administered by this user are still waiting for their deletion jobs.")
+    image = getattr(target, field).name
+    target.delete()
+    return image if image and image not in DEFAULT_IMAGES else None
+
+
+def _delete_image(name):
+    if ChatGroup.objects.filter(icon=name).exists() or CustomUser.objects.filter(profile_picture=name).exists():
+        return  # Shared with another row
+    default_storage.delete(name)
+    thumbnails.delete(name)
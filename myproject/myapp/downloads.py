@@ -0,0 +1,177 @@
+"""
+Access-checked attachment downloads.
+
+``serve()`` answers conditional requests (``If-None-Match``,
+``If-Modified-Since``) and single byte ranges itself. It then hands the
+bytes off according to ``ATTACHMENT_DOWNLOADS["MODE"]``:
+
+* ``"stream"``: a ``FileResponse`` over the open file. Python never holds
+  the whole file, but it does copy every byte: this project is served over
+  ASGI (daphne, uvicorn), where Django reads the file in small blocks on a
+  worker thread and sends each one as an ASGI message. Only WSGI servers
+  with ``wsgi.file_wrapper`` (gunicorn, uWSGI) turn it into sendfile(2).
+* ``"x-accel-redirect"``: nginx serves ``INTERNAL_PREFIX + name`` from an
+  ``internal`` location and handles ranges itself.
+* ``"x-sendfile"``: Apache mod_xsendfile or lighttpd serve the absolute path.
+
+The last two are the zero-copy ones, and what production should use
+(``ATTACHMENT_DOWNLOAD_MODE`` in the environment); ``"stream"`` is the
+default so that runserver and daphne work without a proxy.
+
+Browsers cannot put a JWT on ``<img src>``, so serializers hand out
+``download_url``s that carry a short-lived signed token. Access is checked
+again on every request, so revoked members lose access at once.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+from .membership import is_member
+from .models import GroupMessage, Message
+from .storage import BLOB_PREFIX
+
+DEFAULTS = {
+    "MODE": "stream",                        # "stream", "x-accel-redirect" or "x-sendfile"
+    "INTERNAL_PREFIX": "/protected-media/",  # nginx internal location mapped to MEDIA_ROOT
+    "TOKEN_TTL": 60 * 60,                    # Seconds a signed download URL stays valid
+}
+KINDS = {"dm": Message, "group": GroupMessage}
+TOKEN_SALT = "myapp.downloads"
+
+
+def get_setting(name):
+    return getattr(settings, "ATTACHMENT_DOWNLOADS", {}).get(name, DEFAULTS[name])
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class RangeFile:
+    """Exposes ``length`` bytes of an open file from its current position (and its fd for sendfile)."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single-range header; ``None`` to serve the whole file."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None  # Multiple or malformed ranges: a full response is allowed
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1  # Suffix range: the last N bytes
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def signed_url(kind, message_id, user_id, request=None):
+    token = signing.dumps([kind, message_id, user_id], salt=TOKEN_SALT, compress=True)
+    url = f"{reverse('download_attachment', args=[kind, message_id])}?token={token}"
+    return request.build_absolute_uri(url) if request else url
+
+
+def token_user_id(token, kind, message_id):
+    """The user a download token was issued to, if it is valid for this attachment."""
+    try:
+        token_kind, token_message_id, user_id = signing.loads(token, salt=TOKEN_SALT, max_age=get_setting("TOKEN_TTL"))
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    return user_id if (token_kind, token_message_id) == (kind, message_id) else None
+
+
+def can_access(user_id, message):
+    if isinstance(message, GroupMessage):
+        return is_member(message.group_id, user_id)
+    return user_id in (message.sender_id, message.receiver_id)
+
+
+def _etag(name, stat):
+    if name.startswith(BLOB_PREFIX):
+        return f'"{os.path.splitext(os.path.basename(name))[0]}"'  # Content hash
+    return f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def serve(request, field_file, filename=None):
+    """Response for ``field_file``, offered under ``filename`` (default: its stored basename)."""
+    name = field_file.name
+    path = field_file.storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("File not found.")
+
+    etag = _etag(name, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Accept-Ranges": "bytes",
+        # Blobs never change under their name
+        "Cache-Control": "private, max-age=31536000, immutable" if name.startswith(BLOB_PREFIX) else "private, no-cache",
+    }
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    mode = get_setting("MODE")
+    if mode in ("x-accel-redirect", "x-sendfile"):
+        response = HttpResponse(content_type=content_type)
+        if mode == "x-accel-redirect":
+            response["X-Accel-Redirect"] = quote(get_setting("INTERNAL_PREFIX") + name)
+        else:
+            response["X-Sendfile"] = path
+    else:
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        if request.headers.get("Range") and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(request.headers["Range"], stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+
+        file = open(path, "rb")
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            file.seek(start)
+            response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = end - start + 1
+
+    response["Content-Disposition"] = content_disposition_header(False, filename or os.path.basename(name))
+    for header, value in headers.items():
+        response[header] = value
+    return response
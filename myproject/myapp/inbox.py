@@ -0,0 +1,285 @@
+"""
+Denormalized per-user conversation summaries (``InboxEntry``).
+
+Every user has one row per DM counterpart and one per group they belong to,
+pointing at the newest message of that conversation. Rows are updated from
+the signal handlers in ``myapp.signals`` so listing a user's conversations
+ordered by recency is a single indexed query.
+
+Entries also carry the owner's read high-watermark (``last_read_id``) and an
+``unread_count`` that is adjusted incrementally as messages arrive, are
+deleted or get acknowledged, so nobody has to COUNT(*) a history.
+
+``auto_now`` does not apply to ``QuerySet.update()``, so every update here
+sets ``updated_at`` itself; cached listings (myapp.listings) rely on it.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Count, F, Max, OuterRef, PositiveIntegerField, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ChatGroup, GroupMessage, InboxEntry, Message
+
+PREVIEW_LENGTH = 100
+MARK_READ_ATTEMPTS = 5  # Races with other acks/messages before giving up
+
+
+def preview_text(message):
+    return (message.content or "File Attached")[:PREVIEW_LENGTH]
+
+
+def _summary_fields(message):
+    if message is None:
+        return {"last_message_id": None, "last_message_preview": "", "last_message_at": None, "last_sender_id": None}
+    return {
+        "last_message_id": message.id,
+        "last_message_preview": preview_text(message),
+        "last_message_at": message.timestamp,
+        "last_sender_id": message.sender_id,
+    }
+
+
+def _is_older_than(message):
+    """Entries that ``message`` should replace (never move an entry backwards)."""
+    return Q(last_message_id__isnull=True) | Q(last_message_id__lt=message.id)
+
+
+def serialize_entry(entry):
+    """``last_message`` payload used by the user and group listings."""
+    if entry is None or entry.last_message_at is None:
+        return None
+    return {
+        "text": entry.last_message_preview,
+        "timestamp": entry.last_message_at.strftime("%I:%M %p"),
+    }
+
+
+def _read_state_after(owner_id, messages):
+    """
+    Read-state changes for ``owner_id`` once ``messages`` (sorted by id) are added.
+
+    Returns the UPDATE kwargs and the values to use when the entry has to be created.
+    Posting marks everything up to one's own last message as read.
+    """
+    own = [message.id for message in messages if message.sender_id == owner_id]
+    if own:
+        unread = sum(1 for message in messages if message.id > own[-1] and message.sender_id != owner_id)
+        state = {"last_read_id": own[-1], "unread_count": unread}
+        return state, state
+    return {"unread_count": F("unread_count") + len(messages)}, {"unread_count": len(messages)}
+
+
+def _by_key(messages, key):
+    batches = {}
+    for message in sorted(messages, key=lambda m: m.id):
+        batches.setdefault(key(message), []).append(message)
+    return batches
+
+
+def record_direct_messages(messages):
+    """Point the participants' DM entries at newly created ``Message`` rows (one batch per conversation)."""
+    for batch in _by_key(messages, lambda m: m.conversation).values():
+        latest = batch[-1]
+        fields = _summary_fields(latest)
+        participants = {(latest.sender_id, latest.receiver_id), (latest.receiver_id, latest.sender_id)}
+        for owner_id, counterpart_id in participants:
+            read_state, initial = _read_state_after(owner_id, batch)
+            updated = InboxEntry.objects.filter(
+                _is_older_than(latest), owner_id=owner_id, counterpart_id=counterpart_id, group__isnull=True
+            ).update(**fields, **read_state, updated_at=timezone.now())
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        InboxEntry.objects.create(owner_id=owner_id, counterpart_id=counterpart_id, **fields, **initial)
+                except IntegrityError:
+                    pass  # The entry exists and already points at a newer message
+
+
+def record_group_messages(messages):
+    """Point every member's entry at new ``GroupMessage`` rows with one UPDATE per group."""
+    for group_id, batch in _by_key(messages, lambda m: m.group_id).items():
+        senders = {message.sender_id for message in batch}
+        states = {sender_id: _read_state_after(sender_id, batch)[0] for sender_id in senders}
+        InboxEntry.objects.filter(_is_older_than(batch[-1]), group_id=group_id).update(
+            **_summary_fields(batch[-1]),
+            updated_at=timezone.now(),
+            last_read_id=Case(
+                *[When(owner_id=sender_id, then=Value(state["last_read_id"])) for sender_id, state in states.items()],
+                default=F("last_read_id"), output_field=BigIntegerField(),
+            ),
+            unread_count=Case(
+                *[When(owner_id=sender_id, then=Value(state["unread_count"])) for sender_id, state in states.items()],
+                default=F("unread_count") + len(batch), output_field=PositiveIntegerField(),
+            ),
+        )
+
+
+def _discount_unread(entries, message):
+    """
+    Take a deleted message back out of the unread counts that included it:
+    those of entries whose watermark is still below it. Members who joined
+    later start with their watermark at the group's newest message, so they
+    are not discounted for messages they never counted.
+    """
+    entries.filter(last_read_id__lt=message.id, unread_count__gt=0).exclude(owner_id=message.sender_id).update(
+        unread_count=F("unread_count") - 1, updated_at=timezone.now()
+    )
+
+
+def direct_message_removed(message):
+    receiver_entry = InboxEntry.objects.filter(
+        owner_id=message.receiver_id, counterpart_id=message.sender_id, group__isnull=True
+    )
+    _discount_unread(receiver_entry, message)
+    refresh_direct(message.conversation, deleted_id=message.id)
+
+
+def group_message_removed(message):
+    _discount_unread(InboxEntry.objects.filter(group_id=message.group_id), message)
+    refresh_group(message.group_id, deleted_id=message.id)
+
+
+def group_messages_removed(group_id, message_ids):
+    """
+    ``group_message_removed()`` for a batch deleted without signals (see
+    myapp.deletion): the unread counts that may have included one of them are
+    recounted from what is left, and the entries are refreshed once.
+    """
+    entries = InboxEntry.objects.filter(group_id=group_id)
+    remaining = (
+        GroupMessage.objects.visible()
+        .filter(group_id=group_id, id__gt=OuterRef("last_read_id"))
+        .exclude(sender_id=OuterRef("owner_id"))
+        .order_by().values("group_id").annotate(count=Count("id")).values("count")
+    )
+    entries.filter(last_read_id__lt=max(message_ids), unread_count__gt=0).update(
+        unread_count=Coalesce(Subquery(remaining), 0), updated_at=timezone.now()
+    )
+    if entries.filter(last_message_id__in=message_ids).exists():
+        refresh_group(group_id)
+
+
+def refresh_direct(conversation, deleted_id=None):
+    """Recompute a DM's entries, e.g. after its newest message was deleted."""
+    parsed = Message.parse_conversation_key(conversation)
+    if parsed is None:
+        return
+    entries = InboxEntry.objects.filter(
+        group__isnull=True, owner_id__in=parsed, counterpart_id__in=parsed
+    )
+    if deleted_id is not None:
+        entries = entries.filter(last_message_id=deleted_id)
+        if not entries.exists():
+            return
+    latest = Message.objects.filter(conversation=conversation).order_by("-timestamp", "-id").first()
+    entries.update(**_summary_fields(latest), updated_at=timezone.now())
+
+
+def refresh_group(group_id, deleted_id=None):
+    """Recompute a group's entries, e.g. after its newest message was deleted."""
+    entries = InboxEntry.objects.filter(group_id=group_id)
+    if deleted_id is not None:
+        entries = entries.filter(last_message_id=deleted_id)
+        if not entries.exists():
+            return
+    latest = GroupMessage.objects.visible().filter(group_id=group_id).order_by("-timestamp", "-id").first()
+    entries.update(**_summary_fields(latest), updated_at=timezone.now())
+
+
+def add_group_members(group_id, user_ids):
+    """Create entries for users who just joined a group, with everything sent before they joined read."""
+    latest = GroupMessage.objects.visible().filter(group_id=group_id).order_by("-timestamp", "-id").first()
+    fields = _summary_fields(latest)
+    # Soft-deleted messages too: deleting one must not discount the newcomers
+    joined_at = GroupMessage.objects.filter(group_id=group_id).aggregate(newest=Max("id"))["newest"] or 0
+    InboxEntry.objects.bulk_create(
+        [InboxEntry(owner_id=user_id, group_id=group_id, last_read_id=joined_at, **fields) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def remove_group_members(group_id, user_ids=None):
+    """Drop the entries of users who left a group (all members when ``user_ids`` is None)."""
+    entries = InboxEntry.objects.filter(group_id=group_id)
+    if user_ids is not None:
+        entries = entries.filter(owner_id__in=user_ids)
+    entries.delete()
+
+
+def remove_group_entries_for_user(user_id):
+    """Drop all group entries of a user (``user.chat_groups.clear()``)."""
+    InboxEntry.objects.filter(owner_id=user_id, group__isnull=False).delete()
+
+
+def mark_read(user_id, kind, target_id, message_id):
+    """
+    Move a user's read high-watermark for one conversation forward to ``message_id``.
+
+    ``kind`` is ``"dm"`` (``target_id`` is the counterpart) or ``"group"``.
+    Acknowledging the newest message just zeroes the counter; a partial ack
+    subtracts the messages from others between the old and the new
+    watermark. Returns the updated ``(last_read_id, unread_count)`` or
+    ``None`` when there is no such entry.
+    """
+    if kind == "dm":
+        entries = InboxEntry.objects.filter(owner_id=user_id, counterpart_id=target_id, group__isnull=True)
+        messages = Message.objects.filter(conversation=Message.conversation_key(user_id, target_id), receiver_id=user_id)
+    else:
+        entries = InboxEntry.objects.filter(owner_id=user_id, group_id=target_id)
+        messages = GroupMessage.objects.visible().filter(group_id=target_id).exclude(sender_id=user_id)
+
+    for _ in range(MARK_READ_ATTEMPTS):
+        entry = entries.only("id", "last_message_id", "last_read_id", "unread_count").first()
+        if entry is None:
+            return None
+        if message_id <= entry.last_read_id:
+            return entry.last_read_id, entry.unread_count
+
+        if entry.last_message_id is None or message_id >= entry.last_message_id:
+            unread = Value(0)
+        else:
+            acknowledged = messages.filter(id__gt=entry.last_read_id, id__lte=message_id).count()
+            unread = Greatest(F("unread_count") - acknowledged, Value(0))
+        # Only if nobody moved the watermark meanwhile; otherwise count again from theirs
+        if InboxEntry.objects.filter(pk=entry.pk, last_read_id=entry.last_read_id).update(
+            last_read_id=message_id, unread_count=unread, updated_at=timezone.now()
+        ):
+            entry.refresh_from_db(fields=["unread_count"])
+            return message_id, entry.unread_count
+    return None
+
+
+def unread_count(entries, obj_id):
+    entry = entries.get(obj_id) if entries is not None else None
+    return entry.unread_count if entry else 0
+
+
+def direct_entries(user, counterpart_ids=None):
+    """The user's DM entries keyed by counterpart id (only those with ``counterpart_ids`` if given)."""
+    entries = InboxEntry.objects.filter(owner=user, group__isnull=True)
+    if counterpart_ids is not None:
+        entries = entries.filter(counterpart_id__in=counterpart_ids)
+    return {entry.counterpart_id: entry for entry in entries}
+
+
+def group_entries(user):
+    """The user's group entries keyed by group id."""
+    return {entry.group_id: entry for entry in InboxEntry.objects.filter(owner=user, group__isnull=False)}
+
+
+def with_recency(queryset, user):
+    """
+    Annotate users or groups with ``last_activity``, the time of the newest
+    message ``user`` has in that conversation (NULL if none), so the database
+    can order and page by it.
+    """
+    key = "group" if queryset.model is ChatGroup else "counterpart"
+    entries = InboxEntry.objects.filter(owner=user, **{key: OuterRef("pk")})
+    if key == "counterpart":
+        entries = entries.filter(group__isnull=True)
+    return queryset.annotate(last_activity=Subquery(entries.values("last_message_at")[:1]))
+
+
+def recent_first(queryset):
+    """Order a ``with_recency()`` queryset most recently active first; never-active rows last, by id."""
+    return queryset.order_by(F("last_activity").desc(nulls_last=True), "id")
@@ -0,0 +1,92 @@
+"""
+Cached, ETag-validated group listings.
+
+``list_groups`` is polled by every client. A rendered listing is cached per
+user under a stamp of everything it is built from:
+
+* a per-user version token, replaced by ``bump()`` whenever one of the
+  user's groups is renamed, gets a new icon, gains or loses members, or is
+  deleted (receivers in ``myapp.signals``);
+* the newest ``updated_at`` and the number of the user's group
+  ``InboxEntry`` rows, which cover new messages and read state.
+
+Checking the stamp is one cache read and one aggregate over the user's
+inbox rows. The ETag is a hash of the rendered body, so an unchanged
+listing answers ``If-None-Match`` with 304 even after the cache is rebuilt.
+"""
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch
+
+from . import inbox
+from .models import ChatGroup, CustomUser, InboxEntry
+from .serializers import ChatGroupSerializer, CompactChatGroupSerializer
+
+CACHE_TTL = 10 * 60   # Seconds a rendered listing is kept
+PENDING_TTL = 10      # ... while icon thumbnails are still rendering, so their URLs show up soon
+
+
+def _version_key(user_id):
+    return f"group_list_version:{user_id}"
+
+
+def version(user_id):
+    token = cache.get(_version_key(user_id))
+    if token is None:
+        token = uuid.uuid4().hex
+        cache.add(_version_key(user_id), token, None)
+        token = cache.get(_version_key(user_id), token)  # Another request may have added one first
+    return token
+
+
+def bump(*user_ids):
+    """Invalidate the users' cached listings now and again once the surrounding transaction commits."""
+    def forget():
+        cache.delete_many([_version_key(user_id) for user_id in user_ids])
+
+    if user_ids:
+        forget()
+        transaction.on_commit(forget)
+
+
+def _groups(user_id, name, compact):
+    # id__in instead of filter(members=...), so Count("members") is not limited to the requester
+    groups = ChatGroup.objects.filter(
+        id__in=ChatGroup.members.through.objects.filter(customuser_id=user_id).values("chatgroup_id")
+    )
+    if name:
+        groups = groups.filter(name__icontains=name)
+    if compact:
+        return groups.annotate(member_count=Count("members"))
+    return groups.prefetch_related(Prefetch("members", queryset=CustomUser.objects.only("id")))
+
+
+def group_listing(request, name="", compact=False):
+    """``(etag, data)`` of the requesting user's groups, most recently active first."""
+    user = request.user
+    inbox_state = InboxEntry.objects.filter(owner=user, group__isnull=False).aggregate(
+        changed=Max("updated_at"), entries=Count("id")
+    )
+    stamp = json.dumps(
+        [version(user.id), inbox_state, name, compact, request.build_absolute_uri("/")], cls=DjangoJSONEncoder
+    )
+    key = f"group_list:{user.id}:{hashlib.sha1(stamp.encode()).hexdigest()}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    entries = inbox.group_entries(user)
+    groups = list(inbox.recent_first(inbox.with_recency(_groups(user.id, name, compact), user)))
+    serializer_class = CompactChatGroupSerializer if compact else ChatGroupSerializer
+    data = serializer_class(groups, many=True, context={"request": request, "inbox": entries}).data
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    etag = f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+
+    pending = any(group.icon and item["thumbnail_urls"] is None for group, item in zip(groups, data))
+    cache.set(key, (etag, data), PENDING_TTL if pending else CACHE_TTL)
+    return etag, data
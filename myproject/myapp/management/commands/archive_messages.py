@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from myapp import archive
+
+
+class Command(BaseCommand):
+    help = "Move messages older than MESSAGE_ARCHIVE['AGE'] seconds into compressed archive segments (see myapp/archive.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=archive.get_setting("BATCH_SIZE"), help="Messages per segment at most.")
+
+    def handle(self, *args, batch_size, **options):
+        segments, messages = archive.archive(batch_size=batch_size, progress=self.report)
+        self.stdout.write(self.style.SUCCESS(f"Archived {messages} messages in {segments} segments."))
+
+    def report(self, segment):
+        self.stdout.write(f"  {segment.path}: {segment.message_count} messages, {segment.size} bytes")
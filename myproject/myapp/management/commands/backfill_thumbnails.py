@@ -0,0 +1,59 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from myapp import thumbnails
+from myapp.models import ChatGroup, CustomUser, GroupMessage, Message
+
+# Every model field whose images get thumbnails
+SOURCES = [
+    (CustomUser, "profile_picture"),
+    (ChatGroup, "icon"),
+    (Message, "file"),
+    (GroupMessage, "file"),
+]
+
+
+class Command(BaseCommand):
+    help = "Render missing thumbnails for images uploaded before the background pipeline existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-render thumbnails that already exist.")
+
+    def handle(self, *args, force=False, **options):
+        executor = thumbnails.get_executor()
+        window = thumbnails.get_setting("WORKERS") * 4  # Jobs in flight; keeps memory flat on big media folders
+        pending = set()
+        submitted = failed = 0
+
+        for name, storage in self.image_names():
+            if not force and thumbnails.is_ready(name, storage):
+                continue
+            if force:
+                for _, target in thumbnails.targets(name):
+                    storage.delete(target)
+                thumbnails.forget(name)
+            future = thumbnails.submit(name, storage)
+            if future is None:
+                continue
+            pending.add(future)
+            submitted += 1
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += sum(1 for f in done if f.exception() is not None)
+
+        done, _ = wait(pending)
+        failed += sum(1 for f in done if f.exception() is not None)
+        executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Rendered thumbnails for {submitted - failed} images ({failed} failed)."))
+
+    def image_names(self):
+        """``(name, storage)`` of every stored image, once each."""
+        seen = set()
+        for model, field in SOURCES:
+            storage = model._meta.get_field(field).storage
+            names = model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+            for name in names.values_list(field, flat=True).distinct().iterator():
+                if name not in seen and thumbnails.is_image(name) and storage.exists(name):
+                    seen.add(name)
+                    yield name, storage
@@ -0,0 +1,97 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from myapp.fast_serializers import FastGroupMessageSerializer, FastMessageSerializer
+from myapp.models import ChatGroup, CustomUser, GroupMessage, Message
+from myapp.renderers import ORJSONRenderer
+from myapp.serializers import GroupMessageSerializer, MessageSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the model and fast history serializers (JSONRenderer vs ORJSONRenderer) on generated "
+        "messages; checks that both produce identical bytes. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000, help="Messages per page.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per variant; the best one counts.")
+        parser.add_argument("--file-every", type=int, default=10, help="Every n-th message gets an attachment.")
+
+    def handle(self, *args, messages=1000, repeat=5, file_every=10, **options):
+        with transaction.atomic():
+            request = self.request(self.generate(messages, file_every))
+            dm, group = self.sample
+            cases = [
+                ("DM history", Message.objects.filter(conversation=dm.conversation),
+                 MessageSerializer, FastMessageSerializer, ("sender", "receiver")),
+                ("Group history", GroupMessage.objects.filter(group=group),
+                 GroupMessageSerializer, FastGroupMessageSerializer, ("sender",)),
+            ]
+            for label, queryset, slow_class, fast_class, related in cases:
+                queryset = queryset.order_by("-timestamp", "-id")[:messages]
+
+                def slow():
+                    rows = list(queryset.select_related(*related))
+                    return JSONRenderer().render(slow_class(rows, many=True, context={"request": request}).data)
+
+                def fast():
+                    rows = list(fast_class.queryset(queryset))
+                    return ORJSONRenderer().render(fast_class(rows, many=True, context={"request": request}).data)
+
+                slow_bytes, slow_time = self.measure(slow, repeat)
+                fast_bytes, fast_time = self.measure(fast, repeat)
+                if slow_bytes != fast_bytes:
+                    raise CommandError(f"{label}: the fast serializer output differs from {slow_class.__name__}.")
+                self.stdout.write(
+                    f"{label} ({messages} messages, {len(fast_bytes) / 1024:.0f} KB): "
+                    f"{slow_time * 1000:.1f} ms -> {fast_time * 1000:.1f} ms ({slow_time / fast_time:.1f}x)"
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Outputs are byte-identical."))
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return output, best
+
+    def generate(self, count, file_every):
+        tag = uuid.uuid4().hex[:8]
+        alice, bob = CustomUser.objects.bulk_create_users([
+            {"email": f"bench-{tag}-a@example.com", "first_name": "Alice", "last_name": "Bench"},
+            {"email": f"bench-{tag}-b@example.com"},
+        ])
+        group = ChatGroup.objects.create(name=f"bench-{tag}", admin=alice)
+
+        def attachment(i, folder):
+            return f"{folder}/bench photo {i}.jpg" if file_every and i % file_every == 0 else None
+
+        dms = Message.objects.bulk_create([
+            Message(sender=(alice, bob)[i % 2], receiver=(bob, alice)[i % 2], content=f"Message {i} ✓",
+                    file=attachment(i, "uploads"), conversation=Message.conversation_key(alice.id, bob.id))
+            for i in range(count)
+        ])
+        GroupMessage.objects.bulk_create([
+            GroupMessage(group=group, sender=(alice, bob)[i % 2], content=f"Message {i} ✓", file=attachment(i, "group_uploads"))
+            for i in range(count)
+        ])
+        self.sample = (dms[0], group)
+        return alice
+
+    @staticmethod
+    def request(user):
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*",) and not h.startswith(".")), "localhost")
+        request = RequestFactory().get("/", HTTP_HOST=host)
+        request.user = user
+        return request
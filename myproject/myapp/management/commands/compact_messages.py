@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from myapp import compaction
+
+
+class Command(BaseCommand):
+    help = "Physically delete old soft-deleted group messages and tombstones in small batches (see myapp/compaction.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=compaction.get_setting("BATCH_SIZE"), help="Rows per transaction.")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, batch_size, pause, **options):
+        messages, tombstones = compaction.compact(batch_size=batch_size, pause=pause, progress=self.report)
+        self.stdout.write(self.style.SUCCESS(f"Removed {messages} deleted messages and {tombstones} tombstones."))
+
+    def report(self, stage, count):
+        self.stdout.write(f"  {stage}: {count} removed")
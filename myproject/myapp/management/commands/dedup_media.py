@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from myapp import archive
+from myapp.models import GroupMessage, Message, StoredBlob, UploadSession
+from myapp.storage import BLOB_PREFIX, blob_name, dedup_storage, delete_unreferenced
+
+MODELS = (Message, GroupMessage)
+
+
+class Command(BaseCommand):
+    help = "Move existing message attachments into deduplicated blob storage and rebuild reference counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be merged.")
+
+    def handle(self, *args, dry_run=False, **options):
+        storage = dedup_storage()
+        moves = {}  # Old name -> blob name
+        old_bytes = 0
+        blob_sizes = {}
+
+        for model in MODELS:
+            names = (
+                model.objects.exclude(file="").exclude(file__isnull=True).exclude(file__startswith=BLOB_PREFIX)
+                .values_list("file", flat=True).distinct()
+            )
+            for name in names.iterator():
+                if name in moves:
+                    continue
+                if not storage.exists(name):
+                    self.stderr.write(f"Missing file, left as is: {name}")
+                    continue
+                target = blob_name(self.digest(storage.path(name)), name)
+                size = storage.size(name)
+                moves[name] = target
+                old_bytes += size
+                blob_sizes[target] = size
+                if not dry_run and not storage.exists(target):
+                    self.copy(storage.path(name), storage.path(target))
+
+        saved = old_bytes - sum(blob_sizes.values())
+        self.stdout.write(f"{len(moves)} files -> {len(blob_sizes)} blobs, {saved / 1024 / 1024:.1f} MB saved.")
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            for model in MODELS:
+                for old, new in moves.items():
+                    # The blob name drops the file name, so keep it first
+                    model.objects.filter(file=old, original_name__isnull=True).update(original_name=os.path.basename(old)[:255])
+                    model.objects.filter(file=old).update(file=new)
+            archived = self.rebuild_reference_counts()
+            # Originals go only once the rows point at the blobs for good; archive segments are never rewritten
+            transaction.on_commit(lambda: [storage.delete(old) for old in moves if old not in archived])
+
+        self.stdout.write(self.style.SUCCESS(f"Reference counts rebuilt for {StoredBlob.objects.count()} blobs."))
+
+    @staticmethod
+    def digest(path):
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def copy(source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)  # Same filesystem: no data copied
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def rebuild_reference_counts(self):
+        """Recount references from messages, archive segments and upload sessions; returns the archived attachment names."""
+        storage = dedup_storage()
+        counts = {}
+        for model in MODELS:
+            rows = model.objects.filter(file__startswith=BLOB_PREFIX).values("file").annotate(n=Count("id"))
+            for row in rows:
+                counts[row["file"]] = counts.get(row["file"], 0) + row["n"]
+        archived = set()
+        for name in archive.attachment_names():
+            archived.add(name)
+            if name.startswith(BLOB_PREFIX):
+                counts[name] = counts.get(name, 0) + 1
+        for name in UploadSession.objects.exclude(file_name="").values_list("file_name", flat=True):
+            counts[name] = counts.get(name, 0) + 1
+
+        # Blobs nothing points at: their files go after commit, like after a last release()
+        for name in StoredBlob.objects.exclude(name__in=counts).values_list("name", flat=True):
+            counts[name] = 0
+            transaction.on_commit(lambda name=name: delete_unreferenced(name), robust=True)
+        existing = set(StoredBlob.objects.values_list("name", flat=True))
+        StoredBlob.objects.bulk_create([
+            StoredBlob(name=name, size=storage.size(name) if storage.exists(name) else 0, ref_count=0)
+            for name in counts if name not in existing
+        ])
+        for blob in StoredBlob.objects.all().iterator():
+            if blob.ref_count != counts[blob.name]:
+                StoredBlob.objects.filter(pk=blob.pk).update(ref_count=counts[blob.name])
+        return archived
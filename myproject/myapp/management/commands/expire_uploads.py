@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions unused for UPLOAD_SESSIONS['TTL'] seconds, with their partial files."
+
+    def handle(self, *args, **options):
+        count = uploads.expire()
+        self.stdout.write(self.style.SUCCESS(f"Expired {count} upload sessions."))
@@ -0,0 +1,46 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Create users from a CSV file with an email column and optional username and password columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, csv_file, batch_size=500, **options):
+        with open(csv_file, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if "email" not in (reader.fieldnames or []):
+                raise CommandError("The CSV file needs an 'email' column.")
+            rows = []
+            for row in reader:
+                email = CustomUser.objects.normalize_email((row.get("email") or "").strip())
+                if email:
+                    rows.append({
+                        "email": email,
+                        "username": (row.get("username") or "").strip(),
+                        "password": row.get("password") or None,
+                    })
+
+        emails = [row["email"] for row in rows]
+        existing = set()
+        for start in range(0, len(emails), batch_size):
+            existing.update(CustomUser.objects.filter(email__in=emails[start:start + batch_size]).values_list("email", flat=True))
+        seen = set()
+        new_rows = []
+        for row in rows:
+            if row["email"] not in existing and row["email"] not in seen:
+                seen.add(row["email"])
+                new_rows.append(row)
+
+        with transaction.atomic():
+            created = CustomUser.objects.bulk_create_users(new_rows, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} users ({len(rows) - len(new_rows)} skipped as existing or repeated)."
+        ))
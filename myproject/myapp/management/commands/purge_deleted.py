@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from myapp import deletion
+from myapp.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = "Purge deleted groups and accounts in small batches (see myapp/deletion.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=deletion.BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches.")
+        parser.add_argument("--job", type=int, help="Only run this job.")
+
+    def handle(self, *args, batch_size, pause, job=None, **options):
+        jobs = DeletionJob.objects.exclude(status=DeletionJob.STATUS_DONE).order_by("id")
+        if job is not None:
+            jobs = jobs.filter(id=job)
+
+        done = failed = 0
+        for deletion_job in jobs:
+            self.stdout.write(f"Job {deletion_job.id}: deleting {deletion_job.kind} {deletion_job.target_id}")
+            try:
+                deletion.purge(deletion_job, batch_size=batch_size, pause=pause, progress=self.report)
+            except Exception as e:
+                self.stderr.write(f"Job {deletion_job.id} failed, will resume on the next run: {e}")
+                failed += 1
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(f"{done} jobs finished, {failed} failed."))
+
+    def report(self, job):
+        total = f"/{job.total_rows}" if job.total_rows else ""
+        self.stdout.write(f"  {job.stage}: {job.deleted_rows}{total} messages deleted")
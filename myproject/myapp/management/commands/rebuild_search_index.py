@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from myapp import search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the SQLite full-text index and its triggers from the message tables (see myapp/search_index.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report missing triggers; exit with an error if any are.")
+
+    def handle(self, *args, check, **options):
+        missing = search_index.missing(connection)
+        if check:
+            if missing:
+                raise CommandError(f"Search index is incomplete, missing: {', '.join(missing)}. Run rebuild_search_index.")
+            self.stdout.write(self.style.SUCCESS("Search index and triggers are in place."))
+            return
+        with transaction.atomic():
+            search_index.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index (was missing {len(missing)} objects)."))
@@ -0,0 +1,19 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from myapp import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox events (messages sent over REST) to WebSocket subscribers via the channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the outbox is empty instead of polling.")
+
+    def handle(self, *args, once=False, **options):
+        try:
+            sent = asyncio.run(outbox.relay(once=once))
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Relayed {sent} events."))
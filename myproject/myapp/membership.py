@@ -0,0 +1,68 @@
+"""
+Group membership lookups without a database round trip.
+
+Each group's member ids are cached as a frozenset, first in a small
+per-process LRU and behind it in the shared Django cache. The
+``m2m_changed``/``post_delete`` receivers in ``myapp.signals`` invalidate
+both whenever ``ChatGroup.members`` changes, so "is user X in group Y" is a
+set lookup that only reaches the database after an invalidation.
+
+Another process's LRU only learns about an invalidation when its entry
+expires, so ``GROUP_MEMBERSHIP["LOCAL_TTL"]`` bounds how stale a lookup can
+be across processes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .lru import LocalLRU
+from .models import ChatGroup
+
+DEFAULTS = {
+    "LOCAL_TTL": 5,            # Seconds a process trusts its own copy
+    "LOCAL_MAX_GROUPS": 1024,  # Groups in the per-process LRU
+    "SHARED_TTL": 60 * 60,     # Seconds in the shared cache (invalidated explicitly anyway)
+}
+
+
+def get_setting(name):
+    return getattr(settings, "GROUP_MEMBERSHIP", {}).get(name, DEFAULTS[name])
+
+
+_local = LocalLRU(get_setting("LOCAL_MAX_GROUPS"), get_setting("LOCAL_TTL"))
+
+
+def _cache_key(group_id):
+    return f"group_members:{group_id}"
+
+
+def member_ids(group_id):
+    """Frozenset of the ids of the group's members (empty for unknown groups)."""
+    group_id = int(group_id)
+    members = _local.get(group_id)
+    if members is None:
+        members = cache.get(_cache_key(group_id))
+        if members is None:
+            members = frozenset(
+                ChatGroup.members.through.objects.filter(chatgroup_id=group_id).values_list("customuser_id", flat=True)
+            )
+            cache.set(_cache_key(group_id), members, get_setting("SHARED_TTL"))
+        _local.set(group_id, members)
+    return members
+
+
+def is_member(group_id, user_id):
+    return user_id is not None and int(user_id) in member_ids(group_id)
+
+
+def invalidate(*group_ids):
+    """Forget cached members now and again once the surrounding transaction commits."""
+    def forget():
+        for group_id in group_ids:
+            _local.delete(int(group_id))
+        cache.delete_many([_cache_key(group_id) for group_id in group_ids])
+
+    if group_ids:
+        forget()
+        # A reader between now and COMMIT could re-cache the old member list
+        transaction.on_commit(forget)
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_groupmessage_is_deleted'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'timestamp', 'id'], name='groupmsg_group_ts_id_idx'),
+        ),
+    ]
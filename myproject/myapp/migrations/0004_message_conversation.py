@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+def backfill_conversation(apps, schema_editor):
+    """Fill the conversation key with one UPDATE per distinct sender/receiver pair."""
+    Message = apps.get_model('myapp', 'Message')
+    pairs = Message.objects.filter(conversation='').values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in list(pairs):
+        low, high = sorted((sender_id, receiver_id))
+        Message.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(conversation=f'{low}_{high}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_groupmessage_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_conversation, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='message_conv_ts_id_idx'),
+        ),
+    ]
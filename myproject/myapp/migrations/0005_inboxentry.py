@@ -0,0 +1,66 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox(apps, schema_editor):
+    """Build entries from the newest message of every DM and every group membership."""
+    Message = apps.get_model('myapp', 'Message')
+    GroupMessage = apps.get_model('myapp', 'GroupMessage')
+    ChatGroup = apps.get_model('myapp', 'ChatGroup')
+    InboxEntry = apps.get_model('myapp', 'InboxEntry')
+
+    def summary(message):
+        if message is None:
+            return {}
+        return {
+            'last_message_id': message.id,
+            'last_message_preview': (message.content or 'File Attached')[:100],
+            'last_message_at': message.timestamp,
+            'last_sender_id': message.sender_id,
+        }
+
+    entries = []
+    conversations = Message.objects.values_list('conversation', flat=True).distinct()
+    for conversation in list(conversations):
+        latest = Message.objects.filter(conversation=conversation).order_by('-timestamp', '-id').first()
+        for owner_id, counterpart_id in {(latest.sender_id, latest.receiver_id), (latest.receiver_id, latest.sender_id)}:
+            entries.append(InboxEntry(owner_id=owner_id, counterpart_id=counterpart_id, **summary(latest)))
+
+    for group in ChatGroup.objects.all():
+        latest = GroupMessage.objects.filter(group=group).order_by('-timestamp', '-id').first()
+        for user_id in group.members.values_list('id', flat=True):
+            entries.append(InboxEntry(owner_id=user_id, group_id=group.id, **summary(latest)))
+
+    InboxEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_message_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=100)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('counterpart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='myapp.chatgroup')),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-last_message_at'], name='inbox_owner_recent_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('group__isnull', True)), fields=('owner', 'counterpart'), name='inbox_unique_direct'), models.UniqueConstraint(condition=models.Q(('group__isnull', False)), fields=('owner', 'group'), name='inbox_unique_group')],
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
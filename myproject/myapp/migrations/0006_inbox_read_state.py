@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_history_read(apps, schema_editor):
+    InboxEntry = apps.get_model('myapp', 'InboxEntry')
+    InboxEntry.objects.filter(last_message_id__isnull=False).update(last_read_id=F('last_message_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_inboxentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_existing_history_read, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:05
+
+from django.db import migrations
+
+# Full-text index over message content, maintained by the database so that
+# every write path (including bulk inserts) keeps it current. See myapp.search.
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE myapp_search_index USING fts5(
+        content, conversation UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    # Private messages: rowid = id * 2
+    """CREATE TRIGGER myapp_message_search_insert AFTER INSERT ON myapp_message
+    WHEN coalesce(NEW.content, '') <> '' BEGIN
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        VALUES (NEW.id * 2, NEW.content, 'dm:' || NEW.conversation);
+    END""",
+    """CREATE TRIGGER myapp_message_search_update AFTER UPDATE OF content, conversation ON myapp_message BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2;
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        SELECT NEW.id * 2, NEW.content, 'dm:' || NEW.conversation WHERE coalesce(NEW.content, '') <> '';
+    END""",
+    """CREATE TRIGGER myapp_message_search_delete AFTER DELETE ON myapp_message BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2;
+    END""",
+    # Group messages: rowid = id * 2 + 1, soft-deleted ones are dropped from the index
+    """CREATE TRIGGER myapp_groupmessage_search_insert AFTER INSERT ON myapp_groupmessage
+    WHEN coalesce(NEW.content, '') <> '' AND NOT NEW.is_deleted BEGIN
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        VALUES (NEW.id * 2 + 1, NEW.content, 'group:' || NEW.group_id);
+    END""",
+    """CREATE TRIGGER myapp_groupmessage_search_update AFTER UPDATE OF content, group_id, is_deleted ON myapp_groupmessage BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2 + 1;
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        SELECT NEW.id * 2 + 1, NEW.content, 'group:' || NEW.group_id
+        WHERE coalesce(NEW.content, '') <> '' AND NOT NEW.is_deleted;
+    END""",
+    """CREATE TRIGGER myapp_groupmessage_search_delete AFTER DELETE ON myapp_groupmessage BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2 + 1;
+    END""",
+    # Existing history
+    """INSERT INTO myapp_search_index(rowid, content, conversation)
+    SELECT id * 2, content, 'dm:' || conversation FROM myapp_message WHERE coalesce(content, '') <> ''""",
+    """INSERT INTO myapp_search_index(rowid, content, conversation)
+    SELECT id * 2 + 1, content, 'group:' || group_id FROM myapp_groupmessage
+    WHERE coalesce(content, '') <> '' AND NOT is_deleted""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS myapp_message_search_insert",
+    "DROP TRIGGER IF EXISTS myapp_message_search_update",
+    "DROP TRIGGER IF EXISTS myapp_message_search_delete",
+    "DROP TRIGGER IF EXISTS myapp_groupmessage_search_insert",
+    "DROP TRIGGER IF EXISTS myapp_groupmessage_search_update",
+    "DROP TRIGGER IF EXISTS myapp_groupmessage_search_delete",
+    "DROP TABLE IF EXISTS myapp_search_index",
+]
+
+# Stored generated columns are filled for existing rows by the ALTER itself
+POSTGRES_FORWARD = [
+    """ALTER TABLE myapp_message ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+    "CREATE INDEX message_search_idx ON myapp_message USING GIN (search_vector)",
+    """ALTER TABLE myapp_groupmessage ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+    "CREATE INDEX groupmsg_search_idx ON myapp_groupmessage USING GIN (search_vector) WHERE NOT is_deleted",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS message_search_idx",
+    "ALTER TABLE myapp_message DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS groupmsg_search_idx",
+    "ALTER TABLE myapp_groupmessage DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_tombstone'),
+    ]
+
+    operations = [
+        # Other backends have no index; myapp.search falls back to icontains there
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:40
+
+import myapp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # Storage is not a database property, but SQLite would still rebuild
+        # both tables for it and drop the search triggers of 0008
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='groupmessage',
+                    name='file',
+                    field=models.FileField(blank=True, null=True, storage=myapp.storage.dedup_storage, upload_to='group_uploads/'),
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='file',
+                    field=models.FileField(blank=True, null=True, storage=myapp.storage.dedup_storage, upload_to='uploads/'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:40
+
+from django.db import migrations
+
+# The unique index on username cannot serve LIKE 'base%' under a non-C
+# collation; myapp.usernames allocates signup usernames with that query.
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS customuser_username_prefix_idx ON myapp_customuser (username varchar_pattern_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS customuser_username_prefix_idx",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
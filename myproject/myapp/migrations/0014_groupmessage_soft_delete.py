@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_soft_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['group', 'timestamp', 'id'], name='groupmsg_live_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['deleted_at'], name='groupmsg_deleted_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ),
+        # Dropped only once its partial replacement exists
+        migrations.RemoveIndex(
+            model_name='groupmessage',
+            name='groupmsg_group_ts_id_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:30
+
+from django.db import migrations
+
+from myapp import search_index
+
+
+class Migration(migrations.Migration):
+    # 0009 used to rebuild both message tables on SQLite, which dropped the
+    # search triggers of 0008; recreate them and reindex what was missed since.
+
+    dependencies = [
+        ('myapp', '0015_archive_segments'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_index.rebuild_operation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:05
+
+import os
+
+from django.db import migrations, models
+
+BLOB_PREFIX = "blobs/"
+
+
+def keep_upload_names(apps, schema_editor):
+    # Files not yet moved by dedup_media still carry their name; blobs lost it already
+    for model_name in ("Message", "GroupMessage"):
+        model = apps.get_model("myapp", model_name)
+        rows = model.objects.exclude(file="").exclude(file__isnull=True).exclude(file__startswith=BLOB_PREFIX)
+        for pk, name in rows.values_list("pk", "file").iterator():
+            model.objects.filter(pk=pk).update(original_name=os.path.basename(name)[:255])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_rebuild_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(keep_upload_names, migrations.RunPython.noop),
+    ]
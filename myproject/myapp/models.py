@@ -1,32 +1,57 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 
+from .storage import dedup_storage
+
 # ✅ Custom User Manager
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
+        from .usernames import base_for, save_with_unique_username
+
         if not email:
             raise ValueError("The Email field must be set")
         email = self.normalize_email(email)
 
-        # Generate unique username if not provided
-        if not extra_fields.get("username"):
-            base_username = email.split('@')[0]
-            username = base_username
-            counter = 1
-            while CustomUser.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            extra_fields["username"] = username
-
         user = self.model(email=email, **extra_fields)
         if password:
             user.set_password(password)
         else:
             raise ValueError("The Password field must be set")
 
-        user.save(using=self._db)
+        if extra_fields.get("username"):
+            user.save(using=self._db)
+        else:
+            # Generate unique username if not provided
+            save_with_unique_username(user, base_for(email), using=self._db)
         return user
 
+    def bulk_create_users(self, rows, batch_size=500):
+        """
+        Create users from dicts with ``email`` and optional ``username``,
+        ``password`` and other fields, allocating all usernames in one query.
+        Rows without a password get an unusable one. Like ``bulk_create``,
+        no signals are sent.
+        """
+        from .usernames import allocate_many, base_for
+
+        users = []
+        for row in rows:
+            row = dict(row)
+            password = row.pop("password", None)
+            user = self.model(**{**row, "email": self.normalize_email(row["email"])})
+            if password:
+                user.set_password(password)
+            else:
+                user.set_unusable_password()
+            users.append(user)
+
+        # Requested usernames that are taken (or repeated) get a suffix, like on signup
+        for user, username in zip(users, allocate_many([base_for(user.email, user.username) for user in users])):
+            user.username = username
+        return self.bulk_create(users, batch_size=batch_size)
+
     def create_superuser(self, email, password, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
@@ -43,6 +68,7 @@ class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     profile_picture = models.ImageField(upload_to="profile_pictures/", null=True, blank=True, default="default.jpg")
     username = models.CharField(max_length=150, unique=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Account removed; rows purged by a DeletionJob
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
@@ -53,6 +79,12 @@ class CustomUser(AbstractUser):
         return self.username or self.email
 
 # ✅ Group Model
+class ChatGroupQuerySet(models.QuerySet):
+    def alive(self):
+        """Groups not waiting for their DeletionJob."""
+        return self.filter(deleted_at__isnull=True)
+
+
 class ChatGroup(models.Model):
     name = models.CharField(max_length=255, unique=True)
     icon = models.ImageField(upload_to="group_icons/", null=True, blank=True, default="default_group.jpg")
@@ -60,18 +92,26 @@ class ChatGroup(models.Model):
     admin = models.ForeignKey(CustomUser, related_name="admin_groups", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Deleted; rows purged by a DeletionJob
+
+    objects = ChatGroupQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def has_member(self, user):
+        """Cached membership check (see myapp.membership)."""
+        from .membership import is_member
+        return is_member(self.id, getattr(user, "id", user))
+
     def add_member(self, user):
         """Add a member to the group."""
-        if user not in self.members.all():
+        if not self.has_member(user):
             self.members.add(user)
 
     def remove_member(self, user):
         """Remove a member from the group."""
-        if user in self.members.all():
+        if self.has_member(user):
             self.members.remove(user)
 
 # ✅ Private Messages
@@ -79,22 +119,69 @@ class Message(models.Model):
     sender = models.ForeignKey(CustomUser, related_name="sent_messages", on_delete=models.CASCADE)
     receiver = models.ForeignKey(CustomUser, related_name="received_messages", on_delete=models.CASCADE)
     content = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to="uploads/", blank=True, null=True)
+    file = models.FileField(upload_to="uploads/", storage=dedup_storage, blank=True, null=True)  # Stored once per content
+    original_name = models.CharField(max_length=255, blank=True, null=True)  # The uploader's file name; blobs are named by hash
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Normalized "<low id>_<high id>" pair so both directions of a DM share one index range
+    conversation = models.CharField(max_length=64, editable=False, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["conversation", "timestamp", "id"], name="message_conv_ts_id_idx"),
+        ]
 
     def __str__(self):
         preview = (self.content[:20] + "...") if self.content else "File Attached"
         return f"{self.sender.username} → {self.receiver.username}: {preview}"
 
+    @staticmethod
+    def conversation_key(user_a_id, user_b_id):
+        """Canonical conversation identifier for a pair of user ids (order-independent)."""
+        low, high = sorted((int(user_a_id), int(user_b_id)))
+        return f"{low}_{high}"
+
+    @staticmethod
+    def parse_conversation_key(key):
+        """Return the ``(low, high)`` user ids of a conversation key, or ``None`` if malformed."""
+        try:
+            low, high = (int(part) for part in key.split("_"))
+        except (AttributeError, ValueError):
+            return None
+        return (low, high) if low <= high else None
+
+    def save(self, *args, **kwargs):
+        if not self.conversation:
+            self.conversation = self.conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+
 # ✅ Group Messages (Only Group Members Can Send)
+class GroupMessageQuerySet(models.QuerySet):
+    def visible(self):
+        """Messages not soft-deleted; matches the partial indexes on ``is_deleted=False``."""
+        return self.filter(is_deleted=False)
+
+
 class GroupMessage(models.Model):
     group = models.ForeignKey(ChatGroup, related_name="messages", on_delete=models.CASCADE)
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     content = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to="group_uploads/", blank=True, null=True)
+    file = models.FileField(upload_to="group_uploads/", storage=dedup_storage, blank=True, null=True)
+    original_name = models.CharField(max_length=255, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_deleted = models.BooleanField(default=False)  # New field
+    is_deleted = models.BooleanField(default=False)  # Soft delete, see myapp.compaction
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = GroupMessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a group's history walks (timestamp, id) within one group
+            models.Index(
+                fields=["group", "timestamp", "id"], condition=models.Q(is_deleted=False), name="groupmsg_live_ts_id_idx"
+            ),
+            # Compaction finds old soft-deleted rows without scanning the live ones
+            models.Index(fields=["deleted_at"], condition=models.Q(is_deleted=True), name="groupmsg_deleted_at_idx"),
+        ]
 
     def __str__(self):
         preview = (self.content[:20] + "...") if self.content else "File Attached"
@@ -102,6 +189,146 @@ class GroupMessage(models.Model):
 
     def save(self, *args, **kwargs):
         """Ensure only group members can send messages."""
-        if not self.group.members.filter(id=self.sender.id).exists():
+        from .membership import is_member
+        if not is_member(self.group_id, self.sender_id):
             raise ValueError("Only group members can send messages.")
         super().save(*args, **kwargs)
+
+# ✅ Inbox (one row per user per conversation, maintained by myapp.inbox)
+class InboxEntry(models.Model):
+    owner = models.ForeignKey(CustomUser, related_name="inbox_entries", on_delete=models.CASCADE)
+    counterpart = models.ForeignKey(CustomUser, related_name="+", null=True, blank=True, on_delete=models.CASCADE)
+    group = models.ForeignKey(ChatGroup, related_name="inbox_entries", null=True, blank=True, on_delete=models.CASCADE)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=100, blank=True, default="")
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_sender = models.ForeignKey(CustomUser, related_name="+", null=True, blank=True, on_delete=models.SET_NULL)
+    # Read high-watermark and the number of messages from others above it
+    last_read_id = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "counterpart"], condition=models.Q(group__isnull=True), name="inbox_unique_direct"),
+            models.UniqueConstraint(fields=["owner", "group"], condition=models.Q(group__isnull=False), name="inbox_unique_group"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "-last_message_at"], name="inbox_owner_recent_idx"),
+        ]
+
+    def __str__(self):
+        target = self.group or self.counterpart
+        return f"{self.owner} ↔ {target}: {self.last_message_preview or '—'}"
+
+# ✅ Tombstones (ids of deleted messages, so reconnecting clients can drop them)
+class Tombstone(models.Model):
+    conversation = models.CharField(max_length=80)  # "dm:<key>" or "group:<id>", see myapp.conversations
+    message_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Sync reads "tombstones of these conversations after cursor N"
+            models.Index(fields=["conversation", "id"], name="tombstone_conv_id_idx"),
+            # Compaction drops the oldest
+            models.Index(fields=["deleted_at"], name="tombstone_deleted_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation}: message {self.message_id} deleted"
+
+# ✅ Deduplicated attachment blobs (reference counts for myapp.storage.DedupStorage)
+class StoredBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)  # "blobs/ab/<sha256><ext>"
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+# ✅ Resumable chunked uploads (see myapp/uploads.py)
+class UploadSession(models.Model):
+    STATUS_OPEN = "open"
+    STATUS_COMPLETE = "complete"
+    STATUS_CHOICES = [(STATUS_OPEN, "Open"), (STATUS_COMPLETE, "Complete")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(CustomUser, related_name="upload_sessions", on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, default="")  # Optional checksum of the whole file
+    received = models.BigIntegerField(default=0)  # Bytes written so far = offset of the next chunk
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    file_name = models.CharField(max_length=255, blank=True, default="")  # DedupStorage name once complete
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+# ✅ Transactional outbox (channel-layer events written with the rows they announce, see myapp/outbox.py)
+class OutboxEvent(models.Model):
+    event_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)  # Lets receivers drop redeliveries
+    groups = models.JSONField()   # Channel-layer groups to send to: [[group, event type], ...]
+    payload = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    failed_at = models.DateTimeField(null=True, blank=True)  # Dead-lettered after OUTBOX["MAX_ATTEMPTS"]; kept for inspection
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.payload.get('type')} {self.event_id} ({self.attempts} attempts)"
+
+# ✅ Background purges of deleted groups and accounts (see myapp/deletion.py)
+class DeletionJob(models.Model):
+    KIND_GROUP = "group"
+    KIND_USER = "user"
+    KIND_CHOICES = [(KIND_GROUP, "Group"), (KIND_USER, "User")]
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"), (STATUS_RUNNING, "Running"), (STATUS_DONE, "Done"), (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    target_id = models.BigIntegerField()  # ChatGroup or CustomUser id; the row itself goes last
+    requested_by = models.ForeignKey(CustomUser, related_name="+", null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    stage = models.CharField(max_length=50, blank=True, default="")  # Step currently being purged
+    total_rows = models.BigIntegerField(default=0)  # Messages counted when the job was created
+    deleted_rows = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Delete {self.kind} {self.target_id} ({self.status}, {self.deleted_rows}/{self.total_rows})"
+
+# ✅ Compressed archive of old messages, one immutable file per segment (see myapp/archive.py)
+class ArchiveSegment(models.Model):
+    conversation = models.CharField(max_length=80)  # "dm:<key>" or "group:<id>", see myapp.conversations
+    month = models.DateField()  # First day of the month its messages were sent in
+    path = models.CharField(max_length=255, unique=True)  # Relative to MESSAGE_ARCHIVE["DIR"]
+    compression = models.CharField(max_length=10)  # "gzip" or "zstd"
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    min_id = models.BigIntegerField()  # Smallest and largest message id inside
+    max_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    size = models.BigIntegerField()  # Compressed bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # History walks a conversation's segments by time, both ways
+            models.Index(fields=["conversation", "last_timestamp"], name="archive_conv_last_ts_idx"),
+            # Attachment downloads find an archived message by id
+            models.Index(fields=["min_id"], name="archive_min_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation} {self.month:%Y-%m}: {self.message_count} messages"
@@ -0,0 +1,145 @@
+"""
+Transactional outbox for messages sent over REST.
+
+``send_message``/``send_group_message`` call ``message_created()`` inside
+the transaction that stores the message. The ``OutboxEvent`` row is
+therefore committed exactly when the message is, and never for a rolled
+back send. ``manage.py relay_outbox`` runs ``relay()``. It reads committed
+events in id order, in batches, and sends them to the channel layer as the
+same ``chat_message``/``group_chat_message``/``stream_message`` events the
+consumers publish for WebSocket-sent messages. Rows are deleted only after
+every group_send for them succeeded. Group message soft deletes queue their
+``message.deleted`` event the same way (``message_deleted()``, see
+myapp.compaction).
+
+An event the layer keeps rejecting (say, an oversized payload) is
+dead-lettered after ``MAX_ATTEMPTS`` tries: the row stays with
+``failed_at`` set for inspection and is skipped from then on. Clearing
+``failed_at`` and ``attempts`` queues it again.
+
+Delivery is at least once: a relay that dies between sending and deleting
+sends the batch again on restart. Every event carries the row's
+``event_id``, and the consumers drop ids they have already forwarded
+(``ConversationMixin.first_delivery``). Run one relay per deployment; a
+second one only produces duplicates that get dropped the same way.
+"""
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import conversations
+from .models import GroupMessage, OutboxEvent
+from .realtime import user_group_name
+from .storage import display_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BATCH_SIZE": 100,     # Events per read
+    "POLL_INTERVAL": 0.2,  # Seconds between reads while the outbox is empty
+    "RETRY_DELAY": 5,      # Seconds to wait after the channel layer failed
+    "MAX_ATTEMPTS": 12,    # Failed sends before an event is dead-lettered
+}
+
+
+def get_setting(name):
+    return getattr(settings, "OUTBOX", {}).get(name, DEFAULTS[name])
+
+
+def enqueue(targets, payload):
+    """Record ``payload`` for ``[(channel-layer group, event type)]``; call inside the writing transaction."""
+    return OutboxEvent.objects.create(groups=[list(target) for target in targets], payload=payload)
+
+
+def message_created(message, username):
+    """Queue the live-socket events for a message stored by a REST view (same shape as consumers.publish)."""
+    payload = {
+        "message": message.content or "",
+        "username": username,
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "timestamp": message.timestamp.isoformat(),
+    }
+    if message.file:
+        payload["file_url"] = message.file.url
+        payload["file_name"] = display_name(message.file.name, message.original_name)
+    if isinstance(message, GroupMessage):
+        payload.update(group_id=message.group_id, message_type="group")
+        targets = [(f"group_chat_{message.group_id}", "group_chat_message")]
+    else:
+        payload.update(message_type="private", conversation=conversations.dm_id(message.conversation))
+        targets = [(f"chat_{message.conversation}", "chat_message")]
+        targets += [(user_group_name(user_id), "stream_message") for user_id in {message.sender_id, message.receiver_id}]
+    return enqueue(targets, payload)
+
+
+def message_deleted(message):
+    """Queue the ``message.deleted`` event for a soft-deleted group message (see myapp.compaction)."""
+    payload = {"id": message.id, "group_id": message.group_id, "message_type": "group"}
+    return enqueue([(f"group_chat_{message.group_id}", "message.deleted")], payload)
+
+
+@database_sync_to_async
+def pending(limit):
+    return list(OutboxEvent.objects.filter(failed_at__isnull=True).order_by("id")[:limit])
+
+
+@database_sync_to_async
+def settle(sent_ids, failed_id=None):
+    """Delete the sent events and count a failed attempt; True if that dead-lettered the failed event."""
+    OutboxEvent.objects.filter(id__in=sent_ids).delete()
+    if failed_id is None:
+        return False
+    OutboxEvent.objects.filter(id=failed_id).update(attempts=F("attempts") + 1)
+    return bool(OutboxEvent.objects.filter(id=failed_id, attempts__gte=get_setting("MAX_ATTEMPTS")).update(
+        failed_at=timezone.now()
+    ))
+
+
+async def send_event(channel_layer, event):
+    for group, event_type in event.groups:
+        await channel_layer.group_send(group, {**event.payload, "type": event_type, "event_id": str(event.event_id)})
+
+
+async def relay(channel_layer=None, once=False):
+    """
+    Drain the outbox into the channel layer until cancelled (or, with
+    ``once``, until it is empty or the layer fails); returns the number of
+    events sent. A failing event stops the batch, so later messages of a
+    conversation are not delivered ahead of it, until it has failed
+    ``MAX_ATTEMPTS`` times. It is then dead-lettered (``failed_at``) and
+    skipped, so one undeliverable event cannot hold up the whole outbox.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    sent_total = 0
+    while True:
+        batch = await pending(get_setting("BATCH_SIZE"))
+        if not batch:
+            if once:
+                return sent_total
+            await asyncio.sleep(get_setting("POLL_INTERVAL"))
+            continue
+
+        sent_ids = []
+        failed = None
+        for event in batch:
+            try:
+                await send_event(channel_layer, event)
+            except Exception as e:
+                logger.warning(f"Outbox event {event.event_id} not delivered (attempt {event.attempts + 1}): {e}")
+                failed = event
+                break
+            sent_ids.append(event.id)
+        dead = await settle(sent_ids, failed.id if failed else None)
+        sent_total += len(sent_ids)
+        if dead:
+            logger.error(f"Outbox event {failed.event_id} dead-lettered after {failed.attempts + 1} attempts (groups {failed.groups})")
+        elif failed is not None:
+            if once:
+                return sent_total
+            await asyncio.sleep(get_setting("RETRY_DELAY"))
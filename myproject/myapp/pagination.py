@@ -0,0 +1,150 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Response headers carrying the cursors; the body stays a plain list so
+# existing clients keep working.
+BEFORE_HEADER = "X-Cursor-Before"
+AFTER_HEADER = "X-Cursor-After"
+NEXT_HEADER = "X-Cursor-Next"  # Lists that only page forward (search, users)
+
+
+class CursorError(ValueError):
+    """Raised when a cursor or page size from the query string is invalid."""
+
+
+class MessagePage(namedtuple("MessagePage", ["messages", "before", "after"])):
+    """One page of messages (newest first) plus cursors for the adjacent pages."""
+
+    def apply_headers(self, response):
+        if self.before:
+            response[BEFORE_HEADER] = self.before
+        if self.after:
+            response[AFTER_HEADER] = self.after
+        return response
+
+
+def _position(message):
+    """``(timestamp, id)`` of a model instance or a ``.values()`` row."""
+    if isinstance(message, dict):
+        return message["timestamp"], message["id"]
+    return message.timestamp, message.id
+
+
+def encode_cursor(message):
+    """Opaque cursor for a message's ``(timestamp, id)`` position (a model instance or a ``.values()`` row)."""
+    timestamp, message_id = _position(message)
+    raw = f"{timestamp.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, message_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except ValueError:
+        raise CursorError("Invalid cursor.")
+
+
+def encode_recency_cursor(at, obj_id):
+    """Opaque cursor for a ``(last activity or None, id)`` position in a recency-ordered list."""
+    raw = f"{at.isoformat() if at else ''}|{obj_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_recency_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        at, obj_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return (datetime.fromisoformat(at) if at else None), int(obj_id)
+    except ValueError:
+        raise CursorError("Invalid cursor.")
+
+
+def parse_limit(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise CursorError("limit must be an integer.")
+    if limit < 1:
+        raise CursorError("limit must be positive.")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_messages(queryset, params, archived=None):
+    """
+    Keyset pagination over ``(timestamp, id)``.
+
+    ``before`` walks back into older history, ``after`` fetches messages newer
+    than a cursor (e.g. when polling). Without either, the newest page is
+    returned. Messages always come back newest first.
+
+    ``archived`` (a ``myapp.archive.History``) holds the conversation's
+    messages that were moved out of ``queryset``, all older than the ones left
+    in it. Pages that run past the oldest row of ``queryset`` continue there,
+    with the same cursors.
+    """
+    before = params.get("before")
+    after = params.get("after")
+    if before and after:
+        raise CursorError("Use either 'before' or 'after', not both.")
+    limit = parse_limit(params.get("limit"))
+
+    if after:
+        timestamp, message_id = decode_cursor(after)
+        rows = archived.newer((timestamp, message_id), limit) if archived is not None else []
+        if len(rows) < limit:
+            rows += list(
+                queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id))
+                .order_by("timestamp", "id")[:limit - len(rows)]
+            )
+        rows.reverse()
+        has_older = True
+    else:
+        position = None
+        if before:
+            position = decode_cursor(before)
+            timestamp, message_id = position
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+        rows = list(queryset.order_by("-timestamp", "-id")[:limit + 1])
+        if archived is not None and len(rows) <= limit:
+            rows += archived.older(_position(rows[-1]) if rows else position, limit + 1 - len(rows))
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+
+    before_cursor = encode_cursor(rows[-1]) if rows and has_older else None
+    # Always hand back an "after" cursor so clients can poll for new messages.
+    after_cursor = encode_cursor(rows[0]) if rows else after
+    return MessagePage(rows, before_cursor, after_cursor)
+
+
+def paginate_by_recency(queryset, params, field):
+    """
+    Keyset pagination over ``(field DESC NULLS LAST, id)``, e.g. users ordered
+    by the requester's last message with them. ``field`` is an annotation
+    that may be NULL (never talked); those rows come last, by id.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    limit = parse_limit(params.get("limit"))
+    if params.get("cursor"):
+        at, obj_id = decode_recency_cursor(params["cursor"])
+        if at is None:
+            queryset = queryset.filter(**{f"{field}__isnull": True, "id__gt": obj_id})
+        else:
+            queryset = queryset.filter(
+                Q(**{f"{field}__lt": at}) | Q(**{field: at, "id__gt": obj_id}) | Q(**{f"{field}__isnull": True})
+            )
+    rows = list(queryset.order_by(F(field).desc(nulls_last=True), "id")[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_recency_cursor(getattr(rows[-1], field), rows[-1].id)
@@ -0,0 +1,95 @@
+"""
+Ephemeral presence and typing state for the WebSocket consumers.
+
+Nothing here touches the database. A user is online while their presence key
+exists in the cache: every socket refreshes it with heartbeats, and a
+per-user connection counter decides when the last socket went away. A
+crashed server simply stops heartbeating and the keys expire after
+``PRESENCE_TTL``.
+
+Typing and presence changes are fanned out through ``Debouncer``, so each
+conversation gets at most one broadcast per ``BROADCAST_INTERVAL`` per
+process however fast the signals arrive.
+"""
+import asyncio
+import time
+
+from django.core.cache import cache
+
+PRESENCE_TTL = 60          # Seconds without a heartbeat before a user counts as offline
+BROADCAST_INTERVAL = 2.0   # Minimum seconds between two broadcasts for the same conversation
+
+
+def _presence_key(user_id):
+    return f"presence:{user_id}"
+
+
+def _connections_key(user_id):
+    return f"presence_conns:{user_id}"
+
+
+def connected(user_id):
+    """Register a new socket; returns True if the user just came online."""
+    cache.add(_connections_key(user_id), 0, PRESENCE_TTL)
+    connections = cache.incr(_connections_key(user_id))
+    came_online = cache.add(_presence_key(user_id), time.time(), PRESENCE_TTL)
+    if not came_online:
+        cache.set(_presence_key(user_id), time.time(), PRESENCE_TTL)
+    return came_online or connections == 1
+
+
+def heartbeat(user_id):
+    cache.set(_presence_key(user_id), time.time(), PRESENCE_TTL)
+    cache.touch(_connections_key(user_id), PRESENCE_TTL)
+
+
+def disconnected(user_id):
+    """Unregister a socket; returns True if it was the user's last one."""
+    try:
+        connections = cache.decr(_connections_key(user_id))
+    except ValueError:  # Counter expired
+        connections = 0
+    if connections > 0:
+        return False
+    cache.delete_many([_presence_key(user_id), _connections_key(user_id)])
+    return True
+
+
+def online(user_ids):
+    """The subset of ``user_ids`` that is currently online (one cache round trip)."""
+    user_ids = list(user_ids)
+    found = cache.get_many([_presence_key(user_id) for user_id in user_ids])
+    return {user_id for user_id in user_ids if _presence_key(user_id) in found}
+
+
+class Debouncer:
+    """
+    Leading-edge debounce per key: the first signal is sent at once, later
+    ones within ``interval`` are merged (last value per item wins) and sent
+    together when the interval ends.
+    """
+
+    def __init__(self, interval=BROADCAST_INTERVAL):
+        self.interval = interval
+        self.windows = {}
+
+    async def signal(self, key, item, value, send):
+        window = self.windows.get(key)
+        if window is not None:
+            window[item] = value
+            return
+        self.windows[key] = {}
+        asyncio.create_task(self._close_window(key, send))
+        await send({item: value})
+
+    async def _close_window(self, key, send):
+        await asyncio.sleep(self.interval)
+        pending = self.windows.pop(key, None)
+        if pending:
+            # Keep rate-limiting while signals keep coming
+            self.windows[key] = {}
+            asyncio.create_task(self._close_window(key, send))
+            await send(pending)
+
+
+debouncer = Debouncer()
@@ -0,0 +1,27 @@
+"""
+Deleting rows by primary key without Django's delete collector.
+
+``QuerySet.delete()`` loads every row to send ``pre_delete``/``post_delete``
+and follow cascades. The archive (myapp.archive) and the purge of deleted
+groups and accounts (myapp.deletion) remove message batches whose side
+effects they handle in bulk themselves, and nothing references message
+rows, so ``delete_ids()`` issues plain ``DELETE ... WHERE id IN (...)``
+statements instead. Database triggers (the search index) still fire.
+"""
+from django.db import connections, router
+
+CHUNK_SIZE = 500  # Ids per statement, well below SQLite's bound parameter limit
+
+
+def delete_ids(model, ids):
+    """Delete the ``model`` rows with these primary keys; returns how many were deleted."""
+    ids = list(ids)
+    connection = connections[router.db_for_write(model)]
+    table, pk = (connection.ops.quote_name(name) for name in (model._meta.db_table, model._meta.pk.column))
+    deleted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            deleted += cursor.rowcount
+    return deleted
@@ -0,0 +1,58 @@
+"""
+Pushing events to live WebSocket connections from synchronous code (views, signals).
+
+Events are sent after the surrounding transaction commits, and a missing or
+unreachable channel layer only logs a warning: a REST request must never fail
+because Redis is down.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def user_group_name(user_id):
+    """Channel-layer group every socket of a user joins for per-user control events."""
+    return f"user_{user_id}"
+
+
+def send_to_group(group_name, event):
+    send_to_groups([group_name], event)
+
+
+def send_to_groups(group_names, event):
+    """``event`` to each group, all from one callback after commit."""
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for group_name in group_names:
+            try:
+                async_to_sync(channel_layer.group_send)(group_name, event)
+            except Exception as e:
+                logger.warning(f"Could not deliver {event.get('type')} to {group_name}: {e}")
+
+    transaction.on_commit(send)
+
+
+def membership_revoked(group_id, user_ids):
+    """Tell the removed users' sockets to drop the group (clears and deletions, which have no room event)."""
+    for user_id in user_ids:
+        send_to_group(user_group_name(user_id), {"type": "membership.revoked", "group_id": int(group_id)})
+
+
+def members_changed(group_id, added=(), removed=()):
+    """
+    One ``members.changed`` event per membership change, however many users
+    it covers. The group's room gets it, which includes the removed members'
+    sockets; added users are not in the room yet, so their own groups get the
+    same event. Consumers act on their own id in ``added``/``removed``.
+    """
+    event = {
+        "type": "members.changed", "group_id": int(group_id),
+        "added": sorted(added), "removed": sorted(removed),
+    }
+    send_to_groups([f"group_chat_{int(group_id)}", *(user_group_name(user_id) for user_id in sorted(added))], event)
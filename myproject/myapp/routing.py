@@ -1,7 +1,8 @@
 from django.urls import re_path
-from myapp.consumers import ChatConsumer, GroupChatConsumer
+from myapp.consumers import ChatConsumer, GroupChatConsumer, StreamConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<room_name>\w+)/$", ChatConsumer.as_asgi()),
     re_path(r"ws/group/(?P<group_id>\d+)/$", GroupChatConsumer.as_asgi()),  # Change to group_id
+    re_path(r"ws/stream/$", StreamConsumer.as_asgi()),  # One multiplexed socket per user
 ]
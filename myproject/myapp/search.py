@@ -0,0 +1,188 @@
+"""
+Full-text search over message content.
+
+The index is maintained by the database itself (migration 0008, schema in
+myapp.search_index), so every write path keeps it current, bulk inserts
+from the write-behind buffer included:
+
+* SQLite: an FTS5 table ``myapp_search_index`` filled by triggers. Its rowid
+  packs the message id and kind (``id * 2`` for private, ``id * 2 + 1`` for
+  group messages) and an unindexed ``conversation`` column holds the
+  myapp.conversations id used to restrict results to what the user can see.
+  Table rebuilds drop the triggers; ``manage.py rebuild_search_index``
+  restores them.
+* PostgreSQL: a stored generated ``tsvector`` column on both message tables
+  with a GIN index (partial on ``NOT is_deleted`` for group messages).
+
+Other backends fall back to ``icontains`` scans without ranking.
+
+Hits are ordered by score (lower is better) and paginated with an opaque
+``(score, rowid)`` cursor, so pages stay stable however deep the client goes.
+"""
+import base64
+import re
+from collections import namedtuple
+
+from django.db import connection
+
+from . import conversations
+from .models import ChatGroup, GroupMessage, InboxEntry, Message
+from .pagination import CursorError, parse_limit
+
+MAX_TERMS = 10
+ADMIN_MATCH_LIMIT = 1000  # Ids the admin search may add to its queryset
+
+Hit = namedtuple("Hit", ["rowid", "score"])
+SearchPage = namedtuple("SearchPage", ["results", "next_cursor"])  # results: [(hit, message)]
+
+
+class SearchError(ValueError):
+    """Raised when the query text has nothing to search for."""
+
+
+def parse_terms(text):
+    terms = re.findall(r"\w+", text or "")[:MAX_TERMS]
+    if not terms:
+        raise SearchError("Search text is required.")
+    return terms
+
+
+def encode_cursor(hit):
+    raw = f"{hit.score!r}|{hit.rowid}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, rowid = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return Hit(int(rowid), float(score))
+    except ValueError:
+        raise CursorError("Invalid cursor.")
+
+
+def accessible_conversations(user_id):
+    """Conversation ids the user may search: DMs with messages (inbox) and current groups."""
+    counterparts = InboxEntry.objects.filter(owner_id=user_id, group__isnull=True).values_list("counterpart_id", flat=True)
+    group_ids = ChatGroup.members.through.objects.filter(customuser_id=user_id).values_list("chatgroup_id", flat=True)
+    return [conversations.from_target(user_id, ("dm", other_id)) for other_id in counterparts] + [
+        conversations.group_id(group_id) for group_id in group_ids
+    ]
+
+
+def _after_clause(after, params):
+    if after is None:
+        return ""
+    params.extend([after.score, after.score, after.rowid])
+    return "WHERE score > %s OR (score = %s AND rowid > %s)"
+
+
+def _sqlite_hits(terms, scope, after, limit):
+    # Quoted terms cannot be read as FTS5 operators; the last one matches as a prefix
+    match = " ".join(f'"{term}"' for term in terms) + "*"
+    params = [match, *scope]
+    placeholders = ", ".join(["%s"] * len(scope))
+    sql = f"""
+        SELECT rowid, score FROM (
+            SELECT rowid, bm25(myapp_search_index) AS score FROM myapp_search_index
+            WHERE myapp_search_index MATCH %s AND conversation IN ({placeholders})
+        ) {_after_clause(after, params)}
+        ORDER BY score, rowid LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return [Hit(*row) for row in cursor.fetchall()]
+
+
+def _postgres_hits(text, scope, after, limit):
+    dm_keys = [c.partition(":")[2] for c in scope if c.startswith("dm:")]
+    group_ids = [int(c.partition(":")[2]) for c in scope if c.startswith("group:")]
+    params = [text, dm_keys, text, group_ids]
+    sql = f"""
+        SELECT rowid, score FROM (
+            SELECT id * 2 AS rowid, -ts_rank_cd(search_vector, query) AS score
+            FROM myapp_message, websearch_to_tsquery('english', %s) query
+            WHERE search_vector @@ query AND conversation = ANY(%s)
+            UNION ALL
+            SELECT id * 2 + 1, -ts_rank_cd(search_vector, query)
+            FROM myapp_groupmessage, websearch_to_tsquery('english', %s) query
+            WHERE search_vector @@ query AND NOT is_deleted AND group_id = ANY(%s)
+        ) hits {_after_clause(after, params)}
+        ORDER BY score, rowid LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return [Hit(rowid, float(score)) for rowid, score in cursor.fetchall()]
+
+
+def _fallback_hits(terms, scope, after, limit):
+    dm_keys = [c.partition(":")[2] for c in scope if c.startswith("dm:")]
+    group_ids = [int(c.partition(":")[2]) for c in scope if c.startswith("group:")]
+    after_id = after.rowid if after else -1
+    direct = Message.objects.filter(conversation__in=dm_keys, id__gt=after_id // 2)
+    grouped = GroupMessage.objects.visible().filter(group_id__in=group_ids, id__gt=after_id // 2)
+    for term in terms:
+        direct = direct.filter(content__icontains=term)
+        grouped = grouped.filter(content__icontains=term)
+    rowids = [i * 2 for i in direct.order_by("id").values_list("id", flat=True)[:limit]]
+    rowids += [i * 2 + 1 for i in grouped.order_by("id").values_list("id", flat=True)[:limit]]
+    return [Hit(rowid, 0.0) for rowid in sorted(r for r in rowids if r > after_id)[:limit]]
+
+
+def _hits(text, terms, scope, after, limit):
+    if not scope:
+        return []
+    if connection.vendor == "sqlite":
+        return _sqlite_hits(terms, scope, after, limit)
+    if connection.vendor == "postgresql":
+        return _postgres_hits(text, scope, after, limit)
+    return _fallback_hits(terms, scope, after, limit)
+
+
+def search(user_id, text, cursor=None, limit=None, conversation=None):
+    """One page of the user's messages matching ``text``, best matches first."""
+    terms = parse_terms(text)
+    after = decode_cursor(cursor) if cursor else None
+    limit = limit or parse_limit(None)
+    scope = accessible_conversations(user_id)
+    if conversation is not None:
+        scope = [c for c in scope if c == conversation]
+
+    hits = _hits(text, terms, scope, after, limit + 1)
+    next_cursor = encode_cursor(hits[limit - 1]) if len(hits) > limit else None
+    hits = hits[:limit]
+
+    direct = Message.objects.select_related("sender", "receiver").in_bulk([h.rowid // 2 for h in hits if not h.rowid & 1])
+    grouped = GroupMessage.objects.visible().select_related("sender").in_bulk([h.rowid // 2 for h in hits if h.rowid & 1])
+    results = []
+    for hit in hits:
+        message = (grouped if hit.rowid & 1 else direct).get(hit.rowid // 2)
+        if message is not None:  # Deleted since the index was read
+            results.append((hit, message))
+    return SearchPage(results, next_cursor)
+
+
+def matching_ids(model, text, limit=ADMIN_MATCH_LIMIT):
+    """Ids of ``model`` rows (Message or GroupMessage) whose content matches, regardless of access (admin)."""
+    terms = parse_terms(text)
+    kind = 1 if model is GroupMessage else 0
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM myapp_search_index WHERE myapp_search_index MATCH %s AND (rowid & 1) = %s "
+                "ORDER BY rank LIMIT %s",
+                [match, kind, limit],
+            )
+            return [rowid // 2 for (rowid,) in cursor.fetchall()]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM {model._meta.db_table} WHERE search_vector @@ websearch_to_tsquery('english', %s) LIMIT %s",
+                [text, limit],
+            )
+            return [message_id for (message_id,) in cursor.fetchall()]
+    queryset = model.objects.all()
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    return list(queryset.values_list("id", flat=True)[:limit])
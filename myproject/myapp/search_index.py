@@ -0,0 +1,87 @@
+"""
+Schema of the SQLite full-text index (see myapp.search).
+
+Migration 0008 created the FTS5 table and its triggers. SQLite cannot alter
+most columns in place, so Django rebuilds a table for such migrations
+(new table, copy, drop, rename), and dropping ``myapp_message`` or
+``myapp_groupmessage`` silently drops their triggers with it. The index
+then stops following new writes without any error.
+
+Migrations that make Django rebuild either table must run ``rebuild()``
+afterwards (``migrations.RunPython(search_index.rebuild_operation)``).
+``manage.py rebuild_search_index`` runs it by hand, and with ``--check`` it
+only reports ``missing()`` triggers.
+
+Kept free of model imports so migrations can use it.
+"""
+INDEX_TABLE = "myapp_search_index"
+
+TRIGGERS = {
+    # Private messages: rowid = id * 2
+    "myapp_message_search_insert": """CREATE TRIGGER myapp_message_search_insert AFTER INSERT ON myapp_message
+    WHEN coalesce(NEW.content, '') <> '' BEGIN
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        VALUES (NEW.id * 2, NEW.content, 'dm:' || NEW.conversation);
+    END""",
+    "myapp_message_search_update": """CREATE TRIGGER myapp_message_search_update AFTER UPDATE OF content, conversation ON myapp_message BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2;
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        SELECT NEW.id * 2, NEW.content, 'dm:' || NEW.conversation WHERE coalesce(NEW.content, '') <> '';
+    END""",
+    "myapp_message_search_delete": """CREATE TRIGGER myapp_message_search_delete AFTER DELETE ON myapp_message BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2;
+    END""",
+    # Group messages: rowid = id * 2 + 1, soft-deleted ones are dropped from the index
+    "myapp_groupmessage_search_insert": """CREATE TRIGGER myapp_groupmessage_search_insert AFTER INSERT ON myapp_groupmessage
+    WHEN coalesce(NEW.content, '') <> '' AND NOT NEW.is_deleted BEGIN
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        VALUES (NEW.id * 2 + 1, NEW.content, 'group:' || NEW.group_id);
+    END""",
+    "myapp_groupmessage_search_update": """CREATE TRIGGER myapp_groupmessage_search_update AFTER UPDATE OF content, group_id, is_deleted ON myapp_groupmessage BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2 + 1;
+        INSERT INTO myapp_search_index(rowid, content, conversation)
+        SELECT NEW.id * 2 + 1, NEW.content, 'group:' || NEW.group_id
+        WHERE coalesce(NEW.content, '') <> '' AND NOT NEW.is_deleted;
+    END""",
+    "myapp_groupmessage_search_delete": """CREATE TRIGGER myapp_groupmessage_search_delete AFTER DELETE ON myapp_groupmessage BEGIN
+        DELETE FROM myapp_search_index WHERE rowid = OLD.id * 2 + 1;
+    END""",
+}
+
+REBUILD = [
+    *(f"DROP TRIGGER IF EXISTS {name}" for name in TRIGGERS),
+    f"DROP TABLE IF EXISTS {INDEX_TABLE}",
+    f"""CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5(
+        content, conversation UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    *TRIGGERS.values(),
+    f"""INSERT INTO {INDEX_TABLE}(rowid, content, conversation)
+    SELECT id * 2, content, 'dm:' || conversation FROM myapp_message WHERE coalesce(content, '') <> ''""",
+    f"""INSERT INTO {INDEX_TABLE}(rowid, content, conversation)
+    SELECT id * 2 + 1, content, 'group:' || group_id FROM myapp_groupmessage
+    WHERE coalesce(content, '') <> '' AND NOT is_deleted""",
+]
+
+
+def missing(connection):
+    """Names of index triggers (or the table) that do not exist; always empty off SQLite."""
+    if connection.vendor != "sqlite":
+        return []  # PostgreSQL's generated columns survive ALTER TABLE
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        present = {name for (name,) in cursor.fetchall()}
+    return [name for name in (INDEX_TABLE, *TRIGGERS) if name not in present]
+
+
+def rebuild(connection):
+    """Recreate the index table and its triggers and refill it from both message tables (SQLite only)."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for statement in REBUILD:
+            cursor.execute(statement)
+
+
+def rebuild_operation(apps, schema_editor):
+    """``RunPython`` callable for migrations that rebuild a message table."""
+    rebuild(schema_editor.connection)
@@ -2,9 +2,24 @@ from rest_framework import serializers
 from django.core.files.storage import default_storage
 from django.db.models import Q
 from django.utils.dateformat import format
-import random
 from django.contrib.auth.hashers import make_password
-from .models import CustomUser, Message, ChatGroup, GroupMessage
+from .downloads import signed_url
+from .storage import display_name
+from .inbox import serialize_entry, unread_count
+from .thumbnails import thumbnail_urls
+from .usernames import base_for, save_with_unique_username
+from .models import CustomUser, Message, ChatGroup, DeletionJob, GroupMessage, UploadSession
+
+def attachment_name(message):
+    return display_name(message.file.name, message.original_name) if message.file else None
+
+
+def attachment_download_url(kind, message, request):
+    """Access-checked, signed URL of a message's file for the requesting user (see myapp.downloads)."""
+    if not message.file or request is None or not request.user.is_authenticated:
+        return None
+    return signed_url(kind, message.id, request.user.id, request)
+
 
 # ✅ Chat Group Serializer
 class ChatGroupSerializer(serializers.ModelSerializer):
@@ -12,10 +27,23 @@ class ChatGroupSerializer(serializers.ModelSerializer):
     members = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all(), many=True, required=False)
     icon = serializers.ImageField(required=False)
     updated_at = serializers.DateTimeField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+    thumbnail_urls = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatGroup
-        fields = ["id", "name", "icon", "members", "admin", "created_at", "updated_at"]
+        fields = ["id", "name", "icon", "members", "admin", "created_at", "updated_at", "last_message", "unread_count", "thumbnail_urls"]
+
+    def get_last_message(self, obj):
+        entries = self.context.get("inbox")
+        return serialize_entry(entries.get(obj.id)) if entries is not None else None
+
+    def get_unread_count(self, obj):
+        return unread_count(self.context.get("inbox"), obj.id)
+
+    def get_thumbnail_urls(self, obj):
+        return thumbnail_urls(obj.icon, self.context.get("request"))
 
     def create(self, validated_data):
         request = self.context.get("request")
@@ -31,15 +59,27 @@ class ChatGroupSerializer(serializers.ModelSerializer):
         return chat_group
 
 
+class CompactChatGroupSerializer(ChatGroupSerializer):
+    """Listing variant with a member count instead of the member ids (needs a ``member_count`` annotation)."""
+    members = None
+    member_count = serializers.IntegerField(read_only=True)
+
+    class Meta(ChatGroupSerializer.Meta):
+        fields = [field for field in ChatGroupSerializer.Meta.fields if field != "members"] + ["member_count"]
+
+
 # ✅ Group Message Serializer
 class GroupMessageSerializer(serializers.ModelSerializer):
     sender_id = serializers.ReadOnlyField(source="sender.id")  # ✅ Ensure sender ID is included
     sender_name = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
+    file_name = serializers.SerializerMethodField()
+    thumbnail_urls = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
 
     class Meta:
         model = GroupMessage
-        fields = ["id", "group", "sender", "sender_id", "sender_name", "content", "file", "file_url", "timestamp"]
+        fields = ["id", "group", "sender", "sender_id", "sender_name", "content", "file", "file_url", "file_name", "thumbnail_urls", "download_url", "timestamp"]
 
     def get_sender_name(self, obj):
         return obj.sender.get_full_name().strip() or obj.sender.username
@@ -51,36 +91,52 @@ class GroupMessageSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(file_url) if request else default_storage.url(obj.file.name)
         return None
 
+    def get_file_name(self, obj):
+        return attachment_name(obj)
+
+    def get_thumbnail_urls(self, obj):
+        return thumbnail_urls(obj.file, self.context.get("request"))
+
+    def get_download_url(self, obj):
+        return attachment_download_url("group", obj, self.context.get("request"))
+
 
 
 # ✅ User Serializer
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+    thumbnail_urls = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'password', 'profile_picture', 'last_message']
+        fields = ['id', 'username', 'email', 'password', 'profile_picture', 'last_message', 'unread_count', 'thumbnail_urls']
 
     def create(self, validated_data):
         profile_picture = validated_data.pop('profile_picture', None)
         email = validated_data['email']
-        username = validated_data.get('username') or email.split('@')[0]
 
-        # Ensure username uniqueness
-        while CustomUser.objects.filter(username=username).exists():
-            username = f"{username}{random.randint(1000, 9999)}"
-
-        user = CustomUser(username=username, email=email)
+        user = CustomUser(email=email)
         user.password = make_password(validated_data['password'])
         if profile_picture:
             user.profile_picture = profile_picture
-        user.save()
-        return user
+        # Ensure username uniqueness
+        return save_with_unique_username(user, base_for(email, validated_data.get('username')))
 
     def get_last_message(self, obj):
-        last_message = Message.objects.filter(Q(sender=obj) | Q(receiver=obj))\
-            .select_related('sender', 'receiver').order_by('-timestamp').first()
+        entries = self.context.get("inbox")
+        if entries is not None:
+            # Precomputed by the caller from the requester's InboxEntry rows
+            return serialize_entry(entries.get(obj.id))
+
+        request = self.context.get("request")
+        if request and request.user.is_authenticated:
+            # Last message of the conversation with the requesting user
+            messages = Message.objects.filter(conversation=Message.conversation_key(request.user.id, obj.id))
+        else:
+            messages = Message.objects.filter(Q(sender=obj) | Q(receiver=obj))
+        last_message = messages.order_by('-timestamp', '-id').first()
 
         if last_message:
             return {
@@ -89,6 +145,12 @@ class UserSerializer(serializers.ModelSerializer):
             }
         return None
 
+    def get_unread_count(self, obj):
+        return unread_count(self.context.get("inbox"), obj.id)
+
+    def get_thumbnail_urls(self, obj):
+        return thumbnail_urls(obj.profile_picture, self.context.get("request"))
+
 
 # ✅ Update Profile Picture Serializer
 class UpdateProfilePictureSerializer(serializers.ModelSerializer):
@@ -104,10 +166,13 @@ class MessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     receiver_username = serializers.CharField(source='receiver.username', read_only=True)
     file_url = serializers.SerializerMethodField()
+    file_name = serializers.SerializerMethodField()
+    thumbnail_urls = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
-        fields = ["id", "sender", "sender_id", "receiver", "receiver_id", "content", "file", "timestamp", "sender_username", "receiver_username", "file_url"]
+        fields = ["id", "sender", "sender_id", "receiver", "receiver_id", "content", "file", "timestamp", "sender_username", "receiver_username", "file_url", "file_name", "thumbnail_urls", "download_url"]
 
     def get_file_url(self, obj):
         if obj.file:
@@ -115,3 +180,30 @@ class MessageSerializer(serializers.ModelSerializer):
             file_url = obj.file.url
             return request.build_absolute_uri(file_url) if request else default_storage.url(obj.file.name)
         return None
+
+    def get_file_name(self, obj):
+        return attachment_name(obj)
+
+    def get_thumbnail_urls(self, obj):
+        return thumbnail_urls(obj.file, self.context.get('request'))
+
+    def get_download_url(self, obj):
+        return attachment_download_url("dm", obj, self.context.get('request'))
+
+
+# ✅ Upload Session Serializer
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source="received", read_only=True)  # Where the next chunk starts
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$", required=False, allow_blank=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "sha256", "offset", "status", "created_at"]
+        read_only_fields = ["id", "status", "created_at"]
+
+# ✅ Deletion Job Serializer
+class DeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ["id", "kind", "target_id", "status", "stage", "total_rows", "deleted_rows", "error", "created_at", "finished_at"]
+        read_only_fields = fields
@@ -0,0 +1,164 @@
+import os
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import archive, conversations, inbox, listings, membership, realtime, storage, thumbnails, user_cache
+from .models import ArchiveSegment, ChatGroup, CustomUser, GroupMessage, Message, Tombstone
+
+
+# ✅ Keep inbox summaries in sync with messages; deletions leave tombstones for delta sync
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if created:
+        inbox.record_direct_messages([instance])
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    inbox.direct_message_removed(instance)
+    Tombstone.objects.create(conversation=conversations.dm_id(instance.conversation), message_id=instance.id)
+
+
+@receiver(post_save, sender=GroupMessage)
+def group_message_saved(sender, instance, created, **kwargs):
+    if created:
+        inbox.record_group_messages([instance])
+
+
+@receiver(post_delete, sender=GroupMessage)
+def group_message_deleted(sender, instance, **kwargs):
+    if instance.is_deleted:
+        return  # Compacted: soft_delete already wrote its tombstone and fixed the inbox
+    inbox.group_message_removed(instance)
+    Tombstone.objects.create(conversation=conversations.group_id(instance.group_id), message_id=instance.id)
+
+
+# ✅ Membership changes update group inbox entries, the membership cache and live sockets
+@receiver(m2m_changed, sender=ChatGroup.members.through)
+def group_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Forward (group.members.add) gives a group and user ids; reverse (user.chat_groups.add) the opposite
+    if action == "pre_clear":
+        if reverse:
+            instance._cleared_group_ids = list(instance.chat_groups.values_list("id", flat=True))
+            inbox.remove_group_entries_for_user(instance.id)
+        else:
+            instance._cleared_member_ids = membership.member_ids(instance.id)
+            inbox.remove_group_members(instance.id)
+    elif action == "post_clear":
+        if reverse:
+            group_ids = getattr(instance, "_cleared_group_ids", [])
+            membership.invalidate(*group_ids)
+            for group_id in group_ids:
+                realtime.membership_revoked(group_id, [instance.id])
+        else:
+            membership.invalidate(instance.id)
+            realtime.membership_revoked(instance.id, getattr(instance, "_cleared_member_ids", []))
+    elif action in ("post_add", "post_remove"):
+        update = inbox.add_group_members if action == "post_add" else inbox.remove_group_members
+        change = "added" if action == "post_add" else "removed"
+        # members.changed also subscribes and drops the affected users' sockets: no per-user events
+        if reverse:
+            for group_id in pk_set:
+                update(group_id, [instance.id])
+                realtime.members_changed(group_id, **{change: [instance.id]})
+            membership.invalidate(*pk_set)
+        elif pk_set:
+            update(instance.id, pk_set)
+            realtime.members_changed(instance.id, **{change: pk_set})
+            membership.invalidate(instance.id)
+
+
+@receiver(pre_delete, sender=ChatGroup)
+def group_deleting(sender, instance, **kwargs):
+    # Deleting the group removes the through rows without m2m_changed; remember who to notify
+    instance._deleted_member_ids = membership.member_ids(instance.id)
+
+
+@receiver(post_delete, sender=ChatGroup)
+def group_deleted(sender, instance, **kwargs):
+    membership.invalidate(instance.id)
+    realtime.membership_revoked(instance.id, getattr(instance, "_deleted_member_ids", []))
+
+
+# ✅ Cached group listings: members see renames, new icons and member changes (see myapp/listings.py)
+@receiver(m2m_changed, sender=ChatGroup.members.through)
+def group_listing_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Runs after group_members_changed, so member_ids() already reflects the change
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        group_ids = getattr(instance, "_cleared_group_ids", []) if action == "post_clear" else pk_set
+        user_ids = {instance.id}.union(*(membership.member_ids(group_id) for group_id in group_ids))
+    else:
+        former = getattr(instance, "_cleared_member_ids", ()) if action == "post_clear" else pk_set
+        user_ids = set(membership.member_ids(instance.id)) | set(former)
+    listings.bump(*user_ids)
+
+
+@receiver(post_save, sender=ChatGroup)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        listings.bump(*membership.member_ids(instance.id))
+
+
+@receiver(post_delete, sender=ChatGroup)
+def group_listing_deleted(sender, instance, **kwargs):
+    listings.bump(*getattr(instance, "_deleted_member_ids", ()))
+
+
+# ✅ Cached user records used by authentication (see myapp/user_cache.py)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
+
+
+# ✅ Thumbnails for uploaded images, rendered in the background after commit
+IMAGE_FIELDS = {Message: "file", GroupMessage: "file", CustomUser: "profile_picture", ChatGroup: "icon"}
+
+
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    field = IMAGE_FIELDS[sender]
+    if update_fields is None or field in update_fields:
+        thumbnails.schedule(getattr(instance, field))
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(image_saved, sender=model, dispatch_uid=f"thumbnails_{model.__name__}")
+
+
+# ✅ Reference counts of deduplicated attachments (see myapp/storage.py)
+def attachment_replacing(sender, instance, **kwargs):
+    if not instance.file or instance.file._committed:
+        return
+    # Storing renames the upload to its hash, so keep the name it came with
+    instance.original_name = os.path.basename(instance.file.name)[:255]
+    instance._stored_file = True  # DedupStorage.adopt() takes its reference
+    # A new upload on an existing row releases the blob it replaces
+    if not instance._state.adding:
+        instance._replaced_file = sender.objects.filter(pk=instance.pk).values_list("file", flat=True).first()
+
+
+def attachment_saved(sender, instance, created, **kwargs):
+    stored = instance.__dict__.pop("_stored_file", False)
+    replaced = instance.__dict__.pop("_replaced_file", None)
+    if created and instance.file and not stored:
+        storage.add_reference(instance.file.name)  # Points at an existing blob, e.g. a claimed upload
+    storage.release(replaced)
+
+
+def attachment_deleted(sender, instance, **kwargs):
+    storage.release(instance.file.name)
+
+
+for model in (Message, GroupMessage):
+    pre_save.connect(attachment_replacing, sender=model, dispatch_uid=f"blob_replacing_{model.__name__}")
+    post_save.connect(attachment_saved, sender=model, dispatch_uid=f"blob_saved_{model.__name__}")
+    post_delete.connect(attachment_deleted, sender=model, dispatch_uid=f"blob_deleted_{model.__name__}")
+
+
+# ✅ Archive segments hold references too; deleting one releases them and removes its file (see myapp/archive.py)
+@receiver(post_delete, sender=ArchiveSegment)
+def archive_segment_deleted(sender, instance, **kwargs):
+    archive.segment_deleted(instance)
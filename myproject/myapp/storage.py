@@ -0,0 +1,143 @@
+"""
+Content-addressed storage for message attachments.
+
+``DedupStorage`` hashes an upload while streaming it to a temporary file
+and stores it as ``blobs/<first two hex digits>/<sha256><ext>``. A second
+upload of the same bytes finds the blob already there and only gets its
+name back, instead of Django's renamed copy (``report_AbC123.zip``).
+
+Blob names say nothing about the upload, so messages keep the uploader's
+file name in ``original_name``; ``display_name()`` is what clients and
+downloads show.
+
+The file is shared, so it may only go once nothing points at it. The
+``StoredBlob`` table keeps a reference count per blob. ``adopt()`` takes the
+reference for the upload it stores; the signal receivers in
+``myapp.signals`` add one for rows that point at an existing blob and
+``release()`` them. A blob whose count drops to zero keeps its row until
+``delete_unreferenced()`` runs after commit. That deletes the row, the file
+and its thumbnails only while the count is still zero, under the row lock
+that ``adopt()`` also takes before it reuses a file, so an upload of the
+same bytes racing with the last release either finds the file gone and
+stores it again, or keeps it. ``manage.py dedup_media`` converts the existing upload folders.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import thumbnails
+
+BLOB_PREFIX = "blobs/"
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,10}", extension):
+        extension = ""
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}{extension}"
+
+
+def display_name(name, original_name=None):
+    """File name to show for an attachment stored as ``name``."""
+    return original_name or os.path.basename(name)
+
+
+class DedupStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        return name  # _save picks the final name from the content
+
+    def _save(self, name, content):
+        tmp_dir = self.path(f"{BLOB_PREFIX}tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            try:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+
+        return self.adopt(tmp.name, name, digest.hexdigest())
+
+    def adopt(self, path, original_name, digest):
+        """
+        Move a local file whose SHA-256 is ``digest`` into place; returns its
+        storage name. The caller owns one reference to it.
+        """
+        stored_name = blob_name(digest, original_name)
+        with transaction.atomic():
+            # Referenced first: from here on delete_unreferenced() leaves the file alone
+            add_reference(stored_name, size=os.path.getsize(path))
+            if self.exists(stored_name):
+                os.unlink(path)  # Same bytes are already stored
+            else:
+                os.makedirs(os.path.dirname(self.path(stored_name)), exist_ok=True)
+                os.replace(path, self.path(stored_name))
+                if self.file_permissions_mode is not None:
+                    os.chmod(self.path(stored_name), self.file_permissions_mode)
+        return stored_name
+
+
+_storage = DedupStorage()
+
+
+def dedup_storage():
+    """Callable passed to ``FileField(storage=...)``, so migrations do not serialize the instance."""
+    return _storage
+
+
+def add_reference(name, size=None):
+    """Count one more reference; the update holds the blob's row lock until the transaction ends."""
+    from .models import StoredBlob
+
+    if not name or not name.startswith(BLOB_PREFIX):
+        return
+    while not StoredBlob.objects.filter(name=name).update(ref_count=F("ref_count") + 1):
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(name=name, size=_size(name) if size is None else size, ref_count=1)
+            return
+        except IntegrityError:
+            continue  # Created concurrently: count on that row
+
+
+def release(name, count=1):
+    """Drop ``count`` references; the file is deleted after commit once the last one is gone."""
+    from .models import StoredBlob
+
+    if not name or not name.startswith(BLOB_PREFIX):
+        return
+    StoredBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=Greatest(F("ref_count") - count, 0))
+    if StoredBlob.objects.filter(name=name, ref_count=0).exists():
+        transaction.on_commit(lambda: delete_unreferenced(name), robust=True)
+
+
+def delete_unreferenced(name):
+    """Remove a blob and its row if its reference count is (still) zero."""
+    from .models import StoredBlob
+
+    with transaction.atomic():
+        # Waits for a concurrent adopt() of the same bytes and then sees its reference
+        blob = StoredBlob.objects.select_for_update().filter(name=name, ref_count=0).first()
+        if blob is None:
+            return
+        blob.delete()
+        _storage.delete(name)  # Before commit: an adopt() waiting on the row then stores the file again
+        thumbnails.delete(name, _storage)
+
+
+def _size(name):
+    try:
+        return _storage.size(name)
+    except OSError:
+        return 0
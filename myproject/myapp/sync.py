@@ -0,0 +1,120 @@
+"""
+Delta sync for reconnecting clients.
+
+The client sends the id of the newest message it holds per conversation
+(``{"dm:1_2": 120, "group:3": 40}``, ids from myapp.conversations) and the
+tombstone cursor of its previous sync. It gets back only what changed: newer
+messages oldest first, the ids of deleted messages it may still show, and the
+conversations it did not ask about that have messages. Inbox entries tell
+which conversations moved, so the message tables are only read for those.
+
+Responses are bounded: ``limit`` messages per conversation and
+``MAX_MESSAGES`` overall, flagged with ``has_more``. The client pages by
+syncing again with the ids it just received.
+"""
+from django.db.models import Q
+
+from . import conversations
+from .models import GroupMessage, InboxEntry, Message, Tombstone
+from .pagination import CursorError, parse_limit
+from .serializers import GroupMessageSerializer, MessageSerializer
+
+MAX_CONVERSATIONS = 100   # Conversations per request
+MAX_MESSAGES = 500        # Messages per response, across conversations
+MAX_TOMBSTONES = 1000     # Deleted ids per response
+
+
+class SyncError(ValueError):
+    """Raised when a sync request is malformed."""
+
+
+def parse_request(data):
+    """``(last_seen, tombstones_after, limit)`` from a REST body or a WebSocket frame."""
+    last_seen = data.get("conversations")
+    if not isinstance(last_seen, dict):
+        raise SyncError("'conversations' must map conversation ids to the last seen message id.")
+    if len(last_seen) > MAX_CONVERSATIONS:
+        raise SyncError(f"At most {MAX_CONVERSATIONS} conversations per sync.")
+    try:
+        last_seen = {str(conversation): int(message_id or 0) for conversation, message_id in last_seen.items()}
+        tombstones_after = int(data.get("tombstones_after") or 0)
+        limit = parse_limit(data.get("limit"))
+    except (TypeError, ValueError) as e:
+        raise SyncError(str(e) if isinstance(e, CursorError) else "Message ids and cursors must be integers.")
+    return last_seen, tombstones_after, limit
+
+
+def _messages(user_id, target):
+    kind, target_id = target
+    if kind == "dm":
+        return Message.objects.filter(
+            conversation=Message.conversation_key(user_id, target_id)
+        ).select_related("sender", "receiver"), MessageSerializer
+    return GroupMessage.objects.visible().filter(group_id=target_id).select_related("sender"), GroupMessageSerializer
+
+
+def _inbox(user_id):
+    """The user's inbox entries keyed by conversation id."""
+    entries = {}
+    for entry in InboxEntry.objects.filter(owner_id=user_id):
+        target = ("group", entry.group_id) if entry.group_id else ("dm", entry.counterpart_id)
+        entries[conversations.from_target(user_id, target)] = entry
+    return entries
+
+
+def _tombstones(last_seen, after):
+    """Deletions of messages the client may hold, i.e. ids up to what it has seen."""
+    if not last_seen:
+        return [], False
+    scope = Q()
+    for conversation, message_id in last_seen.items():
+        scope |= Q(conversation=conversation, message_id__lte=message_id)
+    rows = list(
+        Tombstone.objects.filter(scope, id__gt=after).order_by("id").values("id", "conversation", "message_id")[:MAX_TOMBSTONES + 1]
+    )
+    return rows[:MAX_TOMBSTONES], len(rows) > MAX_TOMBSTONES
+
+
+def sync(user_id, last_seen, tombstones_after=0, limit=None, context=None):
+    """Everything that changed in the user's conversations since ``last_seen``, ready to render."""
+    limit = limit or parse_limit(None)
+    targets = {conversation: conversations.to_target(user_id, conversation) for conversation in last_seen}
+    allowed = {conversation: target for conversation, target in targets.items() if target is not None}
+    entries = _inbox(user_id)
+
+    changed = {}
+    budget = MAX_MESSAGES
+    for conversation, target in allowed.items():
+        entry = entries.get(conversation)
+        if entry is None or (entry.last_message_id or 0) <= last_seen[conversation]:
+            continue  # Nothing newer than what the client holds
+        if budget <= 0:
+            changed[conversation] = {"messages": [], "has_more": True}
+            continue
+        take = min(limit, budget)
+        queryset, serializer_class = _messages(user_id, target)
+        rows = list(queryset.filter(id__gt=last_seen[conversation]).order_by("id")[:take + 1])
+        budget -= len(rows[:take])
+        changed[conversation] = {
+            "messages": serializer_class(rows[:take], many=True, context=context or {}).data,
+            "has_more": len(rows) > take,
+        }
+
+    tombstones, more_tombstones = _tombstones({c: last_seen[c] for c in allowed}, tombstones_after)
+    deleted = {}
+    for tombstone in tombstones:
+        deleted.setdefault(tombstone["conversation"], []).append(tombstone["message_id"])
+
+    return {
+        "conversations": changed,
+        "deleted": deleted,
+        "tombstones_after": tombstones[-1]["id"] if tombstones else tombstones_after,
+        "has_more": more_tombstones or any(page["has_more"] for page in changed.values()),
+        # Conversations the client did not mention but has messages in
+        "other_conversations": [
+            {"conversation": conversation, "last_message_id": entry.last_message_id, "unread_count": entry.unread_count}
+            for conversation, entry in entries.items()
+            if conversation not in last_seen and entry.last_message_id
+        ],
+        "forbidden": [conversation for conversation, target in targets.items() if target is None],
+    }
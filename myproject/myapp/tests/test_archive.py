@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from myapp import archive, storage
+from myapp.models import ArchiveSegment, GroupMessage, StoredBlob
+from myapp.pagination import AFTER_HEADER, BEFORE_HEADER
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_group, make_user
+
+
+class ArchiveTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(MESSAGE_ARCHIVE={"DIR": directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+        self.group = make_group("g", self.alice, self.bob)
+        self.client = api_client(self.bob)
+        self.url = f"/api/groups/{self.group.id}/messages/"
+        now = timezone.now()
+        self.messages = []
+        # Two old months, then recent messages
+        for i, age in enumerate([timedelta(days=440)] * 3 + [timedelta(days=400)] * 4 + [timedelta(hours=1)] * 3):
+            message = GroupMessage.objects.create(group=self.group, sender=self.alice, content=f"m{i}")
+            GroupMessage.objects.filter(pk=message.pk).update(timestamp=now - age + timedelta(minutes=i))
+            self.messages.append(message)
+        self.attached = GroupMessage.objects.create(
+            group=self.group, sender=self.alice, file=ContentFile(b"old file", name="report.pdf")
+        )
+        GroupMessage.objects.filter(pk=self.attached.pk).update(timestamp=now - timedelta(days=400, hours=1))
+        self.expected = list(GroupMessage.objects.order_by("-timestamp", "-id").values_list("id", flat=True))
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_moves_old_messages_into_segments_per_month(self):
+        self.assertEqual(archive.archive(batch_size=3), (3, 8))  # 3 + (3 + 2) over two months
+        self.assertEqual(GroupMessage.objects.count(), 3)
+        self.assertEqual(
+            sorted(ArchiveSegment.objects.values_list("message_count", flat=True)), [2, 3, 3]
+        )
+        segment = ArchiveSegment.objects.order_by("min_id").first()
+        self.assertTrue(segment.path.endswith(".jsonl.gz"))
+        self.assertEqual([row["content"] for row in archive.read(segment)], ["m0", "m1", "m2"])
+        self.assertEqual(archive.archive(), (0, 0))
+
+    def test_history_pages_continue_into_the_archive(self):
+        archive.archive(batch_size=3)
+        for limit in (50, 4, 1):
+            pages, cursor = [], None
+            while True:
+                response = self.page(limit=limit, **({"before": cursor} if cursor else {}))
+                pages.append(response.json())
+                if not (cursor := response.headers.get(BEFORE_HEADER)):
+                    break
+            self.assertEqual([message["id"] for page in pages for message in page], self.expected)
+        self.assertEqual(pages[-1][0]["sender_name"], "alice")  # Filled in from the user table
+
+        # Polling from the oldest archived message walks forward through the segments
+        newer = self.page(after=response.headers[AFTER_HEADER])
+        self.assertEqual([message["id"] for message in newer.json()], self.expected[:-1])
+
+    def test_archived_attachments_stay_downloadable_until_the_segment_goes(self):
+        name = self.attached.file.name
+        archive.archive()
+        self.assertFalse(GroupMessage.objects.filter(pk=self.attached.pk).exists())
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+
+        response = self.client.get(f"/api/attachments/group/{self.attached.id}/")
+        self.assertEqual((response.status_code, b"".join(response.streaming_content)), (200, b"old file"))
+        self.assertIn("report.pdf", response["Content-Disposition"])
+        response.close()
+        self.assertEqual(api_client(make_user("carol")).get(f"/api/attachments/group/{self.attached.id}/").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ArchiveSegment.objects.all().delete()
+        self.assertIsNone(StoredBlob.objects.filter(name=name, ref_count__gt=0).first())
+        self.assertFalse(storage.dedup_storage().exists(name))
+
+    def test_zstd_needs_the_optional_package(self):
+        with override_settings(MESSAGE_ARCHIVE={**archive.DEFAULTS, "DIR": archive.get_setting("DIR"), "COMPRESSION": "zstd"}):
+            with mock.patch("myapp.archive.zstandard", None), self.assertRaises(ImproperlyConfigured):
+                archive.archive()
+        self.assertEqual(GroupMessage.objects.count(), len(self.expected))
+        self.assertFalse(ArchiveSegment.objects.exists())
+
+    def test_command_reports_segments(self):
+        out = StringIO()
+        call_command("archive_messages", stdout=out)
+        self.assertIn("Archived 8 messages in 2 segments.", out.getvalue())
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.utils import timezone
+
+from myapp import compaction, storage
+from myapp.models import GroupMessage, InboxEntry, OutboxEvent, StoredBlob, Tombstone
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_group, make_user
+
+
+class SoftDeleteTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+        self.group = make_group("g", self.alice, self.bob)
+        self.client = api_client(self.alice)
+
+    def delete(self, message, client=None):
+        return (client or self.client).delete(f"/api/delete_group_message/{message.id}/")
+
+    def test_hides_the_message_once(self):
+        kept = GroupMessage.objects.create(group=self.group, sender=self.alice, content="kept")
+        message = GroupMessage.objects.create(group=self.group, sender=self.alice, content="oops")
+        self.assertEqual(self.delete(message, api_client(self.bob)).status_code, 403)
+        self.assertEqual(self.delete(message).status_code, 200)
+        self.assertEqual(self.delete(message).status_code, 404)
+        self.assertFalse(compaction.soft_delete(message))
+
+        message.refresh_from_db()
+        self.assertTrue(message.is_deleted)
+        self.assertEqual(list(GroupMessage.objects.visible().values_list("id", flat=True)), [kept.id])
+        self.assertEqual(list(Tombstone.objects.values_list("conversation", "message_id")), [(f"group:{self.group.id}", message.id)])
+        event = OutboxEvent.objects.get(payload__id=message.id)
+        self.assertEqual(event.groups, [[f"group_chat_{self.group.id}", "message.deleted"]])
+
+        entry = InboxEntry.objects.get(owner=self.bob, group=self.group)
+        self.assertEqual((entry.unread_count, entry.last_message_id), (1, kept.id))
+
+
+class CompactTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.group = make_group("g", self.alice)
+
+    def deleted(self, data, age):
+        message = GroupMessage.objects.create(group=self.group, sender=self.alice, file=ContentFile(data, name="a.txt"))
+        compaction.soft_delete(message)
+        GroupMessage.objects.filter(id=message.id).update(deleted_at=timezone.now() - age)
+        return message
+
+    def test_removes_old_rows_and_tombstones(self):
+        retention = timedelta(seconds=compaction.get_setting("RETENTION"))
+        old = [self.deleted(data, retention * 2) for data in (b"one", b"two", b"one")]
+        recent = self.deleted(b"recent", retention / 2)
+        Tombstone.objects.filter(message_id=old[0].id).update(
+            deleted_at=timezone.now() - timedelta(seconds=compaction.get_setting("TOMBSTONE_RETENTION") + 1)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(compaction.compact(batch_size=2), (3, 1))
+        self.assertEqual(list(GroupMessage.objects.values_list("id", flat=True)), [recent.id])
+        # Compaction writes no tombstones of its own
+        self.assertEqual(sorted(Tombstone.objects.values_list("message_id", flat=True)), [old[1].id, old[2].id, recent.id])
+        self.assertEqual(list(StoredBlob.objects.filter(ref_count__gt=0).values_list("name", flat=True)), [recent.file.name])
+        self.assertFalse(storage.dedup_storage().exists(old[0].file.name))
+
+    def test_command_reports_progress(self):
+        self.deleted(b"x", timedelta(days=365))
+        out = StringIO()
+        call_command("compact_messages", pause=0, stdout=out)
+        self.assertIn("Removed 1 deleted messages and 0 tombstones.", out.getvalue())
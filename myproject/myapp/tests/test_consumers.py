@@ -0,0 +1,84 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+
+from myapp import conversations, deletion
+from myapp.models import Message
+
+from .utils import ChannelsTestCase, make_group, make_user
+
+
+class RoomAuthorizationTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        self.dm_room = f"/ws/chat/{Message.conversation_key(self.alice.id, self.bob.id)}/"
+
+    async def test_rooms_admit_only_their_participants(self):
+        self.assertEqual(await self.connect(self.dm_room, expect=False), 4401)
+        self.assertEqual(await self.connect(self.dm_room, self.carol, expect=False), 4403)
+        self.assertEqual(await self.connect(f"/ws/group/{self.group.id}/", self.carol, expect=False), 4403)
+        self.assertEqual(await self.connect("/ws/chat/not_a_key/", self.alice, expect=False), 4403)
+
+        for path in (self.dm_room, f"/ws/group/{self.group.id}/"):
+            communicator = await self.connect(path, self.bob)
+            await communicator.disconnect()
+
+    async def test_dm_rooms_need_a_live_counterpart(self):
+        await database_sync_to_async(deletion.delete_account)(self.carol)
+        for other_id in (self.carol.id, 999999):
+            room = f"/ws/chat/{Message.conversation_key(self.alice.id, other_id)}/"
+            self.assertEqual(await self.connect(room, self.alice, expect=False), 4403)
+
+    async def test_removed_member_is_disconnected(self):
+        communicator = await self.connect(f"/ws/group/{self.group.id}/", self.bob)
+        await database_sync_to_async(self.group.members.remove)(self.bob)
+        while (frame := await communicator.receive_output(2))["type"] != "websocket.close":
+            pass
+        self.assertEqual(frame["code"], 4403)
+        await communicator.wait()
+
+
+class StreamConsumerTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        self.dm = conversations.from_target(self.alice.id, ("dm", self.bob.id))
+
+    async def test_one_socket_carries_dms_and_groups(self):
+        alice = await self.connect("/ws/stream/", self.alice)
+        self.assertEqual((await self.receive_until(alice, "subscribed"))["conversations"], [f"group:{self.group.id}"])
+        bob = await self.connect("/ws/stream/", self.bob)
+
+        await alice.send_json_to({"action": "send", "conversation": self.dm, "message": "hi", "client_id": "c1"})
+        stored = await self.receive_until(alice, "stored")
+        self.assertEqual(stored["client_id"], "c1")
+        for communicator in (bob, alice):  # The sender's other sockets see it too
+            received = await self.receive_until(communicator, "message")
+            self.assertEqual((received["conversation"], received["id"], received["message"]), (self.dm, stored["id"], "hi"))
+
+        await bob.send_json_to({"action": "send", "conversation": f"group:{self.group.id}", "message": "all"})
+        received = await self.receive_until(alice, "message")
+        self.assertEqual((received["conversation"], received["message"]), (f"group:{self.group.id}", "all"))
+
+        self.assertTrue(await database_sync_to_async(Message.objects.filter(pk=stored["id"], content="hi").exists)())
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_frames_for_other_conversations_are_refused(self):
+        carol = await self.connect("/ws/stream/", self.carol)
+        nobody = f"dm:{Message.conversation_key(self.carol.id, 999999)}"
+        for conversation in (f"group:{self.group.id}", self.dm, "nonsense", nobody):
+            await carol.send_json_to({"action": "send", "conversation": conversation, "message": "x"})
+            self.assertEqual((await self.receive_until(carol, "error"))["conversation"], conversation)
+        await carol.disconnect()
+
+    async def test_broken_frames_are_logged(self):
+        alice = await self.connect("/ws/stream/", self.alice)
+        with self.assertLogs("myapp.consumers", "ERROR") as logs:
+            await alice.send_to(text_data="{not json")
+            await asyncio.sleep(0.2)
+        self.assertIn("Traceback", logs.output[0])
+        await alice.disconnect()
@@ -0,0 +1,51 @@
+from myapp import conversations, deletion
+from myapp.models import Message
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class ConversationKeyTests(ChatTestCase):
+    def test_key_is_order_independent(self):
+        self.assertEqual(Message.conversation_key(9, 10), "9_10")
+        self.assertEqual(Message.conversation_key(10, 9), "9_10")
+        self.assertEqual(Message.conversation_key("2", 11), "2_11")  # Numeric, not string, order
+
+    def test_parse(self):
+        self.assertEqual(Message.parse_conversation_key("2_11"), (2, 11))
+        for key in ("11_2", "2", "a_b", "1_2_3", None):
+            self.assertIsNone(Message.parse_conversation_key(key))
+
+    def test_both_directions_share_the_key(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        there = Message.objects.create(sender=alice, receiver=bob, content="hi")
+        back = Message.objects.create(sender=bob, receiver=alice, content="hello")
+        self.assertEqual(there.conversation, back.conversation)
+        self.assertEqual(
+            [m["id"] for m in api_client(alice).get(f"/api/messages/{bob.id}/").json()],
+            [back.id, there.id],
+        )
+
+    def test_history_query_uses_the_conversation_index(self):
+        plan = Message.objects.filter(conversation="1_2").order_by("-timestamp", "-id").explain()
+        self.assertIn("message_conv_ts_id_idx", plan)
+
+
+class ConversationIdTests(ChatTestCase):
+    def test_targets_resolve_only_for_participants(self):
+        alice, bob, carol = make_user("alice"), make_user("bob"), make_user("carol")
+        group = make_group("g", alice, bob)
+        dm = conversations.from_target(alice.id, ("dm", bob.id))
+
+        self.assertEqual(conversations.to_target(bob.id, dm), ("dm", alice.id))
+        self.assertIsNone(conversations.to_target(carol.id, dm))
+        self.assertEqual(conversations.to_target(bob.id, f"group:{group.id}"), ("group", group.id))
+        self.assertIsNone(conversations.to_target(carol.id, f"group:{group.id}"))
+        for malformed in ("dm:x", "group:x", "channel:1", ""):
+            self.assertIsNone(conversations.to_target(alice.id, malformed))
+
+    def test_dms_need_a_live_counterpart(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        dm = conversations.from_target(alice.id, ("dm", bob.id))
+        self.assertIsNone(conversations.to_target(alice.id, conversations.from_target(alice.id, ("dm", 999999))))
+        deletion.delete_account(bob)
+        self.assertIsNone(conversations.to_target(alice.id, dm))
@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from myapp import conversations, deletion, raw_delete, storage
+from myapp.models import ChatGroup, DeletionJob, GroupMessage, InboxEntry, Message, StoredBlob, Tombstone
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_group, make_user
+
+
+class PurgeTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob, self.carol)
+
+    def post(self, sender, content="", data=None):
+        file = ContentFile(data, name="notes.txt") if data else None
+        return GroupMessage.objects.create(group=self.group, sender=sender, content=content, file=file)
+
+    def purge(self, job, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return deletion.purge(job, **kwargs)
+
+    def references(self, name):
+        return StoredBlob.objects.filter(name=name).values_list("ref_count", flat=True).first()
+
+    def test_a_group_purge_releases_its_blobs_and_leaves_nothing_behind(self):
+        kept = Message.objects.create(sender=self.alice, receiver=self.bob, file=ContentFile(b"shared", name="a.txt"))
+        for data in (b"shared", b"shared", b"only here"):
+            only = self.post(self.alice, data=data)
+        self.post(self.bob, "hi")
+        job = deletion.delete_group(self.group, self.alice)
+
+        self.assertEqual(self.purge(job, batch_size=2).status, DeletionJob.STATUS_DONE)
+        self.assertEqual(job.deleted_rows, 4)
+        self.assertFalse(ChatGroup.objects.filter(id=self.group.id).exists())
+        self.assertFalse(Tombstone.objects.filter(conversation=conversations.group_id(self.group.id)).exists())
+        self.assertEqual(self.references(kept.file.name), 1)
+        self.assertIsNone(self.references(only.file.name))
+        self.assertFalse(storage.dedup_storage().exists(only.file.name))
+
+    def test_queries_do_not_grow_with_the_messages(self):
+        def queries(count):
+            group = make_group(f"g{count}", self.alice, self.bob)
+            GroupMessage.objects.bulk_create(GroupMessage(group=group, sender=self.bob, content="x") for _ in range(count))
+            job = deletion.delete_group(group, self.alice)
+            with CaptureQueriesContext(connection) as captured:
+                self.purge(job, batch_size=100)
+            return len(captured)
+
+        self.assertEqual(queries(3), queries(30))
+
+    def test_raw_deletes_go_in_chunks(self):
+        ids = [self.post(self.bob, f"m{i}").id for i in range(5)]
+        with mock.patch("myapp.raw_delete.CHUNK_SIZE", 2):
+            self.assertEqual(raw_delete.delete_ids(GroupMessage, ids[1:] + [999999]), 4)
+        self.assertEqual(list(GroupMessage.objects.values_list("id", flat=True)), ids[:1])
+
+    def test_an_account_purge_fixes_what_the_others_still_see(self):
+        first = self.post(self.bob, "from bob")
+        gone = [self.post(self.alice, text) for text in ("one", "two")]
+        dm = Message.objects.create(sender=self.alice, receiver=self.bob, content="dm")
+        entry = InboxEntry.objects.get(owner=self.carol, group=self.group)
+        self.assertEqual((entry.unread_count, entry.last_message_id), (3, gone[-1].id))
+
+        self.purge(deletion.delete_account(self.alice, self.alice))
+        entry.refresh_from_db()
+        self.assertEqual((entry.unread_count, entry.last_message_id), (1, first.id))
+        self.assertEqual(list(GroupMessage.objects.values_list("id", flat=True)), [first.id])
+        self.assertEqual(
+            sorted(Tombstone.objects.values_list("conversation", "message_id")),
+            sorted([(conversations.dm_id(dm.conversation), dm.id)] + [(f"group:{self.group.id}", m.id) for m in gone]),
+        )
+
+    def test_a_failed_purge_resumes(self):
+        for data in (b"one", b"two"):
+            self.post(self.bob, data=data)
+        job = deletion.delete_group(self.group, self.alice)
+        real_release, calls = storage.release, []
+
+        def release(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disk")  # The second batch fails
+            real_release(*args)
+
+        with mock.patch("myapp.deletion.storage.release", side_effect=release):
+            with self.assertRaises(RuntimeError):
+                self.purge(job, batch_size=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted_rows, GroupMessage.objects.count()), (DeletionJob.STATUS_FAILED, 1, 1))
+
+        self.assertEqual(self.purge(job, batch_size=1).status, DeletionJob.STATUS_DONE)
+        self.assertEqual((job.deleted_rows, StoredBlob.objects.filter(ref_count__gt=0).count()), (2, 0))
+
+
+class DeletedAccountTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        deletion.delete_account(self.carol, self.carol)  # Not purged yet
+        self.client = api_client(self.alice)
+
+    def test_deleted_accounts_cannot_be_written_to_or_added(self):
+        response = self.client.post("/api/send_message/", {"content": "hi", "recipient_id": self.carol.id})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post("/api/groups/add_user/", {"group_name": "g", "username": self.carol.username})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f"/api/groups/{self.group.id}/members/add/", {"user_ids": [self.carol.id]}, format="json")
+        self.assertEqual(response.json()["summary"], {"not_found": 1})
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(self.group.members.filter(id=self.carol.id).exists())
@@ -0,0 +1,70 @@
+from django.core.files.base import ContentFile
+from django.test import override_settings
+
+from myapp import downloads
+from myapp.models import GroupMessage, Message
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_group, make_user
+
+DATA = b"abcdefghijklmnopqrstuvwxyz"
+
+
+class DownloadTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.message = Message.objects.create(sender=self.alice, receiver=self.bob, file=ContentFile(DATA, name="abc.txt"))
+        self.url = f"/api/attachments/dm/{self.message.id}/"
+
+    def get(self, url=None, user=None, **headers):
+        response = api_client(user or self.bob).get(url or self.url, **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_whole_file_with_validators(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, DATA))
+        self.assertEqual(response["ETag"], f'"{self.message.file.name.rsplit("/", 1)[1].split(".")[0]}"')
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response, body = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual((response.status_code, body), (304, b""))
+
+    def test_byte_ranges(self):
+        response, body = self.get(HTTP_RANGE="bytes=2-5")
+        self.assertEqual((response.status_code, body, response["Content-Range"]), (206, b"cdef", "bytes 2-5/26"))
+        response, body = self.get(HTTP_RANGE="bytes=-3")
+        self.assertEqual((response.status_code, body), (206, b"xyz"))
+        response, body = self.get(HTTP_RANGE="bytes=20-")
+        self.assertEqual(body, b"uvwxyz")
+        response, _ = self.get(HTTP_RANGE="bytes=30-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */26"))
+
+    def test_a_stale_if_range_gets_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"outdated"')
+        self.assertEqual((response.status_code, body), (200, DATA))
+
+    def test_only_participants_and_members(self):
+        self.assertEqual(self.get(user=self.carol)[0].status_code, 403)
+        group = make_group("g", self.alice, self.bob)
+        shared = GroupMessage.objects.create(group=group, sender=self.alice, file=ContentFile(DATA, name="abc.txt"))
+        url = f"/api/attachments/group/{shared.id}/"
+        self.assertEqual(self.get(url)[0].status_code, 200)
+        group.members.remove(self.bob)
+        self.assertEqual(self.get(url)[0].status_code, 403)
+
+    def test_signed_urls_work_without_a_session(self):
+        url = downloads.signed_url("dm", self.message.id, self.bob.id)
+        response = api_client().get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        other = downloads.signed_url("dm", self.message.id + 1, self.bob.id).split("?")[1]
+        self.assertEqual(api_client().get(f"{self.url}?{other}").status_code, 401)
+
+    @override_settings(ATTACHMENT_DOWNLOADS={"MODE": "x-accel-redirect"})
+    def test_offload_to_the_proxy(self):
+        response, body = self.get()
+        self.assertEqual(body, b"")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.message.file.name}")
+        self.assertEqual(response["Content-Disposition"], 'inline; filename="abc.txt"')
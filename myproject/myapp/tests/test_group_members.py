@@ -0,0 +1,87 @@
+from unittest import mock
+
+from channels.db import database_sync_to_async
+
+from myapp import membership
+from myapp.realtime import user_group_name
+
+from .utils import ChannelsTestCase, ChatTestCase, api_client, make_group, make_user
+
+
+class BulkMembershipTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol, self.dave = (make_user(name) for name in ("alice", "bob", "carol", "dave"))
+        self.group = make_group("g", self.alice, self.bob)
+        self.client = api_client(self.alice)
+
+    def post(self, action, **body):
+        response = self.client.post(f"/api/groups/{self.group.id}/members/{action}/", body, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_add_reports_per_user(self):
+        result = self.post("add", user_ids=[self.carol.id, self.bob.id, 999], usernames=["carol", "dave", "dave"])
+        self.assertEqual(
+            [entry["status"] for entry in result["results"]],
+            ["added", "already_member", "not_found", "duplicate", "added", "added"],
+        )
+        # "dave" twice counts once
+        self.assertEqual(result["summary"], {"added": 2, "already_member": 1, "not_found": 1, "duplicate": 1})
+        self.assertEqual(membership.member_ids(self.group.id), {self.alice.id, self.bob.id, self.carol.id, self.dave.id})
+
+    def test_remove_keeps_the_admin(self):
+        self.group.members.add(self.carol)
+        result = self.post("remove", user_ids=[self.alice.id, self.bob.id, self.carol.id, self.dave.id])
+        self.assertEqual([entry["status"] for entry in result["results"]], ["is_admin", "removed", "removed", "not_member"])
+        self.assertEqual(membership.member_ids(self.group.id), {self.alice.id})
+
+    def test_outsiders_and_bad_requests(self):
+        self.assertEqual(api_client(self.carol).post(f"/api/groups/{self.group.id}/members/add/", {"user_ids": [self.carol.id]}, format="json").status_code, 403)
+        for body in ({}, {"user_ids": "1"}, {"user_ids": ["x"]}):
+            self.assertEqual(self.client.post(f"/api/groups/{self.group.id}/members/add/", body, format="json").status_code, 400)
+
+    def test_a_bulk_change_sends_one_event(self):
+        with mock.patch("myapp.realtime.send_to_groups") as send, self.captureOnCommitCallbacks(execute=True):
+            self.post("add", user_ids=[self.carol.id, self.dave.id])
+        self.assertEqual(send.call_count, 1)
+        groups, event = send.call_args.args
+        room = f"group_chat_{self.group.id}"
+        self.assertEqual(groups, [room, user_group_name(self.carol.id), user_group_name(self.dave.id)])  # Not in the room yet
+        self.assertEqual((event["type"], event["added"], event["removed"]), ("members.changed", sorted([self.carol.id, self.dave.id]), []))
+
+        with mock.patch("myapp.realtime.send_to_groups") as send, self.captureOnCommitCallbacks(execute=True):
+            self.post("remove", user_ids=[self.bob.id, self.carol.id])
+        self.assertEqual(send.call_args_list, [mock.call([room], mock.ANY)])
+
+
+class MembershipEventTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+        self.group = make_group("g", self.alice)
+        self.conversation = f"group:{self.group.id}"
+
+    async def test_stream_sockets_follow_bulk_changes(self):
+        bob = await self.connect("/ws/stream/", self.bob)
+        await database_sync_to_async(self.group.members.add)(self.bob)
+        self.assertEqual((await self.receive_until(bob, "subscribed"))["conversations"], [])
+        self.assertEqual((await self.receive_until(bob, "subscribed"))["conversations"], [self.conversation])
+        self.assertEqual((await self.receive_until(bob, "members"))["added"], [self.bob.id])
+
+        await database_sync_to_async(self.group.members.remove)(self.bob)
+        frame = await self.receive_until(bob, "unsubscribed")
+        self.assertEqual((frame["conversations"], frame["reason"]), ([self.conversation], "revoked"))
+
+        await bob.disconnect()
+
+    async def test_unsubscribed_sockets_cannot_resubscribe_after_removal(self):
+        await database_sync_to_async(self.group.members.add)(self.bob)
+        bob = await self.connect("/ws/stream/", self.bob)
+        await bob.send_json_to({"action": "unsubscribe", "conversation": self.conversation})
+        await self.receive_until(bob, "unsubscribed")
+        await database_sync_to_async(self.group.members.remove)(self.bob)  # Sent to the room only
+
+        await bob.send_json_to({"action": "subscribe", "conversation": self.conversation})
+        self.assertEqual((await self.receive_until(bob, "error"))["conversation"], self.conversation)
+        await bob.disconnect()
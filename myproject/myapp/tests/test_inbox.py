@@ -0,0 +1,87 @@
+from django.utils import timezone
+
+from myapp import compaction, inbox
+from myapp.models import CustomUser, GroupMessage, InboxEntry, Message
+from myapp.pagination import NEXT_HEADER
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class UserListTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.me = make_user("me")
+        self.users = [make_user(f"user{i}") for i in range(6)]
+        # Talked to user3, then user1, then user5 (newest); the rest never
+        for user in (self.users[3], self.users[1], self.users[5]):
+            Message.objects.create(sender=self.me, receiver=user, content="hi")
+        self.client = api_client(self.me)
+
+    def expected(self):
+        u = self.users
+        return [u[5].id, u[1].id, u[3].id, u[0].id, u[2].id, u[4].id]
+
+    def test_most_recent_conversations_first(self):
+        response = self.client.get("/api/users/")
+        self.assertEqual([user["id"] for user in response.json()], self.expected())
+        self.assertNotIn(NEXT_HEADER, response.headers)
+        self.assertEqual(response.json()[0]["last_message"]["text"], "hi")
+        self.assertIsNone(response.json()[3]["last_message"])
+
+    def test_pages_follow_the_cursor(self):
+        for limit in (1, 2, 4):
+            ids, cursor = [], None
+            while True:
+                response = self.client.get("/api/users/", {"limit": limit, **({"cursor": cursor} if cursor else {})})
+                self.assertLessEqual(len(response.json()), limit)
+                ids += [user["id"] for user in response.json()]
+                cursor = response.headers.get(NEXT_HEADER)
+                if not cursor:
+                    break
+            self.assertEqual(ids, self.expected())
+
+    def test_deleted_accounts_and_bad_cursors(self):
+        CustomUser.objects.filter(pk=self.users[5].pk).update(deleted_at=timezone.now())
+        self.assertNotIn(self.users[5].id, [user["id"] for user in self.client.get("/api/users/").json()])
+        self.assertEqual(self.client.get("/api/users/", {"cursor": "garbage"}).status_code, 400)
+
+    def test_page_reads_a_bounded_number_of_queries(self):
+        with self.assertNumQueries(2):  # The ordered page, then its inbox entries
+            self.client.get("/api/users/", {"limit": 2})
+
+
+class ReadStateTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+
+    def entry(self, owner, **target):
+        return InboxEntry.objects.get(owner=owner, **target)
+
+    def test_partial_ack_subtracts_the_acknowledged_messages(self):
+        sent = [Message.objects.create(sender=self.bob, receiver=self.alice, content=f"m{i}") for i in range(5)]
+        Message.objects.create(sender=self.alice, receiver=self.bob, content="own")  # Marks bob's 5 read for alice
+        more = [Message.objects.create(sender=self.bob, receiver=self.alice, content=f"n{i}") for i in range(4)]
+        self.assertEqual(self.entry(self.alice, counterpart=self.bob).unread_count, 4)
+
+        self.assertEqual(inbox.mark_read(self.alice.id, "dm", self.bob.id, more[1].id), (more[1].id, 2))
+        self.assertEqual(inbox.mark_read(self.alice.id, "dm", self.bob.id, sent[0].id), (more[1].id, 2))  # Never backwards
+        self.assertEqual(inbox.mark_read(self.alice.id, "dm", self.bob.id, more[3].id), (more[3].id, 0))
+        self.assertIsNone(inbox.mark_read(self.alice.id, "dm", self.carol.id, more[3].id))
+
+    def test_deleting_a_message_discounts_only_members_who_counted_it(self):
+        group = make_group("g", self.alice, self.bob)
+        first, second = (GroupMessage.objects.create(group=group, sender=self.alice, content=c) for c in ("a", "b"))
+        group.members.add(self.carol)
+        self.assertEqual(self.entry(self.bob, group=group).unread_count, 2)
+        self.assertEqual(self.entry(self.carol, group=group).unread_count, 0)
+
+        inbox.mark_read(self.bob.id, "group", group.id, first.id)
+        compaction.soft_delete(first)  # Already read by bob
+        self.assertEqual(self.entry(self.bob, group=group).unread_count, 1)
+
+        GroupMessage.objects.create(group=group, sender=self.alice, content="c")
+        compaction.soft_delete(second)  # Sent before carol joined
+        self.assertEqual(self.entry(self.bob, group=group).unread_count, 1)
+        self.assertEqual(self.entry(self.carol, group=group).unread_count, 1)
+        self.assertEqual(self.entry(self.alice, group=group).unread_count, 0)
@@ -0,0 +1,51 @@
+from myapp.models import GroupMessage
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class GroupListingTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.first = make_group("first", self.alice, self.bob)
+        self.second = make_group("second", self.bob, self.alice)
+        self.client = api_client(self.alice)
+
+    def listing(self, **params):
+        response = self.client.get("/api/groups/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertChanged(self, etag):
+        response = self.client.get("/api/groups/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_listings_answer_304_from_the_cache(self):
+        etag = self.listing()["ETag"]
+        with self.assertNumQueries(1):  # The inbox aggregate of the stamp
+            response = self.client.get("/api/groups/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response["ETag"]), (304, etag))
+
+    def test_every_change_a_member_sees_invalidates(self):
+        etag = self.listing()["ETag"]
+        GroupMessage.objects.create(group=self.second, sender=self.bob, content="hi")
+        etag = self.assertChanged(etag)
+        self.assertEqual([group["id"] for group in self.listing().json()][0], self.second.id)  # Most recent first
+
+        self.first.name = "renamed"
+        self.first.save()
+        etag = self.assertChanged(etag)
+        self.first.members.add(self.carol)
+        etag = self.assertChanged(etag)
+        self.carol.chat_groups.remove(self.first)
+        etag = self.assertChanged(etag)
+        self.second.delete()
+        self.assertEqual([group["id"] for group in self.listing().json()], [self.first.id])
+
+    def test_variants_are_cached_apart(self):
+        full = self.listing().json()
+        compact = self.listing(compact=1).json()
+        self.assertIn("members", full[0])
+        self.assertEqual((compact[0]["member_count"], "members" in compact[0]), (2, False))
+        self.assertEqual([group["name"] for group in self.listing(name="sec").json()], ["second"])
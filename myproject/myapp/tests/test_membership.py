@@ -0,0 +1,65 @@
+from unittest import mock
+
+from myapp import membership
+from myapp.lru import LocalLRU
+from myapp.models import GroupMessage
+
+from .utils import ChatTestCase, make_group, make_user
+
+
+class LocalLRUTests(ChatTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRU(2, 60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+    def test_entries_expire(self):
+        lru = LocalLRU(2, 5)
+        with mock.patch("myapp.lru.time.monotonic", return_value=100):
+            lru.set("a", 1)
+        with mock.patch("myapp.lru.time.monotonic", return_value=104):
+            self.assertEqual(lru.get("a"), 1)
+        with mock.patch("myapp.lru.time.monotonic", return_value=106):
+            self.assertIsNone(lru.get("a"))
+
+
+class MembershipCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+
+    def test_lookups_after_the_first_skip_the_database(self):
+        self.assertEqual(membership.member_ids(self.group.id), {self.alice.id, self.bob.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_member(self.group.id, self.bob.id))
+            self.assertFalse(membership.is_member(self.group.id, self.carol.id))
+            self.assertFalse(membership.is_member(self.group.id, None))
+        membership._local.clear()  # Another process: the shared cache still answers
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_member(str(self.group.id), self.alice.id))
+
+    def test_changes_invalidate_both_directions(self):
+        membership.member_ids(self.group.id)
+        self.group.members.add(self.carol)
+        self.assertTrue(membership.is_member(self.group.id, self.carol.id))
+        self.bob.chat_groups.remove(self.group)
+        self.assertFalse(membership.is_member(self.group.id, self.bob.id))
+        self.carol.chat_groups.clear()
+        self.assertFalse(membership.is_member(self.group.id, self.carol.id))
+        self.group.members.clear()
+        self.assertEqual(membership.member_ids(self.group.id), frozenset())
+
+    def test_deleted_group_has_no_members(self):
+        group_id = self.group.id
+        membership.member_ids(group_id)
+        self.group.delete()
+        self.assertEqual(membership.member_ids(group_id), frozenset())
+
+    def test_only_members_can_post(self):
+        GroupMessage.objects.create(group=self.group, sender=self.bob, content="hi")
+        with self.assertRaises(ValueError):
+            GroupMessage.objects.create(group=self.group, sender=self.carol, content="hi")
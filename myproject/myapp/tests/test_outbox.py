@@ -0,0 +1,106 @@
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.test import override_settings
+
+from myapp import conversations, outbox
+from myapp.models import Message, OutboxEvent
+from myapp.realtime import user_group_name
+
+from .utils import ChannelsTestCase, ChatTestCase, api_client, make_group, make_user
+
+
+class RecordingLayer:
+    def __init__(self, fail_on=None):
+        self.sent = []
+        self.fail_on = fail_on
+
+    async def group_send(self, group, event):
+        if event["message"] == self.fail_on:
+            raise ConnectionError("layer down")
+        self.sent.append((group, event["type"], event["message"], event["event_id"]))
+
+
+class OutboxTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        self.client = api_client(self.alice)
+
+    def send(self, content, **target):
+        return self.client.post("/api/send_message/", {"content": content, **target})
+
+    def test_events_are_stored_with_the_message(self):
+        self.assertEqual(self.send("hi", recipient_id=self.bob.id).status_code, 201)
+        event = OutboxEvent.objects.get()
+        conversation = Message.objects.get().conversation
+        self.assertEqual(event.groups[0], [f"chat_{conversation}", "chat_message"])
+        self.assertEqual(
+            sorted(event.groups[1:]),
+            sorted([[user_group_name(user.id), "stream_message"] for user in (self.alice, self.bob)]),
+        )
+        self.assertEqual(event.payload["conversation"], conversations.dm_id(conversation))
+
+    def test_rolled_back_sends_leave_no_event(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            message = Message.objects.create(sender=self.alice, receiver=self.bob, content="lost")
+            outbox.message_created(message, "alice")
+            raise RuntimeError("send failed")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay_sends_in_order_and_deletes(self):
+        for text in ("one", "two"):
+            self.send(text, group_id=self.group.id)
+        layer = RecordingLayer()
+        self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 2)
+        self.assertEqual([(group, kind, text) for group, kind, text, _ in layer.sent], [
+            (f"group_chat_{self.group.id}", "group_chat_message", "one"),
+            (f"group_chat_{self.group.id}", "group_chat_message", "two"),
+        ])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_a_failed_event_holds_back_the_rest(self):
+        for text in ("one", "two", "three"):
+            self.send(text, group_id=self.group.id)
+        layer = RecordingLayer(fail_on="two")
+        self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 1)
+        self.assertEqual([text for _, _, text, _ in layer.sent], ["one"])
+        self.assertEqual(list(OutboxEvent.objects.order_by("id").values_list("attempts", flat=True)), [1, 0])
+
+        layer.fail_on = None
+        self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 2)
+        self.assertEqual([text for _, _, text, _ in layer.sent], ["one", "two", "three"])
+
+    @override_settings(OUTBOX={"MAX_ATTEMPTS": 2})
+    def test_a_poison_event_is_dead_lettered(self):
+        for text in ("one", "poison", "three"):
+            self.send(text, group_id=self.group.id)
+        layer = RecordingLayer(fail_on="poison")
+        self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 1)
+        with self.assertLogs("myapp.outbox", "ERROR"):
+            self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 1)
+        self.assertEqual([text for _, _, text, _ in layer.sent], ["one", "three"])
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.payload["message"], event.attempts, event.failed_at is not None), ("poison", 2, True))
+        self.assertEqual(async_to_sync(outbox.relay)(layer, once=True), 0)  # Skipped from now on
+
+
+class RedeliveryTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+
+    async def test_sockets_drop_repeated_events(self):
+        bob = await self.connect("/ws/stream/", self.bob)
+        message = await database_sync_to_async(Message.objects.create)(sender=self.alice, receiver=self.bob, content="once")
+        event = await database_sync_to_async(outbox.message_created)(message, "alice")
+        for _ in range(2):  # A relay that died before deleting the row sends it again
+            await outbox.send_event(get_channel_layer(), event)
+
+        frame = await self.receive_until(bob, "message")
+        self.assertEqual((frame["id"], frame["message"], frame["event_id"]), (message.id, "once", str(event.event_id)))
+        self.assertTrue(await bob.receive_nothing(0.3))
+        await bob.disconnect()
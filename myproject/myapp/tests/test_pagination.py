@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from myapp.models import GroupMessage
+from myapp.pagination import (
+    AFTER_HEADER, BEFORE_HEADER, MAX_PAGE_SIZE, CursorError, decode_cursor, encode_cursor, paginate_messages, parse_limit,
+)
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class CursorTests(ChatTestCase):
+    def test_round_trip(self):
+        timestamp = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor({"timestamp": timestamp, "id": 42})), (timestamp, 42))
+
+    def test_garbage_is_rejected(self):
+        for cursor in ("", "not-a-cursor", "MjAyNi0xMC0xOA"):
+            with self.assertRaises(CursorError):
+                decode_cursor(cursor)
+
+    def test_limit_bounds(self):
+        self.assertEqual(parse_limit(None), 50)
+        self.assertEqual(parse_limit("10"), 10)
+        self.assertEqual(parse_limit(str(MAX_PAGE_SIZE + 1)), MAX_PAGE_SIZE)
+        for value in ("0", "-3", "ten"):
+            with self.assertRaises(CursorError):
+                parse_limit(value)
+
+
+class GroupHistoryPaginationTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.group = make_group("g", self.alice)
+        self.messages = [GroupMessage.objects.create(group=self.group, sender=self.alice, content=f"m{i}") for i in range(12)]
+        # Two messages share a timestamp, so the id has to break the tie
+        GroupMessage.objects.filter(pk=self.messages[6].pk).update(timestamp=self.messages[5].timestamp)
+        self.url = f"/api/groups/{self.group.id}/messages/"
+        self.client = api_client(self.alice)
+
+    def walk_back(self, limit):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(self.url, {"limit": limit, **({"before": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids += [message["id"] for message in response.json()]
+            cursor = response.headers.get(BEFORE_HEADER)
+            if not cursor:
+                return ids
+
+    def test_newest_page_first(self):
+        response = self.client.get(self.url, {"limit": 5})
+        self.assertEqual([m["id"] for m in response.json()], [m.id for m in reversed(self.messages)][:5])
+        self.assertIn(BEFORE_HEADER, response.headers)
+        self.assertIn(AFTER_HEADER, response.headers)
+
+    def test_walking_back_visits_every_message_once(self):
+        expected = [m.id for m in GroupMessage.objects.order_by("-timestamp", "-id")]
+        for limit in (1, 5, 12, 50):
+            self.assertEqual(self.walk_back(limit), expected)
+
+    def test_after_returns_only_newer_messages(self):
+        cursor = encode_cursor(GroupMessage.objects.get(pk=self.messages[9].pk))
+        response = self.client.get(self.url, {"after": cursor})
+        self.assertEqual([m["id"] for m in response.json()], [self.messages[11].id, self.messages[10].id])
+
+        polled = self.client.get(self.url, {"after": response.headers[AFTER_HEADER]})
+        self.assertEqual(polled.json(), [])
+        self.assertEqual(polled.headers[AFTER_HEADER], response.headers[AFTER_HEADER])  # Keep polling from here
+
+    def test_before_and_after_together_are_rejected(self):
+        cursor = encode_cursor(self.messages[3])
+        self.assertEqual(self.client.get(self.url, {"before": cursor, "after": cursor}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"before": "garbage"}).status_code, 400)
+
+    def test_last_page_has_no_before_cursor(self):
+        page = paginate_messages(GroupMessage.objects.all(), {"limit": "12"})
+        self.assertEqual(len(page.messages), 12)
+        self.assertIsNone(page.before)
+
+    def test_keyset_query_uses_the_history_index(self):
+        old = timezone.now() - timedelta(days=1)
+        queryset = GroupMessage.objects.visible().filter(group_id=self.group.id, timestamp__lt=old)
+        plan = queryset.order_by("-timestamp", "-id").explain()
+        self.assertIn("groupmsg_live_ts_id_idx", plan)
@@ -0,0 +1,69 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from myapp import presence
+from myapp.models import Message
+
+from .utils import ChannelsTestCase, ChatTestCase, make_user
+
+
+class PresenceTests(ChatTestCase):
+    def test_online_until_the_last_socket_leaves(self):
+        self.assertTrue(presence.connected(1))
+        self.assertFalse(presence.connected(1))  # Second tab
+        self.assertEqual(presence.online([1, 2]), {1})
+        self.assertFalse(presence.disconnected(1))
+        self.assertEqual(presence.online([1]), {1})
+        self.assertTrue(presence.disconnected(1))
+        self.assertEqual(presence.online([1]), set())
+
+    def test_expired_counter_counts_as_last_socket(self):
+        presence.connected(1)
+        presence.cache.delete(presence._connections_key(1))
+        self.assertTrue(presence.disconnected(1))
+
+
+class DebouncerTests(SimpleTestCase):
+    def test_first_signal_is_sent_at_once_and_the_rest_merged(self):
+        sent = []
+
+        async def send(items):
+            sent.append(items)
+
+        async def burst():
+            debouncer = presence.Debouncer(interval=0.05)
+            await debouncer.signal("room", 1, "typing", send)
+            for value in ("a", "b", "c"):
+                await debouncer.signal("room", 2, value, send)
+            await debouncer.signal("room", 1, "stopped", send)
+            self.assertEqual(sent, [{1: "typing"}])
+            await asyncio.sleep(0.08)
+            self.assertEqual(sent, [{1: "typing"}, {2: "c", 1: "stopped"}])
+            await asyncio.sleep(0.08)  # A quiet window sends nothing and ends the debounce
+            await debouncer.signal("room", 3, True, send)
+            self.assertEqual(len(sent), 3)
+
+        asyncio.run(burst())
+
+
+class TypingTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+
+    async def test_typing_reaches_the_other_participant_once_per_window(self):
+        alice, bob = self.alice, self.bob
+        room = f"/ws/chat/{Message.conversation_key(alice.id, bob.id)}/"
+        alice_socket = await self.connect(room, alice)
+        bob_socket = await self.connect(room, bob)
+        for _ in range(5):
+            await alice_socket.send_json_to({"type": "typing"})
+        frame = await self.receive_until(bob_socket, "typing")
+        self.assertEqual(frame["users"], [{"user_id": alice.id, "username": "alice", "typing": True}])
+        later = []
+        while not await bob_socket.receive_nothing(0.3):
+            later.append((await bob_socket.receive_json_from())["type"])
+        self.assertNotIn("typing", later)  # The other four wait for the end of the window
+        await alice_socket.disconnect()
+        await bob_socket.disconnect()
@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from myapp import compaction, search_index
+from myapp.models import GroupMessage, Message
+from myapp.pagination import NEXT_HEADER
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class SearchTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        self.client = api_client(self.alice)
+
+    def search(self, q, **params):
+        response = self.client.get("/api/search/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def found(self, q):
+        return [result["message"]["id"] for result in self.search(q).json()]
+
+    def test_index_survives_all_migrations(self):
+        self.assertEqual(search_index.missing(connection), [])
+
+    def test_new_messages_are_found(self):
+        dm = Message.objects.create(sender=self.bob, receiver=self.alice, content="Meet at the Café tomorrow")
+        group = GroupMessage.objects.create(group=self.group, sender=self.bob, content="cafe plans")
+        self.assertEqual(sorted(self.found("cafe")), sorted([dm.id, group.id]))  # Diacritics folded
+        self.assertEqual(self.found("tomor"), [dm.id])  # Prefix match
+
+    def test_only_visible_messages_of_own_conversations(self):
+        Message.objects.create(sender=self.bob, receiver=self.carol, content="secret plan")
+        other = make_group("other", self.carol)
+        GroupMessage.objects.create(group=other, sender=self.carol, content="secret plan")
+        hidden = GroupMessage.objects.create(group=self.group, sender=self.bob, content="secret plan")
+        compaction.soft_delete(hidden)
+        self.assertEqual(self.found("secret"), [])
+
+    def test_edits_and_deletes_follow(self):
+        message = Message.objects.create(sender=self.bob, receiver=self.alice, content="first draft")
+        Message.objects.filter(pk=message.pk).update(content="final version")
+        self.assertEqual((self.found("draft"), self.found("final")), ([], [message.id]))
+        message.delete()
+        self.assertEqual(self.found("final"), [])
+
+    def test_pages_follow_the_cursor(self):
+        ids = {GroupMessage.objects.create(group=self.group, sender=self.bob, content=f"report {i}").id for i in range(5)}
+        seen, cursor = [], None
+        while True:
+            response = self.search("report", limit=2, **({"cursor": cursor} if cursor else {}))
+            seen += [result["message"]["id"] for result in response.json()]
+            cursor = response.headers.get(NEXT_HEADER)
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_empty_queries_are_rejected(self):
+        self.assertEqual(self.client.get("/api/search/", {"q": "  "}).status_code, 400)
+
+
+class RebuildIndexTests(ChatTestCase):
+    def test_rebuild_restores_dropped_triggers(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        before = Message.objects.create(sender=bob, receiver=alice, content="before the rebuild")
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER myapp_message_search_insert")  # What a table rebuild does
+        self.assertEqual(search_index.missing(connection), ["myapp_message_search_insert"])
+        with self.assertRaises(CommandError):
+            call_command("rebuild_search_index", check=True, stdout=StringIO())
+
+        lost = Message.objects.create(sender=bob, receiver=alice, content="written without triggers")
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(search_index.missing(connection), [])
+
+        after = Message.objects.create(sender=bob, receiver=alice, content="after the rebuild")
+        found = [result["message"]["id"] for result in api_client(alice).get("/api/search/", {"q": "the"}).json()]
+        self.assertEqual(sorted(found), sorted([before.id, after.id]))
+        found = [result["message"]["id"] for result in api_client(alice).get("/api/search/", {"q": "triggers"}).json()]
+        self.assertEqual(found, [lost.id])
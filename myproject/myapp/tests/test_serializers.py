@@ -0,0 +1,73 @@
+import datetime
+import uuid
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from myapp import renderers
+from myapp.fast_serializers import FastGroupMessageSerializer, FastMessageSerializer
+from myapp.models import GroupMessage, Message
+from myapp.serializers import GroupMessageSerializer, MessageSerializer
+
+from .utils import ChatTestCase, TempMediaMixin, make_group, make_user
+
+
+class FastSerializerTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice", first_name="Alice"), make_user("bob")
+        self.request = APIRequestFactory().get("/")
+        self.request.user = self.bob
+
+    def assertSameBytes(self, queryset, slow_class, fast_class):
+        context = {"request": self.request}
+        slow = JSONRenderer().render(slow_class(list(queryset), many=True, context=context).data)
+        fast = renderers.ORJSONRenderer().render(fast_class(list(fast_class.queryset(queryset)), many=True, context=context).data)
+        self.assertEqual(fast, slow)
+
+    def test_same_output_as_the_model_serializers(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, content="hi\u2028there")
+        Message.objects.create(sender=self.bob, receiver=self.alice, file=ContentFile(b"x", name="my file.txt"))
+        self.assertSameBytes(Message.objects.order_by("id"), MessageSerializer, FastMessageSerializer)
+
+        group = make_group("g", self.alice, self.bob)
+        GroupMessage.objects.create(group=group, sender=self.alice, content="Ünïcode ✓")
+        GroupMessage.objects.create(group=group, sender=self.bob, file=ContentFile(b"y", name="plan.pdf"))
+        self.assertSameBytes(GroupMessage.objects.order_by("id"), GroupMessageSerializer, FastGroupMessageSerializer)
+
+    def test_benchmark_checks_identical_bytes(self):
+        out = StringIO()
+        call_command("benchmark_serializers", messages=30, repeat=1, file_every=4, stdout=out)
+        self.assertIn("byte-identical", out.getvalue())
+
+
+class RendererTests(ChatTestCase):
+    data = {
+        "when": datetime.datetime(2026, 10, 18, 12, 30, tzinfo=datetime.timezone.utc),
+        "day": datetime.date(2026, 10, 18),
+        "amount": Decimal("1.50"),
+        "id": uuid.UUID(int=7),
+        "label": gettext_lazy("Hello"),
+        "text": "line\u2028separator \u2029 \u2713",
+        1: [None, True, 2.5],
+    }
+
+    def test_same_bytes_as_drf(self):
+        self.assertEqual(renderers.ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_falls_back_where_orjson_cannot(self):
+        big = {"n": 2 ** 70}
+        self.assertEqual(renderers.ORJSONRenderer().render(big), JSONRenderer().render(big))
+        context = {"indent": 2}
+        self.assertEqual(
+            renderers.ORJSONRenderer().render(self.data, renderer_context=context),
+            JSONRenderer().render(self.data, renderer_context=context),
+        )
+        with mock.patch("myapp.renderers.orjson", None):
+            self.assertEqual(renderers.ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
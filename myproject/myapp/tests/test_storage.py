@@ -0,0 +1,103 @@
+import os
+
+from django.core.files.base import ContentFile
+
+from myapp import storage, thumbnails
+from myapp.fast_serializers import FastMessageSerializer
+from myapp.models import Message, StoredBlob
+from myapp.serializers import MessageSerializer
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_user
+
+
+class ReferenceCountTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+
+    def send(self, data, name="notes.txt"):
+        return Message.objects.create(sender=self.alice, receiver=self.bob, file=ContentFile(data, name=name))
+
+    def references(self, name):
+        return StoredBlob.objects.filter(name=name).values_list("ref_count", flat=True).first()
+
+    def test_same_bytes_are_stored_once_until_the_last_reference_goes(self):
+        first, second = self.send(b"same"), self.send(b"same", name="other.txt")
+        name = first.file.name
+        self.assertEqual((second.file.name, self.references(name)), (name, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.references(name), 1)
+        self.assertTrue(storage.dedup_storage().exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.references(name))
+        self.assertFalse(storage.dedup_storage().exists(name))
+
+    def test_replacing_a_file_releases_the_old_blob(self):
+        message = self.send(b"old")
+        old = message.file.name
+        message.file = ContentFile(b"new", name="new.txt")
+        with self.captureOnCommitCallbacks(execute=True):
+            message.save()
+        self.assertEqual((self.references(old), self.references(message.file.name)), (None, 1))
+        self.assertFalse(storage.dedup_storage().exists(old))
+
+    def test_an_upload_racing_the_last_release_keeps_the_file(self):
+        message = self.send(b"shared")
+        name = message.file.name
+        with self.captureOnCommitCallbacks() as pending:
+            message.delete()
+        self.assertEqual(self.references(name), 0)
+
+        again = self.send(b"shared")  # Reuses the file before the deletion ran
+        for callback in pending:
+            callback()
+        self.assertEqual((again.file.name, self.references(name)), (name, 1))
+        self.assertTrue(storage.dedup_storage().exists(name))
+
+    def test_a_deleted_blob_is_stored_again(self):
+        message = self.send(b"gone")
+        name = message.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            message.delete()
+        self.assertFalse(storage.dedup_storage().exists(name))
+        self.assertEqual(self.send(b"gone").file.read(), b"gone")
+
+    def test_thumbnails_go_with_the_blob(self):
+        message = self.send(b"not really a png", name="photo.png")
+        name = message.file.name
+        for _, target in thumbnails.targets(name):
+            path = storage.dedup_storage().path(target)  # save() would store it as a blob
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"webp")
+        self.assertTrue(thumbnails.is_ready(name, storage.dedup_storage()))
+        with self.captureOnCommitCallbacks(execute=True):
+            message.delete()
+        self.assertEqual([target for _, target in thumbnails.targets(name) if storage.dedup_storage().exists(target)], [])
+
+
+class OriginalNameTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+
+    def test_uploads_keep_their_names_under_the_blob(self):
+        first = Message.objects.create(sender=self.alice, receiver=self.bob, file=ContentFile(b"data", name="Q3 report.pdf"))
+        second = Message.objects.create(sender=self.bob, receiver=self.alice, file=ContentFile(b"data", name="copy.pdf"))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith("blobs/"))
+
+        self.assertEqual(MessageSerializer(first).data["file_name"], "Q3 report.pdf")
+        rows = FastMessageSerializer(FastMessageSerializer.queryset(Message.objects.order_by("id"))).data
+        self.assertEqual([row["file_name"] for row in rows], ["Q3 report.pdf", "copy.pdf"])
+
+    def test_downloads_are_offered_under_the_original_name(self):
+        message = Message.objects.create(sender=self.alice, receiver=self.bob, file=ContentFile(b"data", name="résumé.pdf"))
+        response = api_client(self.bob).get(f"/api/attachments/dm/{message.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Disposition"], "inline; filename*=utf-8''r%C3%A9sum%C3%A9.pdf")
+        response.close()
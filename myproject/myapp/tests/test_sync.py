@@ -0,0 +1,60 @@
+from myapp import compaction, conversations
+from myapp.models import GroupMessage, Message
+
+from .utils import ChatTestCase, api_client, make_group, make_user
+
+
+class DeltaSyncTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = make_user("alice"), make_user("bob"), make_user("carol")
+        self.group = make_group("g", self.alice, self.bob)
+        self.dm = conversations.from_target(self.alice.id, ("dm", self.bob.id))
+        self.room = conversations.group_id(self.group.id)
+        self.client = api_client(self.alice)
+
+    def sync(self, last_seen, **extra):
+        response = self.client.post("/api/sync/", {"conversations": last_seen, **extra}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_returns_only_newer_messages_and_deletions(self):
+        old = [GroupMessage.objects.create(group=self.group, sender=self.bob, content=f"g{i}") for i in range(3)]
+        seen = {self.room: old[-1].id, self.dm: 0}
+        self.assertEqual(self.sync(seen)["conversations"], {})
+
+        compaction.soft_delete(old[1])
+        new = GroupMessage.objects.create(group=self.group, sender=self.bob, content="new")
+        dm = Message.objects.create(sender=self.bob, receiver=self.alice, content="psst")
+
+        result = self.sync(seen)
+        self.assertEqual([m["id"] for m in result["conversations"][self.room]["messages"]], [new.id])
+        self.assertEqual([m["id"] for m in result["conversations"][self.dm]["messages"]], [dm.id])
+        self.assertEqual(result["deleted"], {self.room: [old[1].id]})
+        self.assertFalse(result["has_more"])
+
+        again = self.sync({self.room: new.id, self.dm: dm.id}, tombstones_after=result["tombstones_after"])
+        self.assertEqual((again["conversations"], again["deleted"]), ({}, {}))
+
+    def test_pages_are_bounded(self):
+        messages = [Message.objects.create(sender=self.bob, receiver=self.alice, content=f"m{i}") for i in range(5)]
+        first = self.sync({self.dm: 0}, limit=3)
+        self.assertEqual([m["id"] for m in first["conversations"][self.dm]["messages"]], [m.id for m in messages[:3]])
+        self.assertTrue(first["has_more"])
+        rest = self.sync({self.dm: messages[2].id}, limit=3)
+        self.assertEqual([m["id"] for m in rest["conversations"][self.dm]["messages"]], [m.id for m in messages[3:]])
+        self.assertFalse(rest["has_more"])
+
+    def test_unknown_and_foreign_conversations(self):
+        make_group("other", self.carol)
+        Message.objects.create(sender=self.carol, receiver=self.alice, content="hey")
+        result = self.sync({"group:999": 0, f"dm:{Message.conversation_key(self.bob.id, self.carol.id)}": 0})
+        self.assertEqual(len(result["forbidden"]), 2)
+        self.assertEqual(
+            [c["conversation"] for c in result["other_conversations"]],
+            [conversations.from_target(self.alice.id, ("dm", self.carol.id))],
+        )
+
+    def test_malformed_requests(self):
+        for body in ({}, {"conversations": []}, {"conversations": {self.dm: "x"}}):
+            self.assertEqual(self.client.post("/api/sync/", body, format="json").status_code, 400)
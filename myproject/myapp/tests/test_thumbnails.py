@@ -0,0 +1,67 @@
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from myapp import thumbnails
+from myapp.models import Message
+from myapp.serializers import MessageSerializer
+
+from .utils import ChatTestCase, TempMediaMixin, make_user
+
+
+def png(width=300, height=200):
+    data = BytesIO()
+    Image.new("RGB", (width, height), "teal").save(data, "PNG")
+    return data.getvalue()
+
+
+class RenderTests(ChatTestCase):
+    def test_every_size_keeps_the_aspect_ratio(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "photo.png")
+            with open(source, "wb") as f:
+                f.write(png())
+            outputs = [(size, os.path.join(directory, str(size), "photo.png.webp")) for size in (256, 64)]
+            self.assertEqual(thumbnails.render(source, outputs, 80), 2)
+            for size, path in outputs:
+                with Image.open(path) as image:
+                    self.assertEqual((image.format, image.width, image.height), ("WEBP", size, round(size * 2 / 3)))
+            self.assertEqual(thumbnails.render(source, outputs, 80), 0)  # Already there
+
+
+class ReadinessTests(ChatTestCase):
+    def test_answers_are_remembered(self):
+        storage = mock.Mock()
+        storage.exists.return_value = False
+        with mock.patch("myapp.lru.time.monotonic", return_value=100):
+            self.assertFalse(thumbnails.is_ready("a.png", storage))
+            self.assertFalse(thumbnails.is_ready("a.png", storage))
+        self.assertEqual(storage.exists.call_count, 1)
+
+        storage.exists.return_value = True
+        with mock.patch("myapp.lru.time.monotonic", return_value=100 + thumbnails.PENDING_TTL + 1):
+            self.assertTrue(thumbnails.is_ready("a.png", storage))
+            self.assertTrue(thumbnails.is_ready("a.png", storage))
+        self.assertEqual(storage.exists.call_count, 2)
+
+        thumbnails.forget("a.png")
+        storage.exists.return_value = False
+        self.assertFalse(thumbnails.is_ready("a.png", storage))
+
+
+class PipelineTests(TempMediaMixin, ChatTestCase):
+    def test_message_images_get_thumbnails_in_their_own_storage(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        message = Message.objects.create(sender=alice, receiver=bob, file=ContentFile(png(), name="photo.png"))
+        self.assertIsNone(MessageSerializer(message).data["thumbnail_urls"])
+
+        thumbnails.forget(message.file.name)
+        thumbnails.submit(message.file.name, message.file.storage).result(timeout=60)
+        urls = MessageSerializer(message).data["thumbnail_urls"]
+        self.assertEqual(sorted(urls, key=int), [str(size) for size in sorted(thumbnails.get_setting("SIZES"))])
+        for size in thumbnails.get_setting("SIZES"):
+            self.assertTrue(message.file.storage.exists(thumbnails.thumbnail_name(message.file.name, size)))
@@ -0,0 +1,101 @@
+import fcntl
+import hashlib
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+
+from myapp import uploads
+from myapp.models import Message, StoredBlob, UploadSession
+
+from .utils import ChatTestCase, TempMediaMixin, api_client, make_user
+
+DATA = b"0123456789" * 100
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkedUploadTests(TempMediaMixin, ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(UPLOAD_SESSIONS={"DIR": directory, "MAX_CHUNK": 400})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+        self.client = api_client(self.alice)
+
+    def start(self, data=DATA, **extra):
+        response = self.client.post("/api/uploads/", {"filename": "notes.txt", "size": len(data), **extra}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def put(self, upload_id, offset, chunk, checksum=None):
+        return self.client.put(
+            f"/api/uploads/{upload_id}/", chunk, content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_X_CHUNK_SHA256=checksum or sha256(chunk),
+        )
+
+    def upload(self, data=DATA, **extra):
+        upload_id = self.start(data, **extra)
+        for offset in range(0, len(data), 400):
+            self.assertEqual(self.put(upload_id, offset, data[offset:offset + 400]).status_code, 200)
+        return upload_id
+
+    def complete(self, upload_id):
+        return self.client.post(f"/api/uploads/{upload_id}/complete/")
+
+    def test_upload_complete_and_send(self):
+        upload_id = self.upload(sha256=sha256(DATA))
+        self.assertEqual(self.client.get(f"/api/uploads/{upload_id}/").json()["offset"], len(DATA))
+        response = self.complete(upload_id)
+        self.assertEqual(response.json()["status"], UploadSession.STATUS_COMPLETE)
+        self.assertEqual(self.complete(upload_id).status_code, 200)  # Idempotent
+
+        name = UploadSession.objects.get(pk=upload_id).file_name
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)  # Held by the session
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/send_message/", {"recipient_id": self.bob.id, "upload_id": upload_id})
+        self.assertEqual(response.status_code, 201, response.content)
+        message = Message.objects.get()
+        self.assertEqual((message.file.name, message.original_name, message.file.read()), (name, "notes.txt", DATA))
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)  # Handed over to the message
+        self.assertEqual(self.client.post("/api/send_message/", {"recipient_id": self.bob.id, "upload_id": upload_id}).status_code, 404)
+
+    def test_chunks_must_follow_on_and_match_their_checksum(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 400, DATA[400:800]).status_code, 409)
+        self.assertEqual(self.put(upload_id, 0, DATA[:400], checksum=sha256(b"other")).status_code, 400)
+        self.assertEqual(self.put(upload_id, 0, DATA[:500]).status_code, 400)  # Over MAX_CHUNK
+        self.assertEqual(self.put(upload_id, 0, DATA[:400]).json()["offset"], 400)
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+    def test_a_file_that_does_not_match_starts_over(self):
+        upload_id = self.upload(sha256=sha256(b"something else"))
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+        self.assertEqual(self.client.get(f"/api/uploads/{upload_id}/").json()["offset"], 0)
+
+    def test_a_session_being_written_is_busy(self):
+        upload_id = self.start()
+        session = UploadSession.objects.get(pk=upload_id)
+        with open(uploads.part_path(session), "r+b") as part:
+            fcntl.flock(part, fcntl.LOCK_EX)  # Another request writing
+            self.assertEqual(self.put(upload_id, 0, DATA[:400]).status_code, 409)
+            self.assertEqual(self.complete(upload_id).status_code, 409)
+        self.assertEqual(self.put(upload_id, 0, DATA[:400]).status_code, 200)
+
+    def test_expired_sessions_release_their_blob(self):
+        open_id, done_id = self.start(), self.upload()
+        self.complete(done_id)
+        name = UploadSession.objects.get(pk=done_id).file_name
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(uploads.expire(), 2)
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertEqual(self.client.get(f"/api/uploads/{open_id}/").status_code, 404)
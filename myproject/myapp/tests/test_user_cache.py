@@ -0,0 +1,52 @@
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp import user_cache
+from myapp.authentication import CachedJWTAuthentication
+from myapp.models import CustomUser
+
+from .utils import ChatTestCase, make_user
+
+
+class UserCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice", first_name="Alice")
+
+    def test_lookups_after_the_first_skip_the_database(self):
+        with self.assertNumQueries(1):
+            user_cache.get_user(self.alice.id)
+        with self.assertNumQueries(0):
+            user = user_cache.get_user(str(self.alice.id))
+            self.assertEqual((user.id, user.username, user.first_name, user.is_active), (self.alice.id, "alice", "Alice", True))
+        user_cache._local.clear()  # Another process: the shared cache still answers
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get_user(self.alice.id).email, "alice@example.com")
+        self.assertIsNone(user_cache.get_user(self.alice.id + 100))
+        self.assertIsNone(user_cache.get_user("x"))
+
+    def test_instances_are_slim(self):
+        user = user_cache.get_user(self.alice.id)
+        self.assertNotIn("password", user.__dict__)
+        self.assertTrue(user.check_password("pw-12345!"))  # Loaded on access
+
+        user = user_cache.get_user(self.alice.id)
+        user.first_name = "Ally"
+        user.save()  # Writes only the loaded fields
+        self.assertTrue(CustomUser.objects.get(pk=self.alice.id).check_password("pw-12345!"))
+
+    def test_saves_invalidate(self):
+        user_cache.get_user(self.alice.id)
+        self.alice.username = "alice2"
+        self.alice.save()
+        self.assertEqual(user_cache.get_user(self.alice.id).username, "alice2")
+        self.alice.delete()
+        self.assertIsNone(user_cache.get_user(self.alice.id))
+
+    def test_jwt_requests_resolve_users_without_queries(self):
+        header = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.alice)}"}
+        authentication = CachedJWTAuthentication()
+        authentication.authenticate(APIRequestFactory().get("/", **header))
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(APIRequestFactory().get("/", **header))
+        self.assertEqual(user.username, "alice")
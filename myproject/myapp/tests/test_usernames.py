@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.db import IntegrityError
+
+from myapp import usernames
+from myapp.models import CustomUser
+
+from .utils import ChatTestCase, make_user
+
+
+class AllocationTests(ChatTestCase):
+    def test_picks_the_smallest_free_suffix_in_one_query(self):
+        for name in ("john", "john1", "john3", "johnny", "john07"):
+            make_user(name)
+        with self.assertNumQueries(1):
+            self.assertEqual(usernames.allocate("john"), "john2")
+        self.assertEqual(usernames.allocate("mary"), "mary")
+
+    def test_bases_that_prefix_each_other(self):
+        make_user("ann")
+        make_user("anna")
+        with self.assertNumQueries(1):
+            self.assertEqual(usernames.allocate_many(["ann", "anna", "ann", "bob"]), ["ann1", "anna1", "ann2", "bob"])
+
+    def test_signups_default_to_the_email_local_part(self):
+        first = CustomUser.objects.create_user(email="info@a.example", password="pw-12345!")
+        second = CustomUser.objects.create_user(email="info@b.example", password="pw-12345!")
+        self.assertEqual((first.username, second.username), ("info", "info1"))
+        self.assertEqual(usernames.base_for("x" * 200 + "@a.example"), "x" * (usernames.MAX_LENGTH - usernames.SUFFIX_ROOM))
+
+    def test_a_lost_race_allocates_again(self):
+        make_user("info")
+        real_allocate = usernames.allocate
+        # The first allocation misses a concurrent signup's "info1"
+        answers = iter(["info", None])
+        with mock.patch("myapp.usernames.allocate", side_effect=lambda base: next(answers) or real_allocate(base)):
+            user = CustomUser(email="info@c.example")
+            user.set_password("pw-12345!")
+            usernames.save_with_unique_username(user, "info")
+        self.assertEqual(user.username, "info1")
+
+    def test_a_duplicate_email_is_not_retried(self):
+        make_user("alice")
+        user = CustomUser(email="alice@example.com")
+        with self.assertRaises(IntegrityError):
+            usernames.save_with_unique_username(user, "someone")
+
+    def test_bulk_import(self):
+        make_user("sam")
+        with self.assertNumQueries(2):  # One prefix query, one INSERT
+            users = CustomUser.objects.bulk_create_users([
+                {"email": "sam@a.example"}, {"email": "sam@b.example", "password": "pw-12345!"}, {"email": "x@c.example", "username": "kim"},
+            ])
+        self.assertEqual([user.username for user in users], ["sam1", "sam2", "kim"])
+        self.assertFalse(CustomUser.objects.get(username="sam1").has_usable_password())
+        self.assertTrue(CustomUser.objects.get(username="sam2").check_password("pw-12345!"))
+
+    def test_large_imports_query_in_chunks(self):
+        make_user("u7x")
+        bases = [f"u{i}x" for i in range(3000)]
+        with self.assertNumQueries(3000 // usernames.QUERY_CHUNK):
+            taken = usernames.taken_suffixes(bases)
+        self.assertEqual((taken["u7x"], taken["u70x"]), ({0}, set()))
+
+        users = CustomUser.objects.bulk_create_users([{"email": f"{base}@a.example"} for base in bases])
+        self.assertEqual((users[7].username, users[70].username, len(users)), ("u7x1", "u70x", 3000))
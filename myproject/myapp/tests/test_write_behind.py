@@ -0,0 +1,89 @@
+import asyncio
+
+from django.db import IntegrityError
+from django.test import TransactionTestCase
+
+from myapp import write_behind
+from myapp.models import InboxEntry, Message
+
+from .utils import clear_caches, make_user
+
+
+class WriteBehindTests(TransactionTestCase):
+    """Writes happen in worker threads, so these need committed data."""
+
+    def setUp(self):
+        clear_caches()
+        self.alice, self.bob = make_user("alice"), make_user("bob")
+        self.buffer = write_behind.WriteBehindBuffer(
+            Message, prepare=write_behind._set_conversation, after_write=write_behind.inbox.record_direct_messages
+        )
+
+    def message(self, content):
+        return Message(sender=self.alice, receiver=self.bob, content=content)
+
+    def test_rows_are_batched_and_futures_resolve(self):
+        async def send():
+            futures = [await self.buffer.submit(self.message(f"m{i}")) for i in range(3)]
+            return await asyncio.gather(*futures)
+
+        stored = asyncio.run(send())
+        self.assertEqual([m.content for m in Message.objects.order_by("id")], ["m0", "m1", "m2"])
+        self.assertEqual([m.id for m in stored], list(Message.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual(InboxEntry.objects.get(owner=self.bob).unread_count, 3)
+        self.assertEqual(self.buffer._take_unwritten(), [])
+
+    def test_close_stores_the_queue_while_the_loop_runs(self):
+        self.buffer.flush_interval = 60
+
+        async def send_and_close():
+            futures = [await self.buffer.submit(self.message(f"m{i}")) for i in range(3)]
+            await asyncio.sleep(0.01)  # The worker holds a partial batch
+            await self.buffer.close()
+            return await asyncio.gather(*futures)
+
+        self.assertEqual(len(asyncio.run(send_and_close())), 3)
+        self.assertEqual(Message.objects.count(), 3)
+
+    def test_exit_flush_stores_a_partial_batch(self):
+        """daphne/runserver: no lifespan event, the loop just stops."""
+        self.buffer.flush_interval = 60
+
+        async def send_and_stop():
+            await self.buffer.submit(self.message("m0"))
+            await asyncio.sleep(0.01)  # Taken by the worker, which waits for more
+
+        asyncio.run(send_and_stop())  # Cancels the worker
+        self.assertEqual(Message.objects.count(), 0)
+        self.buffer.close_sync()
+        self.assertEqual(list(Message.objects.values_list("content", flat=True)), ["m0"])
+
+    def test_exit_flush_stores_the_queue(self):
+        async def send_and_stop():
+            for i in range(3):
+                await self.buffer.submit(self.message(f"m{i}"))  # The worker never gets to run
+
+        asyncio.run(send_and_stop())
+        self.buffer.close_sync()
+        self.assertEqual(sorted(Message.objects.values_list("content", flat=True)), ["m0", "m1", "m2"])
+
+    def test_exit_flush_does_not_repeat_written_batches(self):
+        async def send():
+            await (await self.buffer.submit(self.message("m0")))
+
+        asyncio.run(send())
+        self.buffer.close_sync()
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_a_bad_row_fails_alone(self):
+        async def send():
+            futures = [await self.buffer.submit(message) for message in (
+                self.message("m0"), Message(sender=self.alice, receiver_id=999999, content="nobody"), self.message("m2"),
+            )]
+            return await asyncio.gather(*futures, return_exceptions=True)
+
+        first, bad, last = asyncio.run(send())
+        self.assertIsInstance(bad, IntegrityError)
+        self.assertEqual([first.id, last.id], list(Message.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual(list(Message.objects.order_by("id").values_list("content", flat=True)), ["m0", "m2"])
+        self.assertEqual(InboxEntry.objects.get(owner=self.bob).unread_count, 2)
@@ -0,0 +1,73 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp import authentication, deletion, ws_auth
+from myproject.asgi import application
+
+from .utils import ChannelsTestCase, ChatTestCase, make_user
+
+user_for_token = async_to_sync(ws_auth.user_for_token)
+
+
+class TokenCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.token = str(AccessToken.for_user(self.alice))
+
+    def test_token_sources(self):
+        scope = {"subprotocols": ["bearer", "abc"], "query_string": b"token=xyz"}
+        self.assertEqual(ws_auth.token_from_scope(scope), ("abc", "bearer"))
+        self.assertEqual(ws_auth.token_from_scope({"query_string": b"token=xyz"}), ("xyz", None))
+        self.assertEqual(ws_auth.token_from_scope({"subprotocols": ["bearer"]}), (None, None))
+
+    def test_a_verified_token_is_not_checked_again(self):
+        with mock.patch("myapp.ws_auth.verify", wraps=ws_auth.verify) as verify:
+            self.assertEqual(user_for_token(self.token).id, self.alice.id)
+            with self.assertNumQueries(0):
+                self.assertEqual(user_for_token(self.token).username, "alice")
+        self.assertEqual(verify.call_count, 1)
+
+    def test_a_forged_token_with_a_cached_jti_is_rejected(self):
+        user_for_token(self.token)
+        header, payload, signature = self.token.split(".")
+        forged = f"{header}.{payload}.{signature[::-1]}"
+        self.assertIsNone(user_for_token(forged))
+        self.assertIsNone(user_for_token("not a token"))
+
+    def test_deactivated_users_lose_cached_tokens(self):
+        user_for_token(self.token)
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertIsNone(user_for_token(self.token))
+
+    def test_deleted_accounts_lose_cached_tokens(self):
+        user_for_token(self.token)
+        deletion.delete_account(self.alice)
+        self.assertIsNone(user_for_token(self.token))
+
+    def test_revoked_tokens_are_rejected_from_the_cache(self):
+        # Modules hold simplejwt's settings object itself, so override_settings would not reach them
+        with mock.patch.object(authentication.api_settings, "CHECK_REVOKE_TOKEN", True):
+            token = str(AccessToken.for_user(self.alice))
+            self.assertEqual(user_for_token(token).id, self.alice.id)
+            self.alice.set_password("another-pw-678!")
+            self.alice.save()
+            self.assertIsNone(user_for_token(token))
+
+
+class SubprotocolTests(ChannelsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+
+    async def test_token_in_the_subprotocol(self):
+        token = str(AccessToken.for_user(self.alice))
+        communicator = WebsocketCommunicator(application, "/ws/stream/", subprotocols=["bearer", token])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, "bearer")  # The token itself is never echoed back
+        await communicator.disconnect()
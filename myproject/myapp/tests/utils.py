@@ -0,0 +1,101 @@
+"""Fixtures shared by the myapp tests."""
+import shutil
+import tempfile
+
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp import archive, membership, presence, thumbnails, user_cache, write_behind, ws_auth
+from myapp.models import ChatGroup, CustomUser
+from myproject.asgi import application
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def make_user(name, **extra):
+    return CustomUser.objects.create_user(email=f"{name}@example.com", password="pw-12345!", username=name, **extra)
+
+
+def make_group(name, admin, *members):
+    group = ChatGroup.objects.create(name=name, admin=admin)
+    group.members.add(admin, *members)
+    return group
+
+
+def api_client(user=None):
+    client = APIClient(HTTP_ACCEPT="application/json")  # DEBUG puts the browsable API first
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def clear_caches():
+    """Per-process caches outlive the test transactions, and ids get reused after a rollback."""
+    cache.clear()
+    for lru in (membership._local, user_cache._local, ws_auth._verified, archive._rows, thumbnails._ready):
+        lru.clear()
+
+
+class TempMediaMixin:
+    """Uploaded files go to a throwaway MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls._media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ChatTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(clear_caches)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ChannelsTestCase(TransactionTestCase):
+    """
+    WebSocket tests. Consumers reach the database from worker threads, so
+    the data has to be committed; every async test runs in a new event loop,
+    so nothing bound to the previous one may survive.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(clear_caches)
+        channel_layers.backends.clear()
+        presence.debouncer.windows.clear()
+        for buffer in write_behind.BUFFERS:
+            buffer.queue = buffer.worker = buffer.inflight = None
+
+    async def connect(self, path, user=None, expect=True):
+        """
+        A communicator for ``path``, authenticated with ``user``'s JWT;
+        asserts whether it was accepted and returns the close code if not.
+        Tests disconnect accepted ones themselves.
+        """
+        if user is not None:
+            path = f"{path}?token={AccessToken.for_user(user)}"
+        communicator = WebsocketCommunicator(application, path)
+        connected, code = await communicator.connect()
+        self.assertEqual(connected, expect, code)
+        return communicator if connected else code
+
+    async def receive_until(self, communicator, frame_type, timeout=2):
+        """The next frame of ``frame_type``, skipping others (presence snapshots etc.)."""
+        while True:
+            frame = await communicator.receive_json_from(timeout)
+            if frame.get("type") == frame_type:
+                return frame
@@ -0,0 +1,178 @@
+"""
+Background WebP thumbnails for uploaded images.
+
+Saving a model with an image (message attachments, profile pictures, group
+icons) only queues a job. Decoding and resizing run in a process pool after
+the transaction commits, so neither the request nor the event loop waits on
+Pillow and CPU-heavy resizes do not contend for the GIL.
+
+Thumbnails live in the image's own storage by naming convention,
+``thumbnails/<size>/<original name>.webp``, so no table tracks them. The
+smallest size is written last and doubles as the "ready" marker that
+``thumbnail_urls()`` checks. Each process remembers the answer (briefly
+while it is "not yet"), so serializing a page of messages does not stat
+every file. ``manage.py backfill_thumbnails`` renders them for files
+uploaded before the pipeline existed.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .lru import LocalLRU
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SIZES": (64, 256, 1024),  # Longest edge in pixels
+    "QUALITY": 80,             # WebP quality
+    "WORKERS": 2,              # Processes in the pool
+}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+READY_TTL = 60 * 60  # Seconds a process trusts "rendered" (forget() drops it on deletion)
+PENDING_TTL = 5      # Seconds before a missing thumbnail is looked for again
+
+_ready = LocalLRU(10000, READY_TTL)  # Source name -> thumbnails exist
+
+
+def get_setting(name):
+    return getattr(settings, "THUMBNAILS", {}).get(name, DEFAULTS[name])
+
+
+def is_image(name):
+    return os.path.splitext(name or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def thumbnail_name(name, size):
+    return f"thumbnails/{size}/{name}.webp"
+
+
+def targets(name):
+    """``[(size, storage name)]``, largest first so the smallest marks completion."""
+    return [(size, thumbnail_name(name, size)) for size in sorted(get_setting("SIZES"), reverse=True)]
+
+
+def is_ready(name, storage=default_storage):
+    ready = _ready.get(name)
+    if ready is None:
+        ready = storage.exists(thumbnail_name(name, min(get_setting("SIZES"))))
+        _ready.set(name, ready, None if ready else PENDING_TTL)
+    return ready
+
+
+def forget(name):
+    """Drop the remembered readiness of ``name`` (its thumbnails were deleted)."""
+    _ready.delete(name)
+
+
+def delete(name, storage=default_storage):
+    """Delete the thumbnails of ``name`` along with the source the caller deletes."""
+    if not is_image(name):
+        return
+    for _, target in targets(name):
+        storage.delete(target)
+    forget(name)
+
+
+def thumbnail_urls(field_file, request=None):
+    """``{"64": url, ...}`` for an image field once its thumbnails exist, else ``None``."""
+    if not field_file:
+        return None
+    return thumbnail_urls_for_name(field_file.name, request, field_file.storage)
+
+
+def thumbnail_urls_for_name(source_name, request=None, storage=default_storage):
+    if not source_name or not is_image(source_name) or not is_ready(source_name, storage):
+        return None
+    urls = {}
+    for size, name in targets(source_name):
+        url = storage.url(name)
+        urls[str(size)] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def render(source_path, outputs, quality):
+    """
+    Worker side (runs in the pool, no Django): write each ``(size, path)``
+    thumbnail of ``source_path``. Existing outputs are left alone.
+    """
+    from PIL import Image, ImageOps
+
+    pending = [(size, path) for size, path in outputs if not os.path.exists(path)]
+    if not pending:
+        return 0
+    with Image.open(source_path) as image:
+        image.seek(0)  # First frame of animated GIFs
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size, path in pending:
+            copy = image.copy()
+            copy.thumbnail((size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.part"
+            copy.save(partial, "WEBP", quality=quality, method=4)
+            os.replace(partial, path)  # Readers never see half-written files
+    return len(pending)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: the server process runs threads (channels, the ORM)
+            _executor = ProcessPoolExecutor(get_setting("WORKERS"), mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+@atexit.register
+def _shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)  # backfill_thumbnails catches up
+
+
+def job(name, storage=default_storage):
+    """``(source path, [(size, output path)])`` for a stored image, or ``None`` if not renderable."""
+    if not is_image(name):
+        return None
+    try:
+        source = storage.path(name)
+        outputs = [(size, storage.path(target)) for size, target in targets(name)]
+    except NotImplementedError:  # Remote storage; the pool works on local files
+        return None
+    return (source, outputs) if os.path.exists(source) else None
+
+
+def submit(name, storage=default_storage):
+    """Render thumbnails for ``name`` in the pool; returns the future, or ``None`` if skipped."""
+    rendering = job(name, storage)
+    if rendering is None:
+        return None
+    future = get_executor().submit(render, *rendering, get_setting("QUALITY"))
+
+    def finished(done):
+        if done.cancelled():
+            return
+        if done.exception() is not None:
+            logger.warning(f"Thumbnails for {name} failed: {done.exception()}")
+        else:
+            _ready.set(name, True)
+
+    future.add_done_callback(finished)
+    return future
+
+
+def schedule(field_file):
+    """Queue thumbnails for an image field once the surrounding transaction commits."""
+    if field_file and is_image(field_file.name):
+        name, storage = field_file.name, field_file.storage
+        transaction.on_commit(lambda: submit(name, storage))
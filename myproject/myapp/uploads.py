@@ -0,0 +1,195 @@
+"""
+Resumable chunked uploads.
+
+The client creates an ``UploadSession`` (file name, total size, optional
+SHA-256 of the whole file) and then PUTs the bytes in order. Each chunk
+states its offset in ``Upload-Offset`` and its own SHA-256 in
+``X-Chunk-SHA256``. Chunks are copied from the request stream straight onto
+a part file, so no worker holds an upload in memory, and a dropped
+connection only costs the current chunk: GET the session to learn the
+offset to resume from. A chunk write or completion holds the session's row
+lock and a lock on its part file throughout; a concurrent request for the
+same session gets 409.
+
+``complete()`` verifies the file and moves it into DedupStorage, where the
+session holds a reference to it. The session id can then be sent as
+``upload_id`` with a message, and ``claim()`` consumes it.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the database row lock applies
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import UploadSession
+from .storage import dedup_storage, release
+
+DEFAULTS = {
+    "DIR": os.path.join(settings.BASE_DIR, "upload_sessions"),  # Part files; outside MEDIA_ROOT
+    "MAX_SIZE": 2 * 1024 ** 3,     # Bytes per upload
+    "MAX_CHUNK": 8 * 1024 ** 2,    # Bytes per PUT
+    "TTL": 24 * 60 * 60,           # Seconds an unused session is kept
+}
+COPY_BUFFER = 64 * 1024
+BUSY = "Another request is writing this upload; retry shortly."
+
+
+def get_setting(name):
+    return getattr(settings, "UPLOAD_SESSIONS", {}).get(name, DEFAULTS[name])
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def part_path(session):
+    return os.path.join(get_setting("DIR"), f"{session.id}.part")
+
+
+def create(owner, filename, size, sha256=""):
+    if size < 1 or size > get_setting("MAX_SIZE"):
+        raise UploadError(f"size must be between 1 and {get_setting('MAX_SIZE')} bytes.")
+    os.makedirs(get_setting("DIR"), exist_ok=True)
+    session = UploadSession.objects.create(owner=owner, filename=os.path.basename(filename), size=size, sha256=sha256.lower())
+    open(part_path(session), "wb").close()
+    return session
+
+
+@contextmanager
+def _locked(session):
+    """
+    ``session`` re-read under its row lock, with its part file opened and
+    exclusively locked (``None`` once completed), for one chunk write or
+    completion. A request that finds either lock taken fails with 409 instead
+    of waiting out another client's upload.
+    """
+    try:
+        part = open(part_path(session), "r+b")
+    except FileNotFoundError:
+        part = None  # Moved into storage by complete(), or expired
+    try:
+        if part is not None and fcntl is not None:  # The row lock is a no-op on SQLite
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError(BUSY, 409)
+        with transaction.atomic():
+            try:
+                session = UploadSession.objects.select_for_update(nowait=True).get(pk=session.pk)
+            except UploadSession.DoesNotExist:
+                raise UploadError("Upload not found.", 404)
+            except DatabaseError:
+                raise UploadError(BUSY, 409)
+            if part is None and session.status == UploadSession.STATUS_OPEN:
+                raise UploadError("Upload not found.", 404)
+            yield session, part
+    finally:
+        if part is not None:
+            part.close()  # Releases the flock, after the commit
+
+
+def write_chunk(session, offset, stream, length, checksum):
+    """Write ``length`` bytes from ``stream`` at ``offset``; returns the updated session."""
+    with _locked(session) as (session, part):
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadError("Upload is already complete.", 409)
+        if offset != session.received:
+            raise UploadError(f"Expected offset {session.received}.", 409)
+        if not checksum:
+            raise UploadError("X-Chunk-SHA256 header is required.")
+        if length is None or not 0 < length <= get_setting("MAX_CHUNK"):
+            raise UploadError(f"Chunks must have a Content-Length between 1 and {get_setting('MAX_CHUNK')} bytes.")
+        if offset + length > session.size:
+            raise UploadError("Chunk extends past the declared size.")
+
+        digest = hashlib.sha256()
+        written = 0
+        part.seek(offset)
+        part.truncate()  # Drop the remains of an interrupted attempt
+        while written < length:
+            chunk = stream.read(min(COPY_BUFFER, length - written))
+            if not chunk:
+                break
+            digest.update(chunk)
+            part.write(chunk)
+            written += len(chunk)
+        if written != length or digest.hexdigest() != checksum.lower():
+            part.truncate(offset)
+            raise UploadError("Chunk was truncated or does not match its checksum; send it again.")
+
+        part.flush()
+        session.received = offset + length
+        session.save(update_fields=["received", "updated_at"])
+        return session
+
+
+def complete(session):
+    """Verify the whole file and move it into DedupStorage; returns the updated session (idempotent)."""
+    with _locked(session) as (session, part):
+        if session.status == UploadSession.STATUS_COMPLETE:
+            return session
+        if session.received != session.size:
+            raise UploadError(f"Upload incomplete: {session.received} of {session.size} bytes received.", 409)
+
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: part.read(COPY_BUFFER), b""):
+            digest.update(chunk)
+        if not session.sha256 or digest.hexdigest() == session.sha256:
+            # The session holds the reference adopt() takes until claim() or expire()
+            session.file_name = dedup_storage().adopt(part_path(session), session.filename, digest.hexdigest())
+            session.status = UploadSession.STATUS_COMPLETE
+            session.save(update_fields=["file_name", "status", "updated_at"])
+            return session
+
+        part.truncate(0)
+        session.received = 0
+        session.save(update_fields=["received", "updated_at"])
+    # Raised outside the lock, so the reset above is committed
+    raise UploadError("File does not match its checksum; upload it again from offset 0.")
+
+
+def claim(owner, upload_id):
+    """
+    Consume a completed upload for attaching to a message; returns the
+    session. Call inside the transaction that creates the message, so a
+    failed send leaves the upload usable.
+    """
+    try:
+        session = UploadSession.objects.get(pk=upload_id, owner=owner)
+    except (UploadSession.DoesNotExist, ValidationError):  # ValidationError: not a UUID
+        raise UploadError("Upload not found.", 404)
+    if session.status != UploadSession.STATUS_COMPLETE:
+        raise UploadError("Upload is not complete.", 409)
+    if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+        raise UploadError("Upload was already used.", 409)
+    release(session.file_name)  # The session's reference; the message saved next takes its own
+    return session
+
+
+def expire():
+    """Drop sessions unused for ``TTL`` with their part files or unattached blobs; returns how many."""
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=get_setting("TTL")))
+    count = 0
+    for session in stale.iterator():
+        if session.status == UploadSession.STATUS_OPEN:
+            try:
+                os.unlink(part_path(session))
+            except FileNotFoundError:
+                pass
+        with transaction.atomic():
+            if UploadSession.objects.filter(pk=session.pk).delete()[0]:
+                release(session.file_name)
+        count += 1
+    return count
@@ -11,6 +11,12 @@ urlpatterns = [
     # ✅ Messaging Endpoints
     path("messages/<int:user_id>/", views.get_messages, name="get_messages"),
     path("send_message/", views.send_message, name="send_message"),
+    path("sync/", views.sync_messages, name="sync_messages"),
+    path("search/", views.search_messages, name="search_messages"),
+    path("uploads/", views.create_upload, name="create_upload"),
+    path("uploads/<uuid:upload_id>/", views.upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:upload_id>/complete/", views.complete_upload, name="complete_upload"),
+    path("attachments/<str:kind>/<int:message_id>/", views.download_attachment, name="download_attachment"),
     path("update_profile_picture/", views.update_profile_picture, name="update_profile_picture"),
     path("delete_message/<int:message_id>/", views.delete_message, name="delete_message"),
 
@@ -22,6 +28,10 @@ urlpatterns = [
     path("groups/<int:group_id>/send_message/", views.send_group_message, name="send_group_message"),
     path("groups/<str:group_name>/update_icon/", views.update_group_icon, name="update_group_icon"),
     path("groups/remove_user/", views.remove_user_from_group, name="remove_user_from_group"),
+    path("groups/<int:group_id>/members/add/", views.add_group_members, name="add_group_members"),
+    path("groups/<int:group_id>/members/remove/", views.remove_group_members, name="remove_group_members"),
+    path("account/", views.delete_account, name="delete_account"),
+    path("deletion_jobs/<int:job_id>/", views.deletion_job, name="deletion_job"),
     path("delete_group_message/<int:message_id>/", views.delete_group_message, name="delete-group-message"),  # 🔹 Fixed import
 ]
 
@@ -40,6 +50,12 @@ urlpatterns = [
     # ✅ Messaging Endpoints
     path("messages/<int:user_id>/", views.get_messages, name="get_messages"),
     path("send_message/", views.send_message, name="send_message"),
+    path("sync/", views.sync_messages, name="sync_messages"),
+    path("search/", views.search_messages, name="search_messages"),
+    path("uploads/", views.create_upload, name="create_upload"),
+    path("uploads/<uuid:upload_id>/", views.upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:upload_id>/complete/", views.complete_upload, name="complete_upload"),
+    path("attachments/<str:kind>/<int:message_id>/", views.download_attachment, name="download_attachment"),
     path("update_profile_picture/", views.update_profile_picture, name="update_profile_picture"),
     path("delete_message/<int:message_id>/", views.delete_message, name="delete_message"),
 
@@ -52,6 +68,10 @@ urlpatterns = [
     path("groups/<int:group_id>/send_message/", views.send_group_message, name="send_group_message"),
     path("groups/<str:group_name>/update_icon/", views.update_group_icon, name="update_group_icon"),
     path("groups/remove_user/", views.remove_user_from_group, name="remove_user_from_group"),
+    path("groups/<int:group_id>/members/add/", views.add_group_members, name="add_group_members"),
+    path("groups/<int:group_id>/members/remove/", views.remove_group_members, name="remove_group_members"),
+    path("account/", views.delete_account, name="delete_account"),
+    path("deletion_jobs/<int:job_id>/", views.deletion_job, name="deletion_job"),
     path("delete_group_message/<int:message_id>/", views.delete_group_message, name="delete-group-message"),  # 🔹 Fixed import
 ]
 
@@ -0,0 +1,82 @@
+"""
+Cached user records for authentication.
+
+Every authenticated request resolves its user. ``get_user()`` answers from
+a small per-process LRU, then from the shared Django cache, and only then
+from the database. It returns a ``CustomUser`` built with ``from_db()``
+from ``CACHED_FIELDS`` alone: ``request.user.id`` and ``.username`` cost no
+query, and any other field is loaded on first access like a deferred field.
+Saving such an instance writes only the loaded fields.
+
+The password hash is never cached. Session requests therefore still read
+it once for the session hash check, and ``check_password()`` keeps working.
+
+The ``post_save``/``post_delete`` receivers in ``myapp.signals`` call
+``invalidate()``. Another process's LRU keeps its copy for up to
+``LOCAL_TTL`` seconds, which bounds how long a deactivation takes to apply
+everywhere.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .lru import LocalLRU
+from .models import CustomUser
+
+CACHED_FIELDS = {
+    "id", "email", "username", "first_name", "last_name", "is_active", "is_staff", "is_superuser", "profile_picture", "deleted_at",
+}
+# from_db() expects values in model field order
+FIELDS = tuple(f.attname for f in CustomUser._meta.concrete_fields if f.attname in CACHED_FIELDS)
+LOCAL_TTL = 5          # Seconds a process trusts its own copy
+LOCAL_MAX_USERS = 4096
+SHARED_TTL = 10 * 60   # Seconds in the shared cache (invalidated explicitly anyway)
+
+_local = LocalLRU(LOCAL_MAX_USERS, LOCAL_TTL)
+
+
+def _cache_key(user_id):
+    return f"user_slim:v2:{user_id}"  # v2 added deleted_at
+
+
+def _values(user_id):
+    values = _local.get(user_id)
+    if values is None:
+        values = cache.get(_cache_key(user_id))
+        if values is None:
+            values = CustomUser.objects.filter(pk=user_id).values_list(*FIELDS).first()
+            if values is None:
+                return None  # Unknown ids are not cached; a signup would have to invalidate them
+            cache.set(_cache_key(user_id), values, SHARED_TTL)
+        _local.set(user_id, values)
+    return values
+
+
+def get_user(user_id):
+    """A slim ``CustomUser`` for the id, or ``None``. Each call gets its own instance."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    values = _values(user_id)
+    if values is None:
+        return None
+    return CustomUser.from_db("default", FIELDS, values)
+
+
+def is_live(user_id):
+    """Whether the account exists and has not been deleted (see myapp.deletion)."""
+    user = get_user(user_id)
+    return user is not None and user.deleted_at is None
+
+
+def invalidate(*user_ids):
+    """Forget cached users now and again once the surrounding transaction commits."""
+    def forget():
+        for user_id in user_ids:
+            _local.delete(int(user_id))
+        cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+    if user_ids:
+        forget()
+        # A reader between now and COMMIT could re-cache the old row
+        transaction.on_commit(forget)
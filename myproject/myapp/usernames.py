@@ -0,0 +1,81 @@
+"""
+Unique username allocation.
+
+Signups default the username to the email's local part, and popular ones
+("info", "john") are long taken. ``allocate()`` reads every existing
+``<base>...`` username in one prefix query and picks the smallest free
+``<base><n>``; bulk imports (``allocate_many()``) query ``QUERY_CHUNK``
+bases at a time. On PostgreSQL the query uses the ``varchar_pattern_ops``
+index from migration 0011. Two concurrent signups can still pick the same
+name; ``save_with_unique_username()`` catches the unique violation and
+allocates again.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import CustomUser
+
+MAX_LENGTH = CustomUser._meta.get_field("username").max_length
+SUFFIX_ROOM = 6     # Digits kept free for the counter when truncating long bases
+SAVE_ATTEMPTS = 5
+QUERY_CHUNK = 200   # Bases per prefix query; SQLite refuses expressions nested 1000 deep
+
+
+def base_for(email, username=None):
+    return (username or email.split("@")[0])[: MAX_LENGTH - SUFFIX_ROOM] or "user"
+
+
+def taken_suffixes(bases):
+    """``{base: {suffixes in use}}``, one prefix query per ``QUERY_CHUNK`` bases; 0 means the bare base is taken."""
+    bases = sorted(set(bases))
+    taken = {base: set() for base in bases}
+    # Bases can prefix each other ("ann", "anna1"), so a name is tried against every base length
+    by_length = {}
+    for base in bases:
+        by_length.setdefault(len(base), set()).add(base)
+    for start in range(0, len(bases), QUERY_CHUNK):
+        prefixes = Q(*(Q(username__startswith=base) for base in bases[start:start + QUERY_CHUNK]), _connector=Q.OR)
+        for name in CustomUser.objects.filter(prefixes).values_list("username", flat=True).iterator():
+            for length, candidates in by_length.items():
+                base = name[:length]
+                if base not in candidates:
+                    continue
+                if name == base:
+                    taken[base].add(0)
+                elif re.fullmatch(r"[1-9]\d*", name[length:]):
+                    taken[base].add(int(name[length:]))
+    return taken
+
+
+def _next_free(base, used):
+    suffix = 0
+    while suffix in used:
+        suffix += 1
+    used.add(suffix)
+    return f"{base}{suffix}" if suffix else base
+
+
+def allocate(base):
+    return _next_free(base, taken_suffixes([base])[base])
+
+
+def allocate_many(bases):
+    """One free username per entry of ``bases`` (repeats get distinct names), in order."""
+    taken = taken_suffixes(bases)
+    return [_next_free(base, taken[base]) for base in bases]
+
+
+def save_with_unique_username(user, base, using=None):
+    """Save a new user under ``allocate(base)``, allocating again if a concurrent signup wins."""
+    for attempt in range(SAVE_ATTEMPTS):
+        user.username = allocate(base)
+        try:
+            with transaction.atomic(using=using):
+                user.save(using=using)
+            return user
+        except IntegrityError:
+            # Only a lost username race is retried; a duplicate email is the caller's error
+            if attempt == SAVE_ATTEMPTS - 1 or not CustomUser.objects.filter(username=user.username).exists():
+                raise
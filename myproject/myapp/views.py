@@ -1,22 +1,30 @@
 import logging
 from django.contrib.auth import authenticate
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from django.db.models import OuterRef, Subquery, Q, Value
-from django.db.models.functions import Coalesce
-from django.db.models import DateTimeField
+from django.utils.cache import get_conditional_response
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import CustomUser, Message, ChatGroup, GroupMessage
+from . import archive, compaction, conversations, deletion, downloads, inbox, listings, membership, outbox, search, sync, uploads
+from .membership import is_member
+from .models import CustomUser, Message, ChatGroup, DeletionJob, GroupMessage, UploadSession
+from .storage import dedup_storage, display_name
+from .fast_serializers import FastGroupMessageSerializer, FastMessageSerializer
+from .pagination import NEXT_HEADER, CursorError, paginate_by_recency, paginate_messages, parse_limit
 from .serializers import (
     UserSerializer,
     UpdateProfilePictureSerializer,
     MessageSerializer,
     ChatGroupSerializer,
-    GroupMessageSerializer
+    GroupMessageSerializer,
+    UploadSessionSerializer,
+    DeletionJobSerializer,
 )
 
 logger = logging.getLogger(__name__)
@@ -27,6 +35,17 @@ def error_response(message, code=status.HTTP_400_BAD_REQUEST):
     return Response({"error": message}, status=code)
 
 
+def paginated_response(request, queryset, serializer_class, archived=None):
+    """Serialize one cursor page of ``queryset`` (continued in ``archived``) with the cursors in response headers."""
+    try:
+        page = paginate_messages(queryset, request.GET, archived)
+    except CursorError as e:
+        return error_response(str(e))
+
+    serializer = serializer_class(page.messages, many=True, context={"request": request})
+    return page.apply_headers(Response(serializer.data, status=status.HTTP_200_OK))
+
+
 # ✅ User Registration
 @api_view(["POST"])
 @permission_classes([AllowAny])
@@ -64,19 +83,20 @@ def login_user(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def user_list(request):
-    users = CustomUser.objects.exclude(id=request.user.id)
-
-    last_message_subquery = Message.objects.filter(
-        Q(sender=OuterRef("id"), receiver=request.user) |
-        Q(sender=request.user, receiver=OuterRef("id"))
-    ).order_by("-timestamp").values("timestamp")[:1]
-
-    users = users.annotate(
-        last_message_time=Coalesce(Subquery(last_message_subquery, output_field=DateTimeField()), Value(None, output_field=DateTimeField()))
-    )
+    # Most recent conversations first, ordered and paged by the database (cursor in X-Cursor-Next)
+    users = inbox.with_recency(CustomUser.objects.exclude(id=request.user.id).filter(deleted_at__isnull=True), request.user)
+    try:
+        users, next_cursor = paginate_by_recency(users, request.GET, "last_activity")
+    except CursorError as e:
+        return error_response(str(e))
 
-    serializer = UserSerializer(users, many=True, context={"request": request})
-    return Response(serializer.data)
+    # One indexed read of the page's inbox entries instead of a query per listed user
+    entries = inbox.direct_entries(request.user, [user.id for user in users])
+    serializer = UserSerializer(users, many=True, context={"request": request, "inbox": entries})
+    response = Response(serializer.data)
+    if next_cursor:
+        response[NEXT_HEADER] = next_cursor
+    return response
 
 
 # ✅ Get Authenticated User Info
@@ -98,13 +118,130 @@ def current_user(request):
 def get_messages(request, user_id):
     other_user = get_object_or_404(CustomUser, id=user_id)
 
-    messages = Message.objects.filter(
-        Q(sender=request.user, receiver=other_user) |
-        Q(sender=other_user, receiver=request.user)
-    ).select_related("sender", "receiver").order_by("-timestamp")[:50]
+    key = Message.conversation_key(request.user.id, other_user.id)
+    messages = Message.objects.filter(conversation=key)
+    archived = archive.History("dm", conversations.dm_id(key))
+    return paginated_response(request, FastMessageSerializer.queryset(messages), FastMessageSerializer, archived)
+
+
+# ✅ Search Messages
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_messages(request):
+    """Ranked full-text search over the user's DMs and groups (``?q=...&cursor=...&conversation=...``)."""
+    try:
+        page = search.search(
+            request.user.id,
+            request.GET.get("q", ""),
+            cursor=request.GET.get("cursor"),
+            limit=parse_limit(request.GET.get("limit")),
+            conversation=request.GET.get("conversation"),
+        )
+    except (search.SearchError, CursorError) as e:
+        return error_response(str(e))
+
+    context = {"request": request}
+    results = []
+    for hit, message in page.results:
+        if isinstance(message, GroupMessage):
+            conversation, message_type = conversations.group_id(message.group_id), "group"
+            data = GroupMessageSerializer(message, context=context).data
+        else:
+            conversation, message_type = conversations.dm_id(message.conversation), "private"
+            data = MessageSerializer(message, context=context).data
+        results.append({"conversation": conversation, "message_type": message_type, "message": data})
+
+    response = Response(results, status=status.HTTP_200_OK)
+    if page.next_cursor:
+        response[NEXT_HEADER] = page.next_cursor
+    return response
+
+
+# ✅ Delta Sync After Reconnect
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def sync_messages(request):
+    """New messages and deletions since the client's per-conversation last seen ids (see myapp.sync)."""
+    try:
+        last_seen, tombstones_after, limit = sync.parse_request(request.data)
+    except sync.SyncError as e:
+        return error_response(str(e))
+
+    data = sync.sync(request.user.id, last_seen, tombstones_after, limit, context={"request": request})
+    return Response(data, status=status.HTTP_200_OK)
+
 
-    serializer = MessageSerializer(messages, many=True, context={"request": request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+# ✅ Resumable Uploads (see myapp/uploads.py)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return error_response(serializer.errors)
+    try:
+        session = uploads.create(request.user, **serializer.validated_data)
+    except uploads.UploadError as e:
+        return error_response(e.message, e.status)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["GET", "PUT"])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id):
+    """GET: session state (the offset to resume from). PUT: raw chunk bytes at ``Upload-Offset``."""
+    session = get_object_or_404(UploadSession, id=upload_id, owner=request.user)
+    if request.method == "GET":
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.headers.get("Content-Length", ""))
+    except ValueError:
+        return error_response("Upload-Offset and Content-Length headers are required.")
+    try:
+        # Read from the raw stream: nothing is parsed or buffered in memory
+        session = uploads.write_chunk(session, offset, request.stream, length, request.headers.get("X-Chunk-SHA256"))
+    except uploads.UploadError as e:
+        return error_response(e.message, e.status)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def complete_upload(request, upload_id):
+    session = get_object_or_404(UploadSession, id=upload_id, owner=request.user)
+    try:
+        session = uploads.complete(session)
+    except uploads.UploadError as e:
+        return error_response(e.message, e.status)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+# ✅ Download Attachments (see myapp/downloads.py)
+@api_view(["GET"])
+@permission_classes([AllowAny])  # JWT/session, or the signed ?token= of a download_url
+def download_attachment(request, kind, message_id):
+    model = downloads.KINDS.get(kind)
+    if model is None:
+        return error_response("Unknown attachment kind.", status.HTTP_404_NOT_FOUND)
+
+    if request.user.is_authenticated:
+        user_id = request.user.id
+    else:
+        user_id = downloads.token_user_id(request.GET.get("token", ""), kind, message_id)
+        if user_id is None:
+            return error_response("Authentication required.", status.HTTP_401_UNAUTHORIZED)
+
+    message = model.objects.filter(id=message_id).first() or archive.find(kind, message_id)
+    if message is None:
+        return error_response("Message not found.", status.HTTP_404_NOT_FOUND)
+    if getattr(message, "is_deleted", False):
+        return error_response("This message was deleted.", status.HTTP_404_NOT_FOUND)
+    if not downloads.can_access(user_id, message):
+        return error_response("You do not have access to this attachment.", status.HTTP_403_FORBIDDEN)
+    if not message.file:
+        return error_response("This message has no attachment.", status.HTTP_404_NOT_FOUND)
+    return downloads.serve(request, message.file, display_name(message.file.name, message.original_name))
 
 
 # ✅ Send Message
@@ -120,38 +257,50 @@ def send_message(request):
     recipient_id = data.get("recipient_id")  # If it's a direct message
     message_content = data.get("content")
     file = request.FILES.get("file")
+    upload_id = data.get("upload_id")  # A completed upload session instead of a multipart file
 
     # Ensure we have a valid recipient (either group or user)
     if not group_id and not recipient_id:
         return Response({"error": "Recipient is required (group_id or recipient_id)."}, status=status.HTTP_400_BAD_REQUEST)
 
-    if not message_content and not file:
+    if not message_content and not file and not upload_id:
         return Response({"error": "Either message content or a file is required."}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        if group_id:
-            # Handle group messages
-            chat_group = ChatGroup.objects.get(id=group_id)
-            message = GroupMessage.objects.create(
-                group=chat_group,
-                sender=user,
-                content=message_content,
-                file=file
-            )
-            serializer = GroupMessageSerializer(message, context={"request": request})
-        else:
-            # Handle direct messages
-            recipient = CustomUser.objects.get(id=recipient_id)
-            message = Message.objects.create(
-                sender=user,
-                receiver=recipient,
-                content=message_content,
-                file=file
-            )
-            serializer = MessageSerializer(message, context={"request": request})
+        with transaction.atomic():  # A failed send leaves the upload claimable
+            original_name = None
+            if upload_id:
+                session = uploads.claim(user, upload_id)
+                file, original_name = session.file_name, session.filename
+            if group_id:
+                # Handle group messages
+                chat_group = ChatGroup.objects.alive().get(id=group_id)
+                message = GroupMessage.objects.create(
+                    group=chat_group,
+                    sender=user,
+                    content=message_content,
+                    file=file,
+                    original_name=original_name
+                )
+                outbox.message_created(message, user.username)  # Live sockets get it once committed
+                serializer = GroupMessageSerializer(message, context={"request": request})
+            else:
+                # Handle direct messages
+                recipient = CustomUser.objects.get(id=recipient_id, deleted_at__isnull=True)  # Not a deleted account
+                message = Message.objects.create(
+                    sender=user,
+                    receiver=recipient,
+                    content=message_content,
+                    file=file,
+                    original_name=original_name
+                )
+                outbox.message_created(message, user.username)
+                serializer = MessageSerializer(message, context={"request": request})
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    except uploads.UploadError as e:
+        return error_response(e.message, e.status)
     except ChatGroup.DoesNotExist:
         return Response({"error": "Group not found."}, status=status.HTTP_404_NOT_FOUND)
     except CustomUser.DoesNotExist:
@@ -189,15 +338,18 @@ def update_profile_picture(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_groups(request):
-    """Retrieve groups where the user is a member."""
+    """Retrieve groups where the user is a member (``?compact=1`` for member counts instead of ids)."""
     name = request.GET.get("name", "").strip()
-    groups = ChatGroup.objects.filter(members=request.user)
+    compact = request.GET.get("compact", "").lower() in ("1", "true")
 
-    if name:
-        groups = groups.filter(name__icontains=name)
- 
-    serializer = ChatGroupSerializer(groups, many=True, context={"request": request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    etag, data = listings.group_listing(request, name, compact)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+    return Response(data, status=status.HTTP_200_OK, headers=headers)
 
 
 # ✅ Create Group
@@ -219,13 +371,26 @@ def update_group_icon(request, group_name):
     group = get_object_or_404(ChatGroup, name=group_name)
 
     # ✅ Only allow group members to update the icon
-    if request.user not in group.members.all():
+    if not group.has_member(request.user):
         return Response({"error": "Only group members can update the icon."}, status=status.HTTP_403_FORBIDDEN)
 
     icon = request.FILES.get("icon")
-    if not icon:
+    upload_id = request.data.get("upload_id")
+    if not icon and not upload_id:
         return Response({"error": "Group icon is required."}, status=status.HTTP_400_BAD_REQUEST)
 
+    if upload_id:
+        try:
+            with transaction.atomic():
+                session = uploads.claim(request.user, upload_id)
+                # Icons live in the default storage; claim() released the blob, which stays only if a message shares it
+                with dedup_storage().open(session.file_name) as blob:
+                    group.icon.save(session.filename, File(blob), save=False)
+                group.save()
+        except uploads.UploadError as e:
+            return error_response(e.message, e.status)
+        return Response({"message": "Group icon updated successfully."}, status=status.HTTP_200_OK)
+
     group.icon = icon
     group.save()
     return Response({"message": "Group icon updated successfully."}, status=status.HTTP_200_OK)
@@ -245,64 +410,211 @@ def remove_user_from_group(request):
     user_to_remove = get_object_or_404(CustomUser, username=username)
 
     # ✅ Only group members can remove users
-    if request.user not in group.members.all():
+    if not group.has_member(request.user):
         return Response({"error": "Only group members can remove users."}, status=status.HTTP_403_FORBIDDEN)
 
     # ✅ Prevent removing the group admin
     if user_to_remove == group.admin:
         return Response({"error": "You cannot remove the group admin."}, status=status.HTTP_403_FORBIDDEN)
 
-    if user_to_remove not in group.members.all():
+    if not group.has_member(user_to_remove):
         return Response({"error": "User is not a member of this group."}, status=status.HTTP_400_BAD_REQUEST)
 
     group.members.remove(user_to_remove)
     return Response({"message": f"User '{username}' removed from '{group_name}' successfully."}, status=status.HTTP_200_OK)
 
 
+# ✅ Bulk Group Membership
+MAX_BULK_MEMBERS = 1000
+
+
+def resolve_member_refs(data):
+    """
+    ``(refs, users by ref)`` for the ``user_ids`` and ``usernames`` lists of a
+    bulk membership request, resolved in one query. Raises ``ValueError``.
+    """
+    user_ids = data.get("user_ids") or []
+    usernames = data.get("usernames") or []
+    if not isinstance(user_ids, list) or not isinstance(usernames, list):
+        raise ValueError("user_ids and usernames must be lists.")
+    if not user_ids and not usernames:
+        raise ValueError("Provide user_ids or usernames.")
+    if len(user_ids) + len(usernames) > MAX_BULK_MEMBERS:
+        raise ValueError(f"At most {MAX_BULK_MEMBERS} users per request.")
+    try:
+        user_ids = [int(user_id) for user_id in user_ids]
+    except (TypeError, ValueError):
+        raise ValueError("user_ids must be integers.")
+    usernames = [str(username).strip() for username in usernames]
+
+    found = (
+        CustomUser.objects.filter(Q(id__in=user_ids) | Q(username__in=usernames), deleted_at__isnull=True)
+        .values_list("id", "username")
+    )
+    by_id, by_username = {}, {}
+    for user_id, username in found:
+        by_id[user_id] = user_id
+        by_username[username] = user_id
+    refs = [("id", user_id) for user_id in user_ids] + [("username", username) for username in usernames]
+    return refs, {ref: (by_id if ref[0] == "id" else by_username).get(ref[1]) for ref in refs}
+
+
+def bulk_member_response(group, refs, results):
+    summary = {}
+    for outcome in results.values():
+        summary[outcome] = summary.get(outcome, 0) + 1
+    return Response({
+        "group_id": group.id,
+        "results": [{ref[0]: ref[1], "status": results[ref]} for ref in refs],
+        "summary": summary,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def add_group_members(request, group_id):
+    """Add many users at once; each result is added, already_member, duplicate or not_found."""
+    group = get_object_or_404(ChatGroup.objects.alive(), id=group_id)
+    if not group.has_member(request.user):
+        return error_response("Only group members can add users.", status.HTTP_403_FORBIDDEN)
+    try:
+        refs, users = resolve_member_refs(request.data)
+    except ValueError as e:
+        return error_response(str(e))
+
+    members = membership.member_ids(group.id)
+    to_add = set()
+    results = {}
+    for ref in refs:
+        user_id = users[ref]
+        if ref in results:
+            continue  # Listed twice
+        if user_id is None:
+            results[ref] = "not_found"
+        elif user_id in to_add:
+            results[ref] = "duplicate"  # Same user listed by id and username
+        elif user_id in members:
+            results[ref] = "already_member"
+        else:
+            to_add.add(user_id)
+            results[ref] = "added"
+
+    # One insert into the through table; the m2m_changed receivers update inboxes and sockets once
+    group.members.add(*to_add)
+    return bulk_member_response(group, refs, results)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def remove_group_members(request, group_id):
+    """Remove many users at once; each result is removed, not_member, is_admin, duplicate or not_found."""
+    group = get_object_or_404(ChatGroup.objects.alive(), id=group_id)
+    if not group.has_member(request.user):
+        return error_response("Only group members can remove users.", status.HTTP_403_FORBIDDEN)
+    try:
+        refs, users = resolve_member_refs(request.data)
+    except ValueError as e:
+        return error_response(str(e))
+
+    members = membership.member_ids(group.id)
+    to_remove = set()
+    results = {}
+    for ref in refs:
+        user_id = users[ref]
+        if ref in results:
+            continue  # Listed twice
+        if user_id is None:
+            results[ref] = "not_found"
+        elif user_id == group.admin_id:
+            results[ref] = "is_admin"
+        elif user_id in to_remove:
+            results[ref] = "duplicate"
+        elif user_id not in members:
+            results[ref] = "not_member"
+        else:
+            to_remove.add(user_id)
+            results[ref] = "removed"
+
+    # One delete on the through table
+    group.members.remove(*to_remove)
+    return bulk_member_response(group, refs, results)
+
+
 @api_view(["DELETE"])
 @permission_classes([IsAuthenticated])
 def delete_group(request, group_name):  # ✅ Accepts group_name as a URL parameter
     group = get_object_or_404(ChatGroup, name=group_name)
 
     # ✅ Ensure the user is part of the group before allowing deletion
-    if request.user not in group.members.all():
+    if not group.has_member(request.user):
         return Response({"error": "You must be a group member to delete it."}, status=status.HTTP_403_FORBIDDEN)
 
-    # ✅ Clear members and delete the group
-    group.members.clear()
-    group.delete()
+    # ✅ Members lose access now; messages and files are purged in the background
+    job = deletion.delete_group(group, request.user)
+
+    return Response(
+        {"message": f"Group '{group_name}' deleted successfully.", "job": DeletionJobSerializer(job).data},
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+# ✅ Delete Account
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def delete_account(request):
+    """Deactivate the requesting user's account now and purge their messages in the background."""
+    job = deletion.delete_account(request.user, request.user)
+    return Response(
+        {"message": "Account deleted.", "job": DeletionJobSerializer(job).data}, status=status.HTTP_202_ACCEPTED
+    )
 
-    return Response({"message": f"Group '{group_name}' deleted successfully."}, status=status.HTTP_200_OK)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
-def get_group_messages(request, group_id):
-    group = get_object_or_404(ChatGroup, id=group_id)
+def deletion_job(request, job_id):
+    """Progress of a deletion the user requested."""
+    job = get_object_or_404(DeletionJob, id=job_id, requested_by=request.user)
+    return Response(DeletionJobSerializer(job).data, status=status.HTTP_200_OK)
 
-    if request.user not in group.members.all():
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_group_messages(request, group_id):
+    # Members imply the group exists; only fall back to the DB to tell 404 from 403
+    if not is_member(group_id, request.user.id):
+        get_object_or_404(ChatGroup.objects.alive(), id=group_id)
         return error_response("You are not a member of this group.", status.HTTP_403_FORBIDDEN)
 
-    messages = GroupMessage.objects.filter(group=group).select_related("sender").order_by("-timestamp")
-    serializer = GroupMessageSerializer(messages, many=True, context={"request": request})
-
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    messages = GroupMessage.objects.visible().filter(group_id=group_id)
+    archived = archive.History("group", conversations.group_id(group_id))
+    return paginated_response(request, FastGroupMessageSerializer.queryset(messages), FastGroupMessageSerializer, archived)
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def send_group_message(request, group_id):
-    group = get_object_or_404(ChatGroup, id=group_id)
-
-    if request.user not in group.members.all():
+    if not is_member(group_id, request.user.id):
+        get_object_or_404(ChatGroup.objects.alive(), id=group_id)
         return error_response("You are not a member of this group.", status.HTTP_403_FORBIDDEN)
 
     content = request.data.get("content", "").strip()
     file = request.FILES.get("file")
+    upload_id = request.data.get("upload_id")
 
-    if not content and not file:
+    if not content and not file and not upload_id:
         return error_response("Message content or file is required.")
 
-    message = GroupMessage.objects.create(group=group, sender=request.user, content=content, file=file)
+    try:
+        with transaction.atomic():
+            original_name = None
+            if upload_id:
+                session = uploads.claim(request.user, upload_id)
+                file, original_name = session.file_name, session.filename
+            message = GroupMessage.objects.create(
+                group_id=group_id, sender=request.user, content=content, file=file, original_name=original_name
+            )
+            outbox.message_created(message, request.user.username)  # Live sockets get it once committed
+    except uploads.UploadError as e:
+        return error_response(e.message, e.status)
     serializer = GroupMessageSerializer(message, context={"request": request})
 
     return Response(serializer.data, status=status.HTTP_201_CREATED)  # ✅ Fixed missing return
@@ -314,13 +626,15 @@ def send_group_message(request, group_id):
 def delete_group_message(request, message_id):
     """
     Delete a group message if the sender is the authenticated user.
+    Soft delete: the row is compacted later (see myapp/compaction.py).
     """
-    message = get_object_or_404(GroupMessage, id=message_id)
+    message = get_object_or_404(GroupMessage.objects.visible(), id=message_id)
 
-    if message.sender != request.user:
+    if message.sender_id != request.user.id:
         return Response({"error": "You can only delete messages that you sent."}, status=status.HTTP_403_FORBIDDEN)
 
-    message.delete()
+    if not compaction.soft_delete(message):
+        return error_response("Group message not found.", status.HTTP_404_NOT_FOUND)  # Deleted concurrently
     return Response({"message": "Group message deleted successfully."}, status=status.HTTP_200_OK)
 
 #add user in group 
@@ -329,8 +643,6 @@ def delete_group_message(request, message_id):
 @permission_classes([IsAuthenticated])
 def add_user_to_group(request):
     """Allows an authenticated user (usually an admin) to add a member to a group."""
-    print("Received Data:", request.data)  # Debugging
-    
     group_name = request.data.get("group_name", "").strip()
     username = request.data.get("username", "").strip()
 
@@ -338,12 +650,12 @@ def add_user_to_group(request):
         return error_response("Group name and username are required.", status.HTTP_400_BAD_REQUEST)
     
     group = get_object_or_404(ChatGroup, name=group_name)
-    user_to_add = get_object_or_404(CustomUser, username=username)
+    user_to_add = get_object_or_404(CustomUser, username=username, deleted_at__isnull=True)
 
-    if request.user not in group.members.all():
+    if not group.has_member(request.user):
         return error_response("Only group members can add users.", status.HTTP_403_FORBIDDEN)
 
-    if user_to_add in group.members.all():
+    if group.has_member(user_to_add):
         return error_response("User is already in the group.", status.HTTP_400_BAD_REQUEST)
 
     group.members.add(user_to_add)
@@ -0,0 +1,232 @@
+"""
+Write-behind persistence for messages received over WebSockets.
+
+Consumers hand unsaved ``Message``/``GroupMessage`` instances to
+``submit()``. A single worker task per model drains the bounded queue and
+stores whatever has accumulated with one ``bulk_create`` as soon as
+``MAX_BATCH`` rows are pending or ``FLUSH_INTERVAL`` seconds have passed.
+The future returned by ``submit()`` resolves to the stored instance (with
+its id and timestamp) so the consumer can broadcast and acknowledge it.
+
+``bulk_create`` bypasses ``save()`` and the post_save signals, so the
+buffer sets ``Message.conversation`` and updates the inbox itself. A batch
+that breaks a constraint is stored again one row at a time, so one bad row
+fails only its own future.
+
+Shutdown. Every batch taken off the queue stays in ``unwritten`` until its
+transaction has committed (the worker thread removes it), so nothing
+accepted is lost however the server stops:
+
+* Servers that send the ASGI lifespan events (uvicorn, hypercorn) run
+  ``lifespan()``, which awaits ``close_all()``: queued rows are stored and
+  their futures resolved while the event loop still runs.
+* daphne, and therefore channels' ``runserver``, never send them. On
+  SIGINT/SIGTERM the loop just stops; running writes finish in their
+  threads, then the ``atexit`` hook ``close_sync()`` stores every batch that
+  was unwritten or still queued. The sockets are gone by then, so those
+  rows are not acknowledged or broadcast.
+* After SIGKILL or a crash, up to ``MAX_PENDING`` queued rows are lost.
+"""
+import asyncio
+import atexit
+import contextlib
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import inbox
+from .models import GroupMessage, Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_BATCH": 100,        # Rows per bulk_create
+    "FLUSH_INTERVAL": 0.05,  # Seconds the first queued row may wait for company
+    "MAX_PENDING": 1000,     # Queue bound; submit() waits for room beyond this
+}
+
+
+def get_setting(name):
+    return getattr(settings, "MESSAGE_WRITE_BEHIND", {}).get(name, DEFAULTS[name])
+
+
+class WriteBehindBuffer:
+    def __init__(self, model, prepare=None, after_write=None):
+        self.model = model
+        self.prepare = prepare
+        self.after_write = after_write
+        self.max_batch = get_setting("MAX_BATCH")
+        self.flush_interval = get_setting("FLUSH_INTERVAL")
+        self.queue = None
+        self.worker = None
+        self.inflight = None
+        self.unwritten = []  # Batches taken off the queue whose write has not committed
+        self.lock = threading.Lock()  # unwritten is emptied from the worker threads
+
+    async def submit(self, instance):
+        """Queue an unsaved instance; returns a future resolving to the stored row."""
+        if self.worker is None or self.worker.done():
+            self.queue = self.queue or asyncio.Queue(maxsize=get_setting("MAX_PENDING"))
+            self.worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((instance, future))  # Back-pressure when the queue is full
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            self._track(batch)  # Before anything is taken, so a cancelled worker leaves no row behind
+            batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Shielded so close() can cancel the worker without abandoning a running write
+            self.inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self.inflight)
+
+    def _track(self, batch):
+        with self.lock:
+            self.unwritten.append(batch)
+
+    def _untrack(self, batch):
+        with self.lock:
+            self.unwritten = [other for other in self.unwritten if other is not batch]
+
+    def _write_batch(self, batch):
+        results = self.write([instance for instance, _ in batch])
+        self._untrack(batch)  # In the worker thread, so it counts even if the loop is gone by now
+        return results
+
+    async def _flush(self, batch):
+        try:
+            results = await database_sync_to_async(self._write_batch)(batch)
+        except Exception as e:
+            self._untrack(batch)  # The callers get the error; not retried at exit
+            logger.exception("Write-behind flush of %d %s rows failed", len(batch), self.model.__name__)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def write(self, instances):
+        """
+        Store a batch in one transaction: one INSERT plus the inbox updates.
+        If a row breaks a constraint (e.g. a DM to an account that is gone),
+        the rows are stored one by one instead, so only that row fails.
+        Returns the stored row or the ``IntegrityError`` for each instance.
+        """
+        if self.prepare:
+            self.prepare(instances)
+        try:
+            return self._store(instances)
+        except IntegrityError:
+            if len(instances) == 1:
+                raise
+        logger.warning("Write-behind batch of %d %s rows hit a constraint; storing them one by one", len(instances), self.model.__name__)
+        results = []
+        for instance in instances:
+            instance.pk = None  # Ids handed out by the rolled-back INSERT
+            try:
+                results += self._store([instance])
+            except IntegrityError as e:
+                results.append(e)
+        return results
+
+    def _store(self, instances):
+        with transaction.atomic():
+            stored = self.model.objects.bulk_create(instances)
+            if self.after_write:
+                self.after_write(stored)
+        return stored
+
+    def _drain(self):
+        batch = []
+        while self.queue is not None and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    def _take_unwritten(self):
+        """Every accepted row not stored yet, as batches: the unwritten ones plus what is still queued."""
+        with self.lock:
+            batches, self.unwritten = [batch for batch in self.unwritten if batch], []
+        queued = self._drain()
+        return batches + ([queued] if queued else [])
+
+    async def close(self):
+        """Stop the worker and store everything still queued."""
+        if self.worker is not None:
+            self.worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.worker
+            self.worker = None
+        if self.inflight is not None:
+            await self.inflight
+        for batch in self._take_unwritten():
+            self._track(batch)
+            await self._flush(batch)
+
+    def close_sync(self):
+        """
+        Last-resort flush at interpreter exit, once the event loop is gone:
+        stores the batches whose write never started or was interrupted
+        and whatever is still queued.
+        """
+        for batch in self._take_unwritten():
+            try:
+                results = self.write([instance for instance, _ in batch])
+            except Exception:
+                logger.exception("Dropping %d unsaved %s rows at exit", len(batch), self.model.__name__)
+                continue
+            failed = sum(isinstance(result, Exception) for result in results)
+            if failed:
+                logger.error("Dropping %d unsaved %s rows at exit", failed, self.model.__name__)
+
+
+def _set_conversation(messages):
+    for message in messages:
+        message.conversation = Message.conversation_key(message.sender_id, message.receiver_id)
+
+
+direct_messages = WriteBehindBuffer(Message, prepare=_set_conversation, after_write=inbox.record_direct_messages)
+group_messages = WriteBehindBuffer(GroupMessage, after_write=inbox.record_group_messages)
+BUFFERS = (direct_messages, group_messages)
+
+
+async def close_all():
+    for buffer in BUFFERS:
+        await buffer.close()
+
+
+@atexit.register
+def _close_all_sync():
+    for buffer in BUFFERS:
+        buffer.close_sync()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan handler: flush the buffers when the server shuts down."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_all()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,97 @@
+"""
+JWT authentication for WebSocket connections.
+
+Browsers cannot set an ``Authorization`` header on a WebSocket, so the SPA
+sends its SimpleJWT access token either as ``?token=<jwt>`` or as the
+subprotocol pair ``["bearer", "<jwt>"]``. A valid token replaces the
+session user that ``AuthMiddlewareStack`` put in ``scope["user"]``. An
+invalid one leaves it alone, and the consumers close unauthenticated
+sockets with 4401.
+
+Verified tokens are cached per process under their ``jti`` until they
+expire, together with their validated payload. A reconnect storm after a
+deploy therefore costs one signature check per token, not per socket. A hit
+is only trusted if the presented token is byte-for-byte the one that was
+verified, and it still goes through the user checks (``check_user()``). The
+user comes from ``myapp.user_cache``, so a deactivation, an account deletion
+or a password change that revokes tokens applies to new sockets as soon as
+that cache drops the user.
+"""
+import hmac
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication
+from .lru import LocalLRU
+
+SUBPROTOCOL = "bearer"
+CACHE_MAX_TOKENS = 10000
+
+_verified = LocalLRU(CACHE_MAX_TOKENS, ttl=0)  # Entries get the token's remaining lifetime
+
+
+def token_from_scope(scope):
+    """``(token, subprotocol to accept)`` from the query string or the subprotocol list."""
+    subprotocols = scope.get("subprotocols") or []
+    if SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], SUBPROTOCOL
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return (query.get("token") or [None])[0], None
+
+
+def check_user(validated):
+    """
+    The token's user if they may still use it, else ``None``: the checks of
+    ``CachedJWTAuthentication`` (unknown, inactive or deleted users, tokens
+    revoked by a password change), run for cached tokens too.
+    """
+    try:
+        return CachedJWTAuthentication().get_user(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def verify(token):
+    """The active user a raw access token belongs to, or ``None`` (runs in a worker thread)."""
+    try:
+        validated = AccessToken(token)
+    except TokenError:
+        return None
+    user = check_user(validated)
+    if user is None:
+        return None
+    remaining = validated["exp"] - time.time()
+    if validated.get("jti") and remaining > 0:
+        _verified.set(validated["jti"], (token, validated), ttl=remaining)
+    return user
+
+
+async def user_for_token(token):
+    try:
+        # The payload is only trusted below if the cached token is identical
+        jti = AccessToken(token, verify=False).get("jti")
+    except TokenError:
+        return None
+    cached = _verified.get(jti) if jti else None
+    if cached is not None and hmac.compare_digest(cached[0], token):
+        return await database_sync_to_async(check_user)(cached[1])
+    return await database_sync_to_async(verify)(token)
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token, subprotocol = token_from_scope(scope)
+        if token:
+            user = await user_for_token(token)
+            if user is not None:
+                scope["user"] = user
+                scope["jwt_subprotocol"] = subprotocol
+        return await super().__call__(scope, receive, send)
@@ -2,13 +2,21 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-import myapp.routing  # Ensure you have this
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
 
+# Set up Django before importing consumers (they import models)
+django_asgi_app = get_asgi_application()
+
+import myapp.routing  # noqa: E402  Ensure you have this
+from myapp import write_behind  # noqa: E402
+from myapp.ws_auth import JWTAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
+    # Session user first; a valid JWT (?token= or "bearer" subprotocol) replaces it
     "websocket": AuthMiddlewareStack(
-        URLRouter(myapp.routing.websocket_urlpatterns)
+        JWTAuthMiddleware(URLRouter(myapp.routing.websocket_urlpatterns))
     ),
+    "lifespan": write_behind.lifespan,  # Flushes queued WebSocket messages on shutdown
 })
@@ -58,6 +58,13 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-csrftoken',
+    'if-none-match',  # ✅ Conditional group listings
+]
+CORS_EXPOSE_HEADERS = [
+    'x-cursor-before',  # ✅ Message history pagination cursors
+    'x-cursor-after',
+    'x-cursor-next',  # ✅ Search result pagination
+    'etag',  # ✅ Conditional group listings
 ]
 CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS
 
@@ -73,7 +80,7 @@ AUTHENTICATION_BACKENDS = [
 # ✅ Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.CachedJWTAuthentication',  # JWTAuthentication with cached users
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -81,10 +88,10 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'myapp.renderers.ORJSONRenderer',  # Same output as JSONRenderer, faster
     ] if not DEBUG else [
         'rest_framework.renderers.BrowsableAPIRenderer',
-        'rest_framework.renderers.JSONRenderer',
+        'myapp.renderers.ORJSONRenderer',
     ],
 }
 
@@ -132,6 +139,76 @@ CHANNEL_LAYERS = {
     },
 }
 
+# ✅ Write-behind persistence for WebSocket messages (see myapp/write_behind.py)
+MESSAGE_WRITE_BEHIND = {
+    'MAX_BATCH': 100,        # Rows per bulk_create
+    'FLUSH_INTERVAL': 0.05,  # Seconds before a partial batch is flushed
+    'MAX_PENDING': 1000,     # Bounded queue; senders wait when it is full
+}
+
+# ✅ Transactional outbox for REST-sent messages, drained by `manage.py relay_outbox` (see myapp/outbox.py)
+OUTBOX = {
+    'BATCH_SIZE': 100,     # Events per read
+    'POLL_INTERVAL': 0.2,  # Seconds between reads while empty
+    'RETRY_DELAY': 5,      # Seconds to back off when the channel layer fails
+    'MAX_ATTEMPTS': 12,    # Failed sends before an event is dead-lettered (failed_at) and skipped
+}
+
+# ✅ Soft-deleted group messages, compacted by `manage.py compact_messages` (see myapp/compaction.py)
+MESSAGE_COMPACTION = {
+    'RETENTION': 7 * 24 * 60 * 60,             # Seconds a soft-deleted message is kept
+    'TOMBSTONE_RETENTION': 30 * 24 * 60 * 60,  # Seconds tombstones are kept for delta sync
+    'BATCH_SIZE': 500,                         # Rows per transaction
+}
+
+# ✅ Archive of old messages in compressed segments, written by `manage.py archive_messages` (see myapp/archive.py)
+MESSAGE_ARCHIVE = {
+    'DIR': BASE_DIR / 'archive',  # Segment files, outside MEDIA_ROOT
+    'AGE': 365 * 24 * 60 * 60,    # Seconds before a message is archived
+    'COMPRESSION': 'gzip',        # or 'zstd' (needs the zstandard package)
+    'BATCH_SIZE': 5000,           # Messages per segment at most
+}
+
+# ✅ Background image thumbnails (see myapp/thumbnails.py)
+THUMBNAILS = {
+    'SIZES': (64, 256, 1024),  # Longest edge in pixels, rendered as WebP
+    'QUALITY': 80,
+    'WORKERS': 2,              # Processes in the resize pool
+}
+
+# ✅ Resumable chunked uploads (see myapp/uploads.py)
+UPLOAD_SESSIONS = {
+    'DIR': BASE_DIR / 'upload_sessions',  # Part files, outside MEDIA_ROOT
+    'MAX_SIZE': 2 * 1024 ** 3,            # Bytes per upload
+    'MAX_CHUNK': 8 * 1024 ** 2,           # Bytes per PUT
+    'TTL': 24 * 60 * 60,                  # Seconds before an unused session is expired
+}
+
+# ✅ Attachment downloads (see myapp/downloads.py)
+ATTACHMENT_DOWNLOADS = {
+    # 'stream' copies the bytes through Python under ASGI; behind nginx/Apache use 'x-accel-redirect'/'x-sendfile'
+    'MODE': os.environ.get('ATTACHMENT_DOWNLOAD_MODE', 'stream'),
+    'INTERNAL_PREFIX': '/protected-media/',  # nginx `internal` location aliased to MEDIA_ROOT
+    'TOKEN_TTL': 60 * 60,                    # Seconds a signed download_url stays valid
+}
+
+# ✅ Cache (membership lookups etc.); shared Redis cache when configured, per-process otherwise
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_CACHE_URL'],
+    } if os.environ.get('REDIS_CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# ✅ Cached group member lists (see myapp/membership.py)
+GROUP_MEMBERSHIP = {
+    'LOCAL_TTL': 5,            # Seconds a process trusts its own copy; bounds cross-process staleness
+    'LOCAL_MAX_GROUPS': 1024,  # Groups in the per-process LRU
+    'SHARED_TTL': 60 * 60,     # Seconds in the shared cache
+}
+
 # ✅ Static & Media Files Configuration
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
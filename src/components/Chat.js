@@ -146,7 +146,7 @@ const Chat = ({ selectedUser, currentUserId, socket }) => {
         ) : (
           messages.map((msg, index) => {
             if (!msg) return null;
-            const { id, sender_username, sender_name, file_url, content, timestamp } = msg;
+            const { id, sender_username, sender_name, file_url, file_name, content, timestamp } = msg;
             const msgTimestamp = timestamp ? new Date(timestamp) : new Date();
             const isSentByCurrentUser = msg.sender_id === currentUserId;
 
@@ -178,7 +178,7 @@ const Chat = ({ selectedUser, currentUserId, socket }) => {
                       <img src={file_url} alt="Uploaded" className="message-img" />
                     ) : (
                       <a href={file_url} target="_blank" rel="noopener noreferrer" className="file-link">
-                        {file_url.split("/").pop()}
+                        {file_name || file_url.split("/").pop()}
                       </a>
                     )
                   ) : (
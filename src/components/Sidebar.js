@@ -3,6 +3,7 @@ import axios from "axios";
 import Navbar from "./Navbar";  // ✅ Navbar at the top
 import Search from "./Search";
 import Chats from "./Chats";
+import { fetchAllUsers } from "../services/apiService";
 import "../pages/dashboard.css";
 
 const Sidebar = ({ onSelectUser, onSelectGroup, currentUser }) => {
@@ -35,16 +36,16 @@ const Sidebar = ({ onSelectUser, onSelectGroup, currentUser }) => {
         const headers = { Authorization: `Bearer ${token}` };
 
         // ✅ Fetch Users & Groups in Parallel with AbortController
-        const [userResponse, groupResponse] = await Promise.all([
-          axios.get("http://localhost:8000/api/users/", { headers, signal: controller.signal }),
+        const [allUsers, groupResponse] = await Promise.all([
+          fetchAllUsers({ signal: controller.signal }),
           axios.get("http://localhost:8000/api/groups/", { headers, signal: controller.signal }),
         ]);
 
-        if (!Array.isArray(userResponse.data) || !Array.isArray(groupResponse.data)) {
+        if (!Array.isArray(groupResponse.data)) {
           throw new Error("Unexpected server response.");
         }
 
-        setUsers(userResponse.data.filter((user) => user.id !== currentUser?.id));
+        setUsers(allUsers.filter((user) => user.id !== currentUser?.id));
         setGroups(groupResponse.data);
       } catch (err) {
         if (axios.isCancel(err)) return; // ✅ Prevent error if request was canceled
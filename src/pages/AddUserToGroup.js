@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
-import apiClient from "../services/apiService";
+import apiClient, { fetchAllUsers } from "../services/apiService";
 import "../pages/AddUserToGroup.css";
 
 const AddUserToGroup = () => {
@@ -28,8 +28,7 @@ const AddUserToGroup = () => {
     // ✅ Fetch all users
     const fetchAllUsers = async () => {
       try {
-        const response = await apiClient.get("/users/");
-        setAllUsers(response.data);
+        setAllUsers(await fetchAllUsers());
       } catch (error) {
         console.error("Failed to fetch users", error);
       }
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
+import { fetchAllUsers } from "../services/apiService";
 import "./CreateGroup.css";
 
 const CreateGroup = () => {
@@ -10,12 +11,8 @@ const CreateGroup = () => {
   // Fetch Users for Group Creation
   useEffect(() => {
     const fetchUsers = async () => {
-      const token = localStorage.getItem("access_token");
       try {
-        const response = await axios.get("http://localhost:8000/api/users/", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setMembers(response.data);
+        setMembers(await fetchAllUsers());
       } catch (error) {
         console.error("Error fetching users:", error);
       }
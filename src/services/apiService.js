@@ -131,4 +131,22 @@ export const sendMessage = async (selectedUser, messageText, selectedFile) => {
     }
 };
 
+// ✅ Fetch every user, following the X-Cursor-Next pages of /users/ (most recent conversations first)
+export const fetchAllUsers = async (config = {}) => {
+    let users = [];
+    let cursor = null;
+    do {
+        const response = await apiClient.get('/users/', {
+            ...config,
+            params: { limit: 200, ...(cursor ? { cursor } : {}) },
+        });
+        if (!Array.isArray(response.data)) {
+            throw new Error("Unexpected server response.");
+        }
+        users = users.concat(response.data);
+        cursor = response.headers['x-cursor-next'];
+    } while (cursor);
+    return users;
+};
+
 export default apiClient;